@@ -2,6 +2,7 @@ import aws_cdk as cdk
 from aws_cdk import Aspects
 from cdk_nag import AwsSolutionsChecks
 
+from stacks.nag import ScopedNagChecks
 from stacks.vpc import NetworkingStack
 from stacks.sagemaker import SagemakerStudioStack
 
@@ -32,6 +33,22 @@ SagemakerStudioStack(
     ],
 )
 
-Aspects.of(app).add(AwsSolutionsChecks(verbose=True))
+# "full" checks every construct, "scoped" checks each distinct resource once
+# and caches results between synths, "off" skips cdk-nag
+nag_mode = app.node.try_get_context("nag_mode") or "full"
+scoped_nag_checks = None
+if nag_mode == "full":
+    Aspects.of(app).add(AwsSolutionsChecks(verbose=True))
+elif nag_mode == "scoped":
+    scoped_nag_checks = ScopedNagChecks(
+        verbose=True,
+        cache_file=app.node.try_get_context("nag_cache_file"),
+    )
+    scoped_nag_checks.check(app)
+elif nag_mode != "off":
+    raise ValueError(f"Invalid nag_mode: {nag_mode}")
 
 app.synth()
+
+if scoped_nag_checks:
+    scoped_nag_checks.save()
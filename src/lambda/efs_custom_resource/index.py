@@ -1,11 +1,33 @@
 import datetime
-from typing import List, Optional, TypedDict, Union
-import boto3
+import json
+from typing import Dict, List, Optional, TypedDict, Union
 import logging
+from botocore.exceptions import ClientError
+from studio_common.aio import call, gather, gather_map, run
+from studio_common.checkpoints import checkpoint_store, now
+from studio_common.plan import TeardownPlan
+from studio_common.rate_limiter import rate_limited_client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-efs_client = boto3.client("efs")
+efs_client = rate_limited_client("efs")
+
+# rough durations from the delete call until the resource is gone
+MOUNT_TARGET_DELETE_SECONDS = 90
+FILE_SYSTEM_DELETE_SECONDS = 30
+
+# provisioned throughput is sized from the number of users of the domain
+DEFAULT_PROVISIONED_MIBPS_PER_USER = 5.0
+MIN_PROVISIONED_MIBPS = 1.0
+
+# properties of the custom resource and the lifecycle policy they set
+LIFECYCLE_PROPERTIES = {
+    "transition_to_ia": "TransitionToIA",
+    "transition_to_primary_storage_class": "TransitionToPrimaryStorageClass",
+}
+# properties that change the file system, without any of them the custom
+# resource leaves it untouched
+TUNING_PROPERTIES = ["throughput_mode", *LIFECYCLE_PROPERTIES]
 
 
 class EfsConfig(TypedDict):
@@ -89,8 +111,8 @@ def describe_file_system(fs_id: str) -> Optional[EfsConfig]:
     try:
         # fails if fs is already deleted
         describe_response = efs_client.describe_file_systems(FileSystemId=fs_id)
-    except Exception as e:
-        logger.exception({"status": "failed to describe file systems", "exception": e})
+    except efs_client.exceptions.FileSystemNotFound:
+        logger.info({"status": "file system not found", "fs_id": fs_id})
         return None
 
     logger.info({"status": "described file systems", "response": describe_response})
@@ -100,26 +122,148 @@ def describe_file_system(fs_id: str) -> Optional[EfsConfig]:
     return None
 
 
-def on_create():
+def describe_settings(fs_id: str) -> Dict:
+    """Returns the performance, throughput and lifecycle settings of the
+    file system"""
+    esf_config: EfsConfig = describe_file_system(fs_id)
+    if not esf_config:
+        raise ValueError(f"file system {fs_id} not found")
+    settings = {
+        "PerformanceMode": esf_config.get("PerformanceMode"),
+        "ThroughputMode": esf_config.get("ThroughputMode"),
+        "ProvisionedThroughputInMibps": esf_config.get("ProvisionedThroughputInMibps"),
+    }
+    lifecycle_policies = efs_client.describe_lifecycle_configuration(
+        FileSystemId=fs_id
+    ).get("LifecyclePolicies", [])
+    for policy in lifecycle_policies:
+        settings.update(policy)
+    return settings
+
+
+def provisioned_mibps(user_count: int, mibps_per_user: float) -> float:
+    return max(MIN_PROVISIONED_MIBPS, user_count * mibps_per_user)
+
+
+def update_throughput(fs_id: str, properties: Dict, before: Dict) -> None:
+    """Raises TooManyRequests if the throughput was changed in the last 24
+    hours and the update decreases it or switches the throughput mode"""
+    throughput_mode = properties.get("throughput_mode")
+    if not throughput_mode:
+        return
+    update = {"ThroughputMode": throughput_mode}
+    if throughput_mode == "provisioned":
+        # custom resource properties arrive as strings
+        update["ProvisionedThroughputInMibps"] = provisioned_mibps(
+            int(properties.get("user_count", 0)),
+            float(
+                properties.get(
+                    "provisioned_mibps_per_user", DEFAULT_PROVISIONED_MIBPS_PER_USER
+                )
+            ),
+        )
+    if all(before.get(key) == value for key, value in update.items()):
+        return
+
+    efs_client.update_file_system(FileSystemId=fs_id, **update)
+    logger.info({"status": "updated throughput", "update": update})
+
+
+def update_lifecycle_policies(fs_id: str, properties: Dict, before: Dict) -> None:
+    policies = {
+        policy: properties[name]
+        for name, policy in LIFECYCLE_PROPERTIES.items()
+        if properties.get(name)
+    }
+    if all(before.get(policy) == value for policy, value in policies.items()):
+        return
+
+    # the call replaces all policies, so existing ones are passed again
+    lifecycle_policies = [
+        {policy: value}
+        for policy, value in before.items()
+        if policy.startswith("Transition") and policy not in policies
+    ] + [{policy: value} for policy, value in policies.items()]
+    efs_client.put_lifecycle_configuration(
+        FileSystemId=fs_id, LifecyclePolicies=lifecycle_policies
+    )
+    logger.info(
+        {"status": "updated lifecycle policies", "policies": lifecycle_policies}
+    )
+
+
+def is_tuned(properties: Dict) -> bool:
+    return any(properties.get(name) for name in TUNING_PROPERTIES)
+
+
+def tune_file_system(fs_id: str, properties: Dict) -> Dict:
+    """Applies the throughput mode and lifecycle policies of the properties
+    and reports the settings before and after
+
+    Returns:
+        result (json): status and the settings as custom resource attributes
+    """
+    if not is_tuned(properties):
+        logger.info({"status": "no file system settings to tune"})
+        return {"Status": "SUCCESS"}
+    if not fs_id:
+        raise ValueError("fs_id not provided")
+    before = describe_settings(fs_id)
+    try:
+        update_throughput(fs_id, properties, before)
+    except efs_client.exceptions.TooManyRequests as e:
+        logger.exception(
+            {"status": "throughput update not allowed yet", "exception": e}
+        )
+        return {
+            "Status": "FAILED",
+            "Reason": (
+                f"throughput of file system {fs_id} was changed less than 24 hours "
+                "ago, EFS only allows decreasing provisioned throughput or "
+                f"switching the throughput mode once every 24 hours: {e}"
+            ),
+        }
+    update_lifecycle_policies(fs_id, properties, before)
+    after = describe_settings(fs_id)
+    logger.info({"status": "tuned file system", "before": before, "after": after})
+    return {
+        "Status": "SUCCESS",
+        "Data": {
+            "SettingsBefore": json.dumps(before),
+            "SettingsAfter": json.dumps(after),
+        },
+    }
+
+
+def on_create(fs_id: str, properties: Dict):
     """Function to execute when creating a new custom resource"""
-    logger.info({"status": "create resource not needed for efs custom resource"})
-    return {"Status": "SUCCESS"}
+    return tune_file_system(fs_id, properties)
+
+
+def is_tuning_complete(fs_id: str, properties: Dict):
+    """Waits for a throughput update to be applied"""
+    if not is_tuned(properties):
+        return {"IsComplete": True}
+    esf_config: EfsConfig = describe_file_system(fs_id)
+    return {
+        "IsComplete": not esf_config or esf_config.get("LifeCycleState") != "updating"
+    }
 
 
-def is_create_complete():
+def is_create_complete(fs_id: str, properties: Dict):
     logger.info({"status": "calling is_create_complete"})
-    return {"IsComplete": True}
+    return is_tuning_complete(fs_id, properties)
 
 
-def on_update():
-    """Function to execute when updating the custom resource"""
-    logger.info({"status": "update resource not needed for efs custom resource"})
-    return {"Status": "SUCCESS"}
+def on_update(fs_id: str, properties: Dict):
+    """Function to execute when updating the custom resource, e.g. after the
+    number of users changed"""
+    return tune_file_system(fs_id, properties)
 
 
-def is_update_complete():
+def is_update_complete(fs_id: str, properties: Dict):
     logger.info({"status": "calling is_update_complete"})
-    return {"IsComplete": True}
+    return is_tuning_complete(fs_id, properties)
 
 
 def on_delete(fs_id: str, physical_resource_id: str):
@@ -149,65 +293,145 @@ def on_delete(fs_id: str, physical_resource_id: str):
         }
 
 
-def is_delete_complete(fs_id: str):
-    logger.info({"status": "calling is_delete_complete"})
+def list_mount_targets(fs_id: str) -> List[Dict]:
     try:
-        # check if file system is deleted
-        esf_config: EfsConfig = describe_file_system(fs_id)
-        if not esf_config or esf_config.get("LifeCycleState") == "deleted":
-            return {"IsComplete": True}
-        # if not, check if mount target are deleted
-        mount_targets = efs_client.describe_mount_targets(FileSystemId=fs_id).get(
+        return efs_client.describe_mount_targets(FileSystemId=fs_id).get(
             "MountTargets", []
         )
-        logger.info(
-            {"status": "described mount targets", "mount_targets": mount_targets}
-        )
+    except efs_client.exceptions.FileSystemNotFound:
+        return []
 
-        # if mount targets are deleted, trigger fs deletion
-        if not mount_targets:
-            delete_response = efs_client.delete_file_system(FileSystemId=fs_id)
-            logger.info({"status": "deleted file system", "response": delete_response})
 
-            return {"IsComplete": False}
+async def delete_mount_target(mount_target_id: str) -> bool:
+    delete_response = await call(
+        efs_client.delete_mount_target, MountTargetId=mount_target_id
+    )
+    logger.info({"status": "deleted mount target", "response": delete_response})
+    return True
 
-        # if not, trigger mount target deletion
-        for mount_target in mount_targets:
-            delete_response = efs_client.delete_mount_target(
-                MountTargetId=mount_target.get("MountTargetId")
-            )
-            logger.info({"status": "deleted mount target", "response": delete_response})
+
+async def delete_poll(fs_id: str, checkpoint: Dict) -> bool:
+    """Advances the teardown by one poll, all independent calls run
+    concurrently
+
+    Returns:
+        complete (bool): whether the file system is deleted
+    """
+    # a delete request was already accepted, only wait for it to finish
+    if checkpoint.get("fs_deleted_at"):
+        esf_config: EfsConfig = await call(describe_file_system, fs_id)
+        return not esf_config or esf_config.get("LifeCycleState") == "deleted"
+
+    # check if file system and mount targets are deleted
+    esf_config, mount_targets = await gather(
+        call(describe_file_system, fs_id), call(list_mount_targets, fs_id)
+    )
+    if not esf_config or esf_config.get("LifeCycleState") == "deleted":
+        return True
+    logger.info({"status": "described mount targets", "mount_targets": mount_targets})
+
+    # if mount targets are deleted, trigger fs deletion
+    if not mount_targets:
+        delete_response = await call(efs_client.delete_file_system, FileSystemId=fs_id)
+        logger.info({"status": "deleted file system", "response": delete_response})
+        checkpoint["fs_deleted_at"] = now()
+        return False
+
+    # if not, trigger deletion of the mount targets not deleted yet
+    deleted_mount_targets = checkpoint.setdefault("deleted_mount_targets", [])
+    to_delete = [
+        mount_target["MountTargetId"]
+        for mount_target in mount_targets
+        if mount_target["MountTargetId"] not in deleted_mount_targets
+        and mount_target.get("LifeCycleState") != "deleting"
+    ]
+    for mount_target_id, is_deleted in zip(
+        to_delete, await gather_map(delete_mount_target, to_delete)
+    ):
+        if is_deleted:
+            deleted_mount_targets.append(mount_target_id)
+    return False
+
+
+def is_delete_complete(fs_id: str, request_id: str):
+    logger.info({"status": "calling is_delete_complete"})
+    store = checkpoint_store()
+    try:
+        checkpoint = store.get(request_id)
+        if run(delete_poll(fs_id, checkpoint)):
+            store.delete(request_id)
+            return {"IsComplete": True}
+        store.put(request_id, checkpoint)
         return {"IsComplete": False}
 
-    except:
+    except (efs_client.exceptions.FileSystemNotFound, ClientError):
         logger.exception("failed to describe file system")
         return {"IsComplete": False}
 
 
+def plan_teardown(fs_id: str) -> Dict:
+    """Computes what is_delete_complete would delete, using read only calls
+
+    Returns:
+        plan (dict): deletion stages, api call count and estimated duration
+    """
+    plan = TeardownPlan(f"file system {fs_id}")
+    esf_config, mount_targets = run(
+        gather(call(describe_file_system, fs_id), call(list_mount_targets, fs_id))
+    )
+    if not esf_config or esf_config.get("LifeCycleState") == "deleted":
+        return plan.to_dict()
+    if esf_config.get("LifeCycleState") == "error":
+        plan.warn(f"file system {fs_id} is in state error")
+
+    for mount_target in mount_targets:
+        state = mount_target.get("LifeCycleState")
+        if state not in ["available", "deleting"]:
+            plan.warn(f"mount target {mount_target['MountTargetId']} is {state}")
+        plan.add(
+            f"mount_target:{mount_target['MountTargetId']}",
+            "delete_mount_target",
+            mount_target["MountTargetId"],
+            MOUNT_TARGET_DELETE_SECONDS,
+        )
+    plan.add(
+        f"file_system:{fs_id}",
+        "delete_file_system",
+        fs_id,
+        FILE_SYSTEM_DELETE_SECONDS,
+        depends_on=list(plan.steps),
+    )
+    return plan.to_dict()
+
+
 def on_event_handler(event, context):
     logger.info(event)
-    fs_id = event.get("ResourceProperties", {}).get("fs_id")
+    properties = event.get("ResourceProperties", {})
+    fs_id = properties.get("fs_id")
     physical_resource_id = event.get("PhysicalResourceId")
 
     request_type = event["RequestType"]
     if request_type == "Create":
-        return on_create()
+        return on_create(fs_id, properties)
     if request_type == "Update":
-        return on_update()
+        return on_update(fs_id, properties)
     if request_type == "Delete":
         return on_delete(fs_id, physical_resource_id)
+    if request_type == "Plan":
+        return plan_teardown(fs_id)
     raise Exception(f"Invalid request type: {request_type}")
 
 
 def is_complete_handler(event, context):
     logger.info(event)
-    fs_id = event.get("ResourceProperties", {}).get("fs_id")
+    properties = event.get("ResourceProperties", {})
+    fs_id = properties.get("fs_id")
     request_type = event["RequestType"]
 
     if request_type == "Create":
-        return is_create_complete()
+        return is_create_complete(fs_id, properties)
     if request_type == "Update":
-        return is_update_complete()
+        return is_update_complete(fs_id, properties)
     if request_type == "Delete":
-        return is_delete_complete(fs_id)
+        return is_delete_complete(fs_id, event["RequestId"])
     raise Exception(f"Invalid request type: {request_type}")
@@ -0,0 +1,155 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, TypedDict, Union
+import logging
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# the domain file system is mounted at its root, home directories are
+# named after the HomeEfsFileSystemUid of their user profile
+HOME_ROOT = os.environ.get("HOME_ROOT", "/mnt/home")
+
+# unlink and rmdir on EFS are bound by the NFS round trip, not by cpu
+MAX_WORKERS = 32
+BATCH_SIZE = 256
+
+# stop walking this long before the lambda times out
+SAFETY_MARGIN_SECONDS = 30
+
+
+class CleanupResult(TypedDict):
+    complete: bool
+    path: str
+    deleted_files: int
+    deleted_dirs: int
+
+
+def home_directory(root: str, uid: Union[int, str]) -> str:
+    uid = str(uid)
+    if not uid.isdigit():
+        raise ValueError(f"Invalid home directory uid: {uid}")
+    return os.path.join(root, uid)
+
+
+def scan_directory(path: str) -> Tuple[List[str], List[str]]:
+    """Returns the files (including symlinks) and subdirectories of path"""
+    files, directories = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                else:
+                    files.append(entry.path)
+    except FileNotFoundError:
+        pass
+    return files, directories
+
+
+def unlink_batch(paths: List[str]) -> int:
+    deleted = 0
+    for path in paths:
+        try:
+            os.unlink(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+    return deleted
+
+
+def rmdir_batch(paths: List[str]) -> int:
+    deleted = 0
+    for path in paths:
+        try:
+            os.rmdir(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+    return deleted
+
+
+def batches(paths: List[str]) -> List[List[str]]:
+    return [paths[i : i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+
+
+def delete_tree(path: str, deadline: float) -> Tuple[bool, int, int]:
+    """Deletes path level by level, each level's directories are scanned and
+    its files unlinked by parallel batches
+
+    Directories are removed bottom up once all levels are empty. The walk
+    stops at the deadline and is resumed by the next call, which walks only
+    what is left.
+
+    Returns:
+        result (tuple): whether the tree is gone, deleted files and directories
+    """
+    deleted_files = deleted_dirs = 0
+    levels = []
+    level = [path]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        while level:
+            if time.time() > deadline:
+                return False, deleted_files, deleted_dirs
+            levels.append(level)
+            next_level = []
+            for files, directories in executor.map(scan_directory, level):
+                deleted_files += sum(executor.map(unlink_batch, batches(files)))
+                next_level += directories
+            level = next_level
+
+        for level in reversed(levels):
+            if time.time() > deadline:
+                return False, deleted_files, deleted_dirs
+            deleted_dirs += sum(executor.map(rmdir_batch, batches(level)))
+    return not os.path.lexists(path), deleted_files, deleted_dirs
+
+
+def clean_up_home(root: str, uid: Union[int, str], deadline: float) -> CleanupResult:
+    """Deletes the home directory of a user profile
+
+    The home directory is not archived: a copy on the same file system
+    would not free any storage.
+
+    Args:
+        root (str): mount path of the domain file system
+        uid (str): HomeEfsFileSystemUid of the user profile
+        deadline (float): epoch time at which the delete stops and reports
+            that it is not complete
+
+    Returns:
+        result (dict): whether the cleanup is complete and what was deleted
+    """
+    home = home_directory(root, uid)
+    result: CleanupResult = {
+        "complete": True,
+        "path": home,
+        "deleted_files": 0,
+        "deleted_dirs": 0,
+    }
+    if not os.path.lexists(home):
+        logger.info({"status": "home directory does not exist", "path": home})
+        return result
+
+    complete, deleted_files, deleted_dirs = delete_tree(home, deadline)
+    result.update(
+        {
+            "complete": complete,
+            "deleted_files": deleted_files,
+            "deleted_dirs": deleted_dirs,
+        }
+    )
+
+    logger.info({"status": "cleaned up home directory", "result": result})
+    return result
+
+
+def handler(event: Dict, context) -> CleanupResult:
+    logger.info(event)
+    deadline = (
+        time.time()
+        + context.get_remaining_time_in_millis() / 1000
+        - SAFETY_MARGIN_SECONDS
+    )
+    return clean_up_home(HOME_ROOT, event["uid"], deadline)
@@ -0,0 +1,120 @@
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+import logging
+from studio_common import canary
+from studio_common.boot_report import percentile
+from studio_common.checkpoints import now
+from studio_common.rate_limiter import rate_limited_client
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logs_client = rate_limited_client("logs")
+
+# lifecycle config output of JupyterLab apps, one stream per space and app
+STUDIO_LOG_GROUP = "/aws/sagemaker/studio"
+# boots of the old version before the canary started count as its baseline
+BASELINE_SECONDS = 7 * 24 * 60 * 60
+
+# written by TIMING_LINE of LifecycleScript, the set -x trace of the echo
+# starts with "+" and is not matched. Versions rendered before cold was added
+# do not log it, their runs count as warm.
+TIMING_PATTERN = re.compile(
+    r"^LCC_TIMING lcc=(\S+) version=(\S+) seconds=(\d+)(?: cold=(\d))?"
+)
+
+
+def boot_timings(domain_id: str, script_name: str, since: int) -> Dict[str, List[int]]:
+    """Seconds of the successful warm runs of the script since the epoch time
+    since, by script version
+
+    Cold runs, in which a persistent step ran, e.g. the first boot of every
+    user after the package list changed, are left out so that both versions
+    are compared on warm runs.
+    """
+    timings: Dict[str, List[int]] = {}
+    paginator = logs_client.get_paginator("filter_log_events")
+    for page in paginator.paginate(
+        logGroupName=STUDIO_LOG_GROUP,
+        logStreamNamePrefix=f"{domain_id}/",
+        filterPattern=f'"LCC_TIMING lcc={script_name} "',
+        startTime=since * 1000,
+    ):
+        for event in page.get("events", []):
+            match = TIMING_PATTERN.match(event["message"].strip())
+            if match and match.group(1) == script_name and match.group(4) != "1":
+                timings.setdefault(match.group(2), []).append(int(match.group(3)))
+    return timings
+
+
+def summary(values: List[int]) -> Dict:
+    if not values:
+        return {"boots": 0}
+    return {
+        "boots": len(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+    }
+
+
+def evaluate(
+    state: canary.CanaryState, timings: Dict[str, List[int]]
+) -> Tuple[Optional[bool], Dict]:
+    """Compares the boot times of the new version with the old one
+
+    Both versions need min_boots boots, the old version's baseline includes
+    the boots before the canary started. Until max_hours have passed, the
+    canary waits for them.
+
+    Returns:
+        result (tuple): True to promote, False to roll back, None to wait
+            for more boots, and the report
+    """
+    config = state["config"]
+    old, new = summary(timings.get(state["old_version"], [])), summary(
+        timings.get(state["new_version"], [])
+    )
+    expired = now() - state["started_at"] > config["max_hours"] * 60 * 60
+    report = {"old": old, "new": new, "expired": expired}
+
+    if not expired and min(old["boots"], new["boots"]) < config["min_boots"]:
+        return None, report
+    if not new["boots"] or not old["boots"]:
+        # nothing to compare with, the canary users did not report a failure
+        report["warning"] = "promoted without boots to compare"
+        return True, report
+
+    limit = 1 + config["max_regression_percent"] / 100
+    regressions = [
+        key for key in ["p50", "p95"] if new[key] > math.ceil(old[key] * limit)
+    ]
+    report["regressions"] = regressions
+    return not regressions, report
+
+
+def handler(event, context):
+    logger.info(event)
+    domain_id = event["domain_id"]
+
+    for script_name in event["script_names"]:
+        state = canary.running(domain_id, script_name)
+        if not state:
+            continue
+
+        timings = boot_timings(
+            domain_id, script_name, state["started_at"] - BASELINE_SECONDS
+        )
+        promote, report = evaluate(state, timings)
+        state["report"] = report
+        logger.info(
+            {
+                "status": "evaluated lcc canary",
+                "script_name": script_name,
+                "report": report,
+            }
+        )
+
+        if promote is None:
+            canary.put(state)
+        else:
+            canary.finish(state, promote)
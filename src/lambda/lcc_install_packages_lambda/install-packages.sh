@@ -1,7 +0,0 @@
-#!/bin/bash
-
-set -eux
-
-# Packages to install
-
-pip install --upgrade darts pip-install-test
\ No newline at end of file
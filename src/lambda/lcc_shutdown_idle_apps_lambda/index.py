@@ -1,27 +1,39 @@
 import base64
-import boto3
+from typing import Dict, List, Optional
 import logging
+from studio_common import canary, lcc_settings
+from studio_common.rate_limiter import rate_limited_client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-sm_client = boto3.client("sagemaker")
+sm_client = rate_limited_client("sagemaker")
 
 
-def on_create(domain_id: str, app_shutdown_lifecycle_config: str):
+def on_create(
+    domain_id: str,
+    app_shutdown_lifecycle_config: str,
+    lcc_script: str,
+    script_name: Optional[str] = None,
+    user_resource_profiles: Optional[Dict[str, Dict]] = None,
+    instance_type: str = "ml.t3.medium",
+):
     """Function to execute when creating a new custom resource
 
     Args:
         domain_id (str): SageMaker Studio Domain ID
         app_shutdown_lifecycle_config (str): Name of the lcc
+        lcc_script (str): Content of the lcc script
+        script_name (str): name of the LifecycleScript
+        user_resource_profiles (dict): resource profile settings by user
+            profile name
+        instance_type (str): default instance type of the domain
 
     Returns:
         result (json): status and physical resource id
     """
     logger.info({"status": "create new resource"})
 
-    with open("shutdown-idle-apps.sh", "rb") as f:
-        script_content = f.read()
-    encoded_script_content = base64.b64encode(script_content).decode()
+    encoded_script_content = base64.b64encode(lcc_script.encode()).decode()
 
     try:
         response = sm_client.create_studio_lifecycle_config(
@@ -32,25 +44,16 @@ def on_create(domain_id: str, app_shutdown_lifecycle_config: str):
 
         lcc_arn = response["StudioLifecycleConfigArn"]
 
-        list_lcc_response = sm_client.list_studio_lifecycle_configs(
-            AppTypeEquals="JupyterLab"
-        ).get("StudioLifecycleConfigs", [])
-
-        logger.info(
-            {"status": "listed studio lifecycle configs", "response": list_lcc_response}
+        # the lccs the domain already runs are kept, attaching every lcc of
+        # the account would also attach the versions under test of a canary
+        settings = lcc_settings.replace_arn(
+            lcc_settings.domain_settings(domain_id), lcc_arn, lcc_arn
         )
 
-        if list_lcc_response:
-            existing_lcc_arns = [
-                elem["StudioLifecycleConfigArn"] for elem in list_lcc_response
-            ]
-            lcc_arns = existing_lcc_arns + [lcc_arn]
-        else:
-            lcc_arns = [lcc_arn]
         logger.info(
             {
                 "status": "prepared lifecycle config arns for domain update",
-                "lcc_arns": lcc_arns,
+                "lcc_arns": settings["LifecycleConfigArns"],
             }
         )
 
@@ -58,14 +61,18 @@ def on_create(domain_id: str, app_shutdown_lifecycle_config: str):
             DomainId=domain_id,
             DefaultUserSettings={
                 "JupyterLabAppSettings": {
+                    **settings,
                     "DefaultResourceSpec": {
                         "LifecycleConfigArn": lcc_arn,
-                        "InstanceType": "ml.t3.medium",
+                        "InstanceType": instance_type,
                     },
-                    "LifecycleConfigArns": lcc_arns,
                 }
             },
         )
+        if user_resource_profiles:
+            lcc_settings.apply_resource_profiles(
+                domain_id, lcc_arn, script_name, user_resource_profiles
+            )
         return {"Status": "SUCCESS", "PhysicalResourceId": lcc_arn}
 
     except Exception as e:
@@ -83,23 +90,166 @@ def is_create_complete():
 
 
 def on_update(
-    domain_id: str, app_shutdown_lifecycle_config: str, physical_resource_id: str
+    domain_id: str,
+    app_shutdown_lifecycle_config: str,
+    lcc_script: str,
+    physical_resource_id: str,
+    script_name: str,
+    old_version: Optional[str],
+    new_version: str,
+    canary_config: Optional[canary.CanaryConfig] = None,
+    user_resource_profiles: Optional[Dict[str, Dict]] = None,
+    removed_user_profile_names: Optional[List[str]] = None,
+    instance_type: str = "ml.t3.medium",
 ):
     """Function to execute when updating the custom resource
 
     Args:
         domain_id (str): SageMaker Studio Domain ID
         app_shutdown_lifecycle_config (str): Name of the lcc
+        lcc_script (str): Content of the lcc script
         physical_resource_id (str): physical resource id
+        script_name (str): name of the LifecycleScript
+        old_version (str): script version before the update
+        new_version (str): script version after the update
+        canary_config (dict): canary users and thresholds, rolls the new
+            version out to the canary users only if set
+        user_resource_profiles (dict): resource profile settings by user
+            profile name
+        removed_user_profile_names (list): users taken out of the resource
+            profiles by the update, they get the domain default back
+        instance_type (str): default instance type of the domain
 
     Returns:
         result (json): status and physical resource id
     """
     logger.info({"status": "updating resource"})
 
-    on_delete(app_shutdown_lifecycle_config, physical_resource_id)
+    if canary_config:
+        return on_canary_update(
+            domain_id,
+            app_shutdown_lifecycle_config,
+            lcc_script,
+            physical_resource_id,
+            script_name,
+            old_version,
+            new_version,
+            canary_config,
+            user_resource_profiles or {},
+            removed_user_profile_names or [],
+        )
+
+    # a canary still running is superseded by this version
+    running = canary.running(domain_id, script_name)
+    if running:
+        canary.finish(running, promote=False)
+    old_arn, _ = canary.current(
+        domain_id, script_name, physical_resource_id, old_version
+    )
+
+    if lifecycle_config_name(app_shutdown_lifecycle_config, old_arn) == (
+        app_shutdown_lifecycle_config
+    ):
+        on_delete(domain_id, app_shutdown_lifecycle_config, old_arn, script_name)
+
+    result = on_create(
+        domain_id,
+        app_shutdown_lifecycle_config,
+        lcc_script,
+        script_name,
+        user_resource_profiles,
+        instance_type,
+    )
+    lcc_arn = result.get("PhysicalResourceId")
+    if lcc_arn and old_arn != lcc_arn and old_arn.startswith("arn:"):
+        # the previous version was named after its version by a canary, it
+        # is replaced before it is deleted
+        lcc_settings.replace_everywhere(domain_id, old_arn, lcc_arn)
+        lcc_settings.delete_lcc(old_arn)
+    if lcc_arn:
+        # the users run the version of the template again
+        canary.clear(domain_id, script_name)
+        lcc_settings.reset_resource_profiles(
+            domain_id, removed_user_profile_names or []
+        )
+    return result
+
+
+def on_canary_update(
+    domain_id: str,
+    app_shutdown_lifecycle_config: str,
+    lcc_script: str,
+    physical_resource_id: str,
+    script_name: str,
+    old_version: Optional[str],
+    new_version: str,
+    canary_config: canary.CanaryConfig,
+    user_resource_profiles: Dict[str, Dict],
+    removed_user_profile_names: List[str],
+):
+    """Creates the new version next to the old one and attaches it to the
+    canary users, the lcc canary evaluator promotes or rolls it back"""
+
+    try:
+        running = canary.running(domain_id, script_name)
+        if old_version == new_version:
+            logger.info({"status": "script version unchanged", "version": new_version})
+            # only the resource profiles changed, they get the version the
+            # users outside of a running canary run
+            live_arn = running["old_arn"] if running else None
+            if not live_arn:
+                live_arn, _ = canary.current(
+                    domain_id, script_name, physical_resource_id, old_version
+                )
+            lcc_settings.apply_resource_profiles(
+                domain_id,
+                live_arn,
+                script_name,
+                user_resource_profiles,
+                skip=list(running["previous_settings"]) if running else [],
+            )
+            lcc_settings.reset_resource_profiles(
+                domain_id,
+                removed_user_profile_names,
+                skip=list(running["previous_settings"]) if running else [],
+            )
+            return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
+
+        if running:
+            # the version under test is superseded, the new canary is
+            # compared with the version the other users run
+            canary.finish(running, promote=False)
+        old_arn, old_version = canary.current(
+            domain_id, script_name, physical_resource_id, old_version
+        )
+        lcc_settings.apply_resource_profiles(
+            domain_id, old_arn, script_name, user_resource_profiles
+        )
+        lcc_settings.reset_resource_profiles(domain_id, removed_user_profile_names)
+
+        lcc_arn = lcc_settings.create_lcc(
+            canary.versioned_name(app_shutdown_lifecycle_config, new_version),
+            lcc_script,
+        )
+        canary.start(
+            domain_id,
+            script_name,
+            old_arn,
+            lcc_arn,
+            old_version,
+            new_version,
+            canary_config,
+        )
+        return {"Status": "SUCCESS", "PhysicalResourceId": lcc_arn}
 
-    return on_create(domain_id, app_shutdown_lifecycle_config)
+    except Exception as e:
+        logger.exception(
+            {
+                "status": "failed to start lifecycle config canary",
+                "exception": e,
+            }
+        )
+        return {"Status": "FAILED", "PhysicalResourceId": physical_resource_id}
 
 
 def is_update_complete():
@@ -107,25 +257,61 @@ def is_update_complete():
     return {"IsComplete": True}
 
 
-def on_delete(app_shutdown_lifecycle_config: str, physical_resource_id: str):
+def lifecycle_config_name(
+    app_shutdown_lifecycle_config: str, physical_resource_id: str
+):
+    """The lcc is named after its version while or after a canary"""
+    if physical_resource_id and physical_resource_id.startswith("arn:"):
+        return lcc_settings.lcc_name(physical_resource_id)
+    return app_shutdown_lifecycle_config
+
+
+def on_delete(
+    domain_id: str,
+    app_shutdown_lifecycle_config: str,
+    physical_resource_id: str,
+    script_name: str,
+):
     """Function to execute when deleting the custom resource
 
     Args:
         domain_id (str): SageMaker Studio Domain ID
         app_shutdown_lifecycle_config (str): Name of the lcc
+        physical_resource_id (str): physical resource id
+        script_name (str): name of the LifecycleScript
 
     Returns:
         result (json): status and physical resource id
     """
-
     logger.info({"status": "deleting resource"})
 
+    running = canary.running(domain_id, script_name)
+    if canary.protects(running, physical_resource_id):
+        logger.info({"status": "lcc kept for the running canary"})
+        return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
+    if running and running["new_arn"] == physical_resource_id:
+        canary.finish(running, promote=False)
+
+    # a rolled back version is already deleted, the version it replaced is
+    # deleted in its place unless a later canary still compares with it
+    lcc_arn, _ = canary.current(domain_id, script_name, physical_resource_id, None)
+    if lcc_arn != physical_resource_id:
+        if canary.protects(canary.running(domain_id, script_name), lcc_arn):
+            return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
+        lcc_settings.delete_lcc(lcc_arn)
+
     try:
         sm_client.delete_studio_lifecycle_config(
-            StudioLifecycleConfigName=app_shutdown_lifecycle_config
+            StudioLifecycleConfigName=lifecycle_config_name(
+                app_shutdown_lifecycle_config, physical_resource_id
+            )
         )
         return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
 
+    except sm_client.exceptions.ResourceNotFound:
+        logger.info({"status": "studio lifecycle config already deleted"})
+        return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
+
     except Exception as e:
         logger.exception(
             {"status": "failed to delete lifecycle config", "exception": e}
@@ -133,9 +319,20 @@ def on_delete(app_shutdown_lifecycle_config: str, physical_resource_id: str):
         return {"Status": "FAILED", "PhysicalResourceId": physical_resource_id}
 
 
-def is_delete_complete(app_shutdown_lifecycle_config: str):
+def is_delete_complete(
+    domain_id: str,
+    app_shutdown_lifecycle_config: str,
+    physical_resource_id: str,
+    script_name: str,
+):
     logger.info({"status": "calling is_delete_complete"})
 
+    if canary.protects(canary.running(domain_id, script_name), physical_resource_id):
+        return {"IsComplete": True}
+
+    app_shutdown_lifecycle_config = lifecycle_config_name(
+        app_shutdown_lifecycle_config, physical_resource_id
+    )
     try:
         # check if studio lifecycle is deleted
         lifecycle_config = sm_client.describe_studio_lifecycle_config(
@@ -149,36 +346,81 @@ def is_delete_complete(app_shutdown_lifecycle_config: str):
             return {"IsComplete": False}
 
     except Exception as e:
-
         logger.exception(
             {"status": "studio lifecylce config does not exist anymore", "exception": e}
         )
         return {"IsComplete": True}
 
 
+def canary_config(properties: Dict) -> Optional[canary.CanaryConfig]:
+    """CloudFormation passes numbers as strings"""
+    config = properties.get("canary")
+    if not config:
+        return None
+    return {
+        "user_profile_names": config["user_profile_names"],
+        "min_boots": int(config["min_boots"]),
+        "max_regression_percent": int(config["max_regression_percent"]),
+        "max_hours": int(config["max_hours"]),
+    }
+
+
 def on_event_handler(event, context):
     logger.info(event)
     domain_id = event["ResourceProperties"]["domain_id"]
     app_shutdown_lifecycle_config = event["ResourceProperties"][
         "app_shutdown_lifecycle_config"
     ]
+    lcc_script = event["ResourceProperties"]["lcc_script"]
+    script_name = event["ResourceProperties"].get("script_name")
+    user_resource_profiles = event["ResourceProperties"].get(
+        "user_resource_profiles", {}
+    )
+    instance_type = event["ResourceProperties"].get("instance_type", "ml.t3.medium")
     physical_resource_id = event.get("PhysicalResourceId")
+    # OldResourceProperties is only set for updates
+    removed_user_profile_names = [
+        user_profile_name
+        for user_profile_name in event.get("OldResourceProperties", {}).get(
+            "user_resource_profiles", {}
+        )
+        if user_profile_name not in user_resource_profiles
+    ]
 
     request_type = event["RequestType"]
     if request_type == "Create":
-        return on_create(domain_id, app_shutdown_lifecycle_config)
+        return on_create(
+            domain_id,
+            app_shutdown_lifecycle_config,
+            lcc_script,
+            script_name,
+            user_resource_profiles,
+            instance_type,
+        )
     if request_type == "Update":
-        return on_update(domain_id, app_shutdown_lifecycle_config, physical_resource_id)
+        return on_update(
+            domain_id,
+            app_shutdown_lifecycle_config,
+            lcc_script,
+            physical_resource_id,
+            script_name,
+            event["OldResourceProperties"].get("script_version"),
+            event["ResourceProperties"]["script_version"],
+            canary_config(event["ResourceProperties"]),
+            user_resource_profiles,
+            removed_user_profile_names,
+            instance_type,
+        )
     if request_type == "Delete":
-        return on_delete(app_shutdown_lifecycle_config, physical_resource_id)
+        return on_delete(
+            domain_id, app_shutdown_lifecycle_config, physical_resource_id, script_name
+        )
     raise Exception(f"Invalid request type: {request_type}")
 
 
 def is_complete_handler(event, context):
     logger.info(event)
-    app_shutdown_lifecycle_config = event.get("ResourceProperties", {}).get(
-        "app_shutdown_lifecycle_config"
-    )
+    properties = event.get("ResourceProperties", {})
     request_type = event["RequestType"]
 
     if request_type == "Create":
@@ -186,5 +428,10 @@ def is_complete_handler(event, context):
     if request_type == "Update":
         return is_update_complete()
     if request_type == "Delete":
-        return is_delete_complete(app_shutdown_lifecycle_config)
+        return is_delete_complete(
+            properties.get("domain_id"),
+            properties.get("app_shutdown_lifecycle_config"),
+            event.get("PhysicalResourceId"),
+            properties.get("script_name"),
+        )
     raise Exception(f"Invalid request type: {request_type}")
@@ -1,12 +1,32 @@
 import datetime
-from typing import List, TypedDict, Union, Dict
-import boto3
+import json
+from typing import List, Optional, Tuple, TypedDict, Union, Dict
 import logging
-from typing import Dict
+from botocore.config import Config
+from studio_common.aio import call, gather, gather_map, run
+from studio_common.checkpoints import checkpoint_store, now
+from studio_common.plan import POLL_INTERVAL_SECONDS, TeardownPlan
+from studio_common.records import AppRecord, SpaceRecord, Status, group_by
+from studio_common.rate_limiter import rate_limited_client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-sm_client = boto3.client("sagemaker")
+sm_client = rate_limited_client("sagemaker")
+# the home cleanup lambda runs for up to 5 minutes
+lambda_client = rate_limited_client("lambda", config=Config(read_timeout=330))
+
+ACTIVE_APP_STATUSES = [Status.IN_SERVICE, Status.DELETING, Status.PENDING]
+ACTIVE_SPACE_STATUSES = [
+    Status.IN_SERVICE,
+    Status.DELETING,
+    Status.PENDING,
+    Status.UPDATING,
+]
+
+# rough durations from the delete call until the resource is gone
+APP_DELETE_SECONDS = 90
+SPACE_DELETE_SECONDS = 30
+USER_PROFILE_DELETE_SECONDS = 5
 
 
 class SpaceConfig(TypedDict):
@@ -49,32 +69,24 @@ class ListSpacesResponse(TypedDict):
     NextToken: str
 
 
-def delete_studio_apps(list_response: ListAppsResponse) -> List[AppConfig]:
-    failed_apps = []
-    for app_config in list_response.get("Apps", []):
-        try:
-            if app_config.get("Status") != "InService":
-                continue
-            logger.info({"status": "deleting studio app"})
-
-            delete_app_kwargs = {
-                "DomainId": app_config["DomainId"],
-                "AppName": app_config["AppName"],
-                "AppType": app_config["AppType"],
-            }
+def delete_studio_app(app: AppRecord) -> bool:
+    try:
+        logger.info({"status": "deleting studio app", "app": app.key})
+        delete_response = sm_client.delete_app(**app.reference())
+        logger.info({"status": "deleted studio app", "response": delete_response})
+        return True
+    except Exception as e:
+        logger.exception({"status": "failed to delete studio app", "exception": e})
+        return False
 
-            if app_config.get("UserProfileName"):
-                delete_app_kwargs.update(
-                    {"UserProfileName": app_config["UserProfileName"]}
-                )
-            else:
-                delete_app_kwargs.update({"SpaceName": app_config["SpaceName"]})
 
-            delete_response = sm_client.delete_app(**delete_app_kwargs)
-            logger.info({"status": "deleted studio app", "response": delete_response})
-        except Exception as e:
-            logger.exception({"status": "failed to delete studio app", "exception": e})
-            failed_apps.append(app_config)
+def delete_studio_apps(apps: List[AppRecord]) -> List[AppRecord]:
+    failed_apps = []
+    for app in apps:
+        if app.status != Status.IN_SERVICE:
+            continue
+        if not delete_studio_app(app):
+            failed_apps.append(app)
     return failed_apps
 
 
@@ -116,14 +128,50 @@ def is_update_complete():
     return {"IsComplete": True}
 
 
+def home_cleanup_entry(
+    domain_id: str, user_profile_name: str, function_name: str
+) -> Dict:
+    """Looks up the profile's home directory, which is named after its uid
+    on the domain file system"""
+    try:
+        uid = sm_client.describe_user_profile(
+            DomainId=domain_id, UserProfileName=user_profile_name
+        ).get("HomeEfsFileSystemUid")
+    except sm_client.exceptions.ResourceNotFound:
+        uid = None
+    if uid is None:
+        logger.warning(
+            {
+                "status": "skipping home directory cleanup, no home directory uid",
+                "user_profile_name": user_profile_name,
+            }
+        )
+    return {
+        "function_name": function_name,
+        "uid": uid,
+        "user_profile_name": user_profile_name,
+        "complete": uid is None,
+    }
+
+
 def on_delete(
-    domain_id: str, user_profile_name: str, space_name: str, physical_resource_id: str
+    domain_id: str,
+    user_profile_name: str,
+    space_name: str,
+    physical_resource_id: str,
+    request_id: str,
+    home_cleanup_function: Optional[str] = None,
 ):
     """Function to execute when deleting the custom resource
 
     Args:
-         (str): Name of the lcc
+        domain_id (str): SageMaker Studio Domain ID
+        user_profile_name (str): Name of the user profile
+        space_name (str): Name of the user's space
         physical_resource_id (str): physical resource id
+        request_id (str): CloudFormation request id, key of the checkpoint
+        home_cleanup_function (str): name of the lambda deleting the home
+            directory once the profile is deleted
 
     Returns:
         result (json): status and physical resource id
@@ -131,21 +179,19 @@ def on_delete(
 
     logger.info({"status": "deleting studio apps and spaces"})
 
-    # list all sagemaker apps and delete
+    # list the apps of the profile and of its space, every page, and delete
     try:
-        list_apps_response: ListAppsResponse = sm_client.list_apps(
-            DomainIdEquals=domain_id
+        profile_apps, space_apps = run(
+            gather(
+                call(list_apps, domain_id, UserProfileNameEquals=user_profile_name),
+                call(list_apps, domain_id, SpaceNameEquals=space_name),
+            )
         )
-        list_apps_response["Apps"] = [
-            app
-            for app in list_apps_response["Apps"]
-            if app.get("UserProfileName") == user_profile_name
-            or app.get("SpaceName") == space_name
-        ]
+        apps = list({app.key: app for app in profile_apps + space_apps}.values())
         logger.info(
             {
                 "status": "listed studio apps",
-                "response": list_apps_response,
+                "apps": apps,
             }
         )
 
@@ -156,70 +202,307 @@ def on_delete(
             "PhysicalResourceId": physical_resource_id,
             "Reason": "failed to list studio apps",
         }
-    failed_apps = delete_studio_apps(list_apps_response)
+    failed_apps = delete_studio_apps(apps)
+
+    # record the deleted apps so that is_complete polls do not delete them again
+    failed_app_keys = [app.key for app in failed_apps]
+    checkpoint = {
+        "apps": {
+            app.key: {
+                "app": app.reference(),
+                "deleted_at": now(),
+                "gone": False,
+            }
+            for app in apps
+            if app.status == Status.IN_SERVICE and app.key not in failed_app_keys
+        }
+    }
+    # the uid is only known while the profile exists
+    if home_cleanup_function:
+        checkpoint["home"] = home_cleanup_entry(
+            domain_id, user_profile_name, home_cleanup_function
+        )
+    checkpoint_store().put(request_id, checkpoint)
 
     if failed_apps:
 
         return {
             "Status": "FAILED",
             "PhysicalResourceId": physical_resource_id,
-            "Reason": f"failed to delete studio resources:\n apps: {[(failed_app.get('UserProfileName'), failed_app.get('SpaceName'), failed_app.get('AppName')) for failed_app in failed_apps]}",
+            "Reason": f"failed to delete studio resources:\n apps: {[failed_app.key for failed_app in failed_apps]}",
         }
     return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
 
 
-def is_delete_complete(user_profile_name: str, space_name: str, domain_id: str):
-    logger.info({"status": "calling is_delete_complete"})
+def describe_app_status(app_reference: Dict) -> Optional[Status]:
+    try:
+        return Status.of(sm_client.describe_app(**app_reference).get("Status"))
+    except sm_client.exceptions.ResourceNotFound:
+        return Status.DELETED
+
 
+def is_app_gone(app_reference: Dict) -> bool:
+    return describe_app_status(app_reference) in [Status.DELETED, Status.FAILED]
+
+
+def describe_space_status(domain_id: str, space_name: str) -> Optional[Status]:
     try:
-        list_apps_profile_response: ListAppsResponse = sm_client.list_apps(
-            DomainIdEquals=domain_id, UserProfileNameEquals=user_profile_name
+        return Status.of(
+            sm_client.describe_space(DomainId=domain_id, SpaceName=space_name).get(
+                "Status"
+            )
         )
-        list_apps_space_response: ListAppsResponse = sm_client.list_apps(
-            DomainIdEquals=domain_id, SpaceNameEquals=space_name
+    except sm_client.exceptions.ResourceNotFound:
+        return Status.DELETED
+
+
+def delete_space(domain_id: str, space_name: str) -> Optional[Status]:
+    """Deletes the space and returns its resulting status"""
+    try:
+        sm_client.delete_space(DomainId=domain_id, SpaceName=space_name)
+        logger.info({"status": "deleting studio space", "space_name": space_name})
+        return Status.DELETING
+    except sm_client.exceptions.ResourceNotFound:
+        return Status.DELETED
+    except sm_client.exceptions.ResourceInUse:
+        # already being deleted, e.g. by CloudFormation deleting the CfnSpace
+        return describe_space_status(domain_id, space_name)
+
+
+def delete_user_profile(domain_id: str, user_profile_name: str) -> None:
+    try:
+        sm_client.delete_user_profile(
+            DomainId=domain_id, UserProfileName=user_profile_name
         )
+        logger.info({"status": "deleted user profile"})
+    except sm_client.exceptions.ResourceNotFound:
+        logger.info({"status": "user profile already deleted"})
 
-        list_apps_response = {
-            "Apps": list_apps_profile_response.get("Apps", [])
-            + list_apps_space_response.get("Apps", [])
-        }
 
-        list_spaces_response: ListSpacesResponse = sm_client.list_spaces(
-            DomainIdEquals=domain_id, SpaceNameContains=space_name
+def clean_up_home(home: Dict) -> bool:
+    """Invokes the home cleanup lambda, which deletes until shortly before
+    its timeout
+
+    Returns:
+        complete (bool): whether the home directory is deleted
+    """
+    response = lambda_client.invoke(
+        FunctionName=home["function_name"],
+        Payload=json.dumps({"uid": home["uid"]}),
+    )
+    result = json.loads(response["Payload"].read())
+    if response.get("FunctionError"):
+        raise Exception(f"home directory cleanup failed: {result}")
+    logger.info({"status": "cleaned up home directory", "result": result})
+    return result["complete"]
+
+
+def list_profile_spaces(
+    domain_id: str, user_profile_name: str, space_name: str
+) -> List[SpaceRecord]:
+    """Lists the user's own space and the spaces owned by the profile
+
+    list_spaces only filters on a substring of the name, so the results are
+    matched exactly to leave other users' spaces (e.g. user1 and user10) alone.
+    """
+    spaces = []
+    paginator = sm_client.get_paginator("list_spaces")
+    for page in paginator.paginate(DomainIdEquals=domain_id):
+        for response in page.get("Spaces", []):
+            space = SpaceRecord.from_response(response)
+            if space.space_name == space_name or space.owner == user_profile_name:
+                spaces.append(space)
+    return spaces
+
+
+def list_apps(domain_id: str, **filters) -> List[AppRecord]:
+    apps = []
+    paginator = sm_client.get_paginator("list_apps")
+    for page in paginator.paginate(DomainIdEquals=domain_id, **filters):
+        apps += [AppRecord.from_response(app) for app in page.get("Apps", [])]
+    return apps
+
+
+async def list_profile_resources(
+    domain_id: str, user_profile_name: str, space_name: str
+) -> Tuple[List[SpaceRecord], List[AppRecord]]:
+    """Lists the profile's spaces and the apps of the profile and of each
+    space, list_apps filters are exact matches already"""
+    profile_apps, spaces = await gather(
+        call(list_apps, domain_id, UserProfileNameEquals=user_profile_name),
+        call(list_profile_spaces, domain_id, user_profile_name, space_name),
+    )
+    space_apps = await gather(
+        *(
+            call(list_apps, domain_id, SpaceNameEquals=space.space_name)
+            for space in spaces
+        )
+    )
+    return spaces, profile_apps + [app for apps in space_apps for app in apps]
+
+
+async def inventory(
+    user_profile_name: str, space_name: str, domain_id: str, checkpoint: Dict
+) -> None:
+    """Adds the profile's running apps and spaces to the checkpoint, keeping
+    the deletion times of apps already deleted by on_delete"""
+    spaces, all_apps = await list_profile_resources(
+        domain_id, user_profile_name, space_name
+    )
+    spaces = [space for space in spaces if space.status in ACTIVE_SPACE_STATUSES]
+    logger.info({"status": "listed studio spaces", "spaces": spaces})
+    logger.info({"status": "listed studio apps", "apps": all_apps})
+
+    apps = checkpoint.setdefault("apps", {})
+    for app in all_apps:
+        if app.status not in ACTIVE_APP_STATUSES:
+            continue
+        apps.setdefault(
+            app.key,
+            {
+                "app": app.reference(),
+                # apps already deleting do not need another delete call
+                "deleted_at": now() if app.status == Status.DELETING else None,
+                "gone": False,
+            },
         )
-        logger.info({"status": "listed studio apps", "response": list_apps_response})
+
+    checkpoint["spaces"] = {
+        space.space_name: {
+            "status": space.status.value,
+            "deleted_at": now() if space.status == Status.DELETING else None,
+            "gone": False,
+        }
+        for space in spaces
+    }
+    checkpoint["inventoried_at"] = now()
+
+
+async def update_app(entry: Dict) -> None:
+    """Deletes the app or checks whether it is gone"""
+    if entry["deleted_at"] is None:
+        if await call(delete_studio_app, AppRecord.from_response(entry["app"])):
+            entry["deleted_at"] = now()
+            return
+        # a failed delete call, e.g. of an app another request already
+        # deletes, must not keep the app from being polled
+        status = await call(describe_app_status, entry["app"])
+        if status in [Status.DELETING, Status.DELETED, Status.FAILED]:
+            entry["deleted_at"] = now()
+            entry["gone"] = status != Status.DELETING
+        return
+    entry["gone"] = await call(is_app_gone, entry["app"])
+
+
+async def update_space(domain_id: str, space_name: str, entry: Dict) -> None:
+    if entry["deleted_at"] is None:
+        status = await call(delete_space, domain_id, space_name)
+        entry["deleted_at"] = now()
+    else:
+        status = await call(describe_space_status, domain_id, space_name)
+    entry["status"] = status and status.value
+    entry["gone"] = status in [Status.DELETED, Status.FAILED]
+
+
+async def delete_poll(
+    user_profile_name: str,
+    space_name: str,
+    domain_id: str,
+    checkpoint: Dict,
+) -> bool:
+    """Advances the teardown by one poll, all independent calls run
+    concurrently
+
+    Returns:
+        complete (bool): whether the user profile is deleted and its home
+            directory cleaned up
+    """
+    # the first poll takes a full inventory, later polls only check the
+    # apps and spaces that are still outstanding
+    if "inventoried_at" not in checkpoint:
+        await inventory(user_profile_name, space_name, domain_id, checkpoint)
+
+    await gather_map(
+        update_app,
+        [entry for entry in checkpoint["apps"].values() if not entry["gone"]],
+    )
+
+    # a space can be deleted as soon as its own apps are gone
+    busy_spaces = {
+        entry["app"].get("SpaceName")
+        for entry in checkpoint["apps"].values()
+        if not entry["gone"]
+    }
+    await gather_map(
+        lambda space: update_space(domain_id, *space),
+        [
+            (name, entry)
+            for name, entry in checkpoint["spaces"].items()
+            if not entry["gone"] and name not in busy_spaces
+        ],
+    )
+
+    outstanding = {
+        "apps": [key for key, entry in checkpoint["apps"].items() if not entry["gone"]],
+        "spaces": {
+            name: entry["status"]
+            for name, entry in checkpoint["spaces"].items()
+            if not entry["gone"]
+        },
+    }
+    if outstanding["apps"] or outstanding["spaces"]:
         logger.info(
-            {"status": "listed studio spaces", "response": list_spaces_response}
+            {
+                "status": "waiting for deletion of studio apps and spaces",
+                "outstanding": outstanding,
+            }
         )
+        return False
+    logger.info({"status": "deleted all studio apps and spaces"})
+
+    if "profile_deleted_at" not in checkpoint:
+        logger.info({"status": "deleting user profile"})
+        await call(delete_user_profile, domain_id, user_profile_name)
+        checkpoint["profile_deleted_at"] = now()
+
+    # the home directory is cleaned up once the user cannot write to it
+    home = checkpoint.get("home")
+    if home and not home["complete"]:
+        home["complete"] = await call(clean_up_home, home)
+        if not home["complete"]:
+            logger.info({"status": "waiting for cleanup of home directory"})
+            return False
+    return True
+
+
+def is_delete_complete(
+    user_profile_name: str,
+    space_name: str,
+    domain_id: str,
+    request_id: str,
+):
+    logger.info({"status": "calling is_delete_complete"})
+    store = checkpoint_store()
 
-        running_apps = [
-            app
-            for app in list_apps_response.get("Apps")
-            if app["Status"] in ["InService", "Deleting"]
-        ]
-
-        running_spaces = [
-            space
-            for space in list_spaces_response.get("Spaces")
-            if space["Status"] in ["InService", "Deleting"]
-        ]
-
-        if running_apps:
-            logger.info({"status": "deleting studio apps"})
-            delete_studio_apps(list_apps_response)
-            return {"IsComplete": False}
-        else:
-            logger.info({"status": "deleted all studio apps"})
-            if running_spaces:
-                logger.info({"status": "waiting for deletion of studio spaces"})
-                return {"IsComplete": False}
-            else:
-                logger.info({"status": "deleted all studio spaces"})
-                logger.info({"status": "deleting user profile"})
-                sm_client.delete_user_profile(
-                    DomainId=domain_id, UserProfileName=user_profile_name
+    complete = False
+    try:
+        checkpoint = store.get(request_id)
+        try:
+            complete = run(
+                delete_poll(
+                    user_profile_name,
+                    space_name,
+                    domain_id,
+                    checkpoint,
                 )
-                logger.info({"status": "deleted user profile"})
+            )
+        finally:
+            # keeps the progress of the calls that succeeded when another one
+            # failed the poll
+            if complete:
+                store.delete(request_id)
+            else:
+                store.put(request_id, checkpoint)
 
     except Exception as e:
         logger.exception(
@@ -229,7 +512,65 @@ def is_delete_complete(user_profile_name: str, space_name: str, domain_id: str):
             }
         )
         return {"IsComplete": False}
-    return {"IsComplete": True}
+    return {"IsComplete": complete}
+
+
+def plan_teardown(user_profile_name: str, space_name: str, domain_id: str) -> Dict:
+    """Computes what is_delete_complete would delete, using read only calls
+
+    Returns:
+        plan (dict): deletion stages, api call count and estimated duration
+    """
+    plan = TeardownPlan(f"user profile {user_profile_name}")
+    spaces, apps = run(list_profile_resources(domain_id, user_profile_name, space_name))
+
+    app_steps: Dict[str, List[str]] = {}
+    for owner, owner_apps in group_by(apps, lambda app: app.owner).items():
+        for app in owner_apps:
+            if app.status in [Status.DELETED, Status.FAILED]:
+                continue
+            if app.status == Status.PENDING:
+                plan.warn(f"app {app.key} is still starting")
+            step_id = plan.add(
+                f"app:{app.key}",
+                "delete_app",
+                app.key,
+                APP_DELETE_SECONDS,
+                # apps already deleting only need to be described
+                api_calls=(
+                    APP_DELETE_SECONDS // POLL_INTERVAL_SECONDS
+                    if app.status == Status.DELETING
+                    else None
+                ),
+            )
+            app_steps.setdefault(owner, []).append(step_id)
+
+    for space in spaces:
+        if space.status == Status.DELETED:
+            continue
+        if space.status in [
+            Status.FAILED,
+            Status.UPDATE_FAILED,
+            Status.DELETE_FAILED,
+        ]:
+            plan.warn(f"space {space.space_name} is in status {space.status.value}")
+        plan.add(
+            f"space:{space.space_name}",
+            "delete_space",
+            space.space_name,
+            SPACE_DELETE_SECONDS,
+            depends_on=app_steps.get(space.space_name, []),
+        )
+
+    plan.add(
+        f"user_profile:{user_profile_name}",
+        "delete_user_profile",
+        user_profile_name,
+        USER_PROFILE_DELETE_SECONDS,
+        depends_on=list(plan.steps),
+        api_calls=1,
+    )
+    return plan.to_dict()
 
 
 def on_event_handler(event, context):
@@ -245,7 +586,16 @@ def on_event_handler(event, context):
     if request_type == "Update":
         return on_update()
     if request_type == "Delete":
-        return on_delete(domain_id, user_profile_name, space_name, physical_resource_id)
+        return on_delete(
+            domain_id,
+            user_profile_name,
+            space_name,
+            physical_resource_id,
+            event["RequestId"],
+            event.get("ResourceProperties", {}).get("home_cleanup_function"),
+        )
+    if request_type == "Plan":
+        return plan_teardown(user_profile_name, space_name, domain_id)
     raise Exception(f"Invalid request type: {request_type}")
 
 
@@ -261,5 +611,10 @@ def is_complete_handler(event, context):
     if request_type == "Update":
         return is_update_complete()
     if request_type == "Delete":
-        return is_delete_complete(user_profile_name, space_name, domain_id)
+        return is_delete_complete(
+            user_profile_name,
+            space_name,
+            domain_id,
+            event["RequestId"],
+        )
     raise Exception(f"Invalid request type: {request_type}")
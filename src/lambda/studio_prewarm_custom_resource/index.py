@@ -0,0 +1,286 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, TypedDict, Union
+import logging
+from studio_common.rate_limiter import rate_limited_client
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+sm_client = rate_limited_client("sagemaker")
+
+APP_TYPE = "JupyterLab"
+APP_NAME = "default"
+
+# stop the scheduled warm-up this long before the lambda times out
+SCHEDULE_SAFETY_MARGIN_MS = 30_000
+SCHEDULE_POLL_INTERVAL_SECONDS = 15
+
+
+class AppConfig(TypedDict):
+    DomainId: str
+    SpaceName: str
+    AppType: str
+    AppName: str
+    Status: Union["Deleted", "Deleting", "Failed", "InService", "Pending"]
+    CreationTime: datetime.datetime
+
+
+class WarmUpStatus(TypedDict):
+    started: List[str]
+    pending: List[str]
+    queued: List[str]
+    in_service: List[str]
+    failed: List[str]
+
+
+def list_space_apps(domain_id: str, space_names: List[str]) -> Dict[str, AppConfig]:
+    """Returns the most recent JupyterLab app of every listed space
+
+    Args:
+        domain_id (str): SageMaker Studio Domain ID
+        space_names (list): names of the spaces to warm up
+
+    Returns:
+        apps (dict): space name to its latest app
+    """
+    latest_apps: Dict[str, AppConfig] = {}
+    paginator = sm_client.get_paginator("list_apps")
+    for page in paginator.paginate(DomainIdEquals=domain_id):
+        for app in page.get("Apps", []):
+            space_name = app.get("SpaceName")
+            if app.get("AppType") != APP_TYPE or space_name not in space_names:
+                continue
+            latest = latest_apps.get(space_name)
+            if not latest or app["CreationTime"] > latest["CreationTime"]:
+                latest_apps[space_name] = app
+    return latest_apps
+
+
+def create_space_app(domain_id: str, space_name: str, instance_type: str) -> bool:
+    try:
+        sm_client.create_app(
+            DomainId=domain_id,
+            SpaceName=space_name,
+            AppType=APP_TYPE,
+            AppName=APP_NAME,
+            ResourceSpec={"InstanceType": instance_type},
+        )
+        logger.info({"status": "started studio app", "space_name": space_name})
+        return True
+    except sm_client.exceptions.ResourceInUse:
+        logger.info({"status": "studio app already running", "space_name": space_name})
+        return True
+    except Exception as e:
+        logger.exception(
+            {
+                "status": "failed to start studio app",
+                "space_name": space_name,
+                "exception": e,
+            }
+        )
+        return False
+
+
+def warm_up_spaces(
+    domain_id: str,
+    space_names: List[str],
+    instance_types: Dict[str, str],
+    max_concurrency: int,
+) -> WarmUpStatus:
+    """Starts JupyterLab apps for spaces without one, keeping at most
+    max_concurrency apps pending at any time
+
+    Apps become InService once their lifecycle configs have finished, from
+    then on the idle shutdown installed by the lifecycle config takes over.
+
+    Args:
+        domain_id (str): SageMaker Studio Domain ID
+        space_names (list): names of the spaces to warm up
+        instance_types (dict): space name to the instance type of its app
+        max_concurrency (int): maximum number of apps starting at once
+
+    Returns:
+        status (dict): space names per app status
+    """
+    latest_apps = list_space_apps(domain_id, space_names)
+    status: WarmUpStatus = {
+        "started": [],
+        "pending": [],
+        "queued": [],
+        "in_service": [],
+        "failed": [],
+    }
+
+    cold_spaces = []
+    for space_name in space_names:
+        app_status = latest_apps.get(space_name, {}).get("Status")
+        if app_status == "InService":
+            status["in_service"].append(space_name)
+        elif app_status == "Pending":
+            status["pending"].append(space_name)
+        elif app_status == "Failed":
+            status["failed"].append(space_name)
+        else:
+            # no app yet, or the last one is deleted or being deleted
+            cold_spaces.append(space_name)
+
+    free_slots = max(max_concurrency - len(status["pending"]), 0)
+    to_start = cold_spaces[:free_slots]
+    if to_start:
+        with ThreadPoolExecutor(max_workers=len(to_start)) as executor:
+            results = executor.map(
+                lambda space_name: create_space_app(
+                    domain_id, space_name, instance_types[space_name]
+                ),
+                to_start,
+            )
+            for space_name, started in zip(to_start, results):
+                status["started" if started else "failed"].append(space_name)
+    status["queued"].extend(cold_spaces[free_slots:])
+
+    logger.info({"status": "warming up studio apps", "warm_up_status": status})
+    return status
+
+
+def is_warm(status: WarmUpStatus) -> bool:
+    return not status["started"] and not status["pending"] and not status["queued"]
+
+
+def on_create():
+    """Function to execute when creating a new custom resource
+
+    Apps are started by the is_complete handler, so that each poll can start
+    the next batch once the previous one is InService.
+
+    Returns:
+        result (json): status
+    """
+
+    logger.info({"status": "warming up studio apps in is_complete_handler"})
+
+    return {"Status": "SUCCESS"}
+
+
+def is_create_complete(
+    domain_id: str,
+    space_names: List[str],
+    instance_types: Dict[str, str],
+    max_concurrency: int,
+):
+    logger.info({"status": "calling is_create_complete"})
+    try:
+        status = warm_up_spaces(domain_id, space_names, instance_types, max_concurrency)
+    except Exception as e:
+        logger.exception({"status": "failed to warm up studio apps", "exception": e})
+        return {"IsComplete": False}
+    return {"IsComplete": is_warm(status)}
+
+
+def on_update(physical_resource_id: str):
+    """Function to execute when updating the custom resource
+
+    Args:
+        physical_resource_id (str): physical resource id
+
+    Returns:
+        result (json): status and physical resource id
+    """
+
+    logger.info({"status": "warming up studio apps in is_complete_handler"})
+
+    return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
+
+
+def is_update_complete(
+    domain_id: str,
+    space_names: List[str],
+    instance_types: Dict[str, str],
+    max_concurrency: int,
+):
+    logger.info({"status": "calling is_update_complete"})
+    return is_create_complete(domain_id, space_names, instance_types, max_concurrency)
+
+
+def on_delete(physical_resource_id: str):
+    """Function to execute when deleting the custom resource
+
+    Warm apps are deleted together with their user profile by the
+    studio app custom resource.
+
+    Args:
+        physical_resource_id (str): physical resource id
+
+    Returns:
+        result (json): status and physical resource id
+    """
+
+    logger.info({"status": "delete resource not needed for prewarm custom resource"})
+
+    return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
+
+
+def is_delete_complete():
+    logger.info({"status": "calling is_delete_complete"})
+    return {"IsComplete": True}
+
+
+def get_properties(properties: Dict):
+    space_names = properties.get("space_names", [])
+    # spaces missing from instance_types, e.g. in the properties of an older
+    # deployment, use the common instance type
+    instance_types = properties.get("instance_types", {})
+    return (
+        properties.get("domain_id"),
+        space_names,
+        {
+            space_name: instance_types.get(space_name, properties.get("instance_type"))
+            for space_name in space_names
+        },
+        int(properties.get("max_concurrency", 1)),
+    )
+
+
+def on_event_handler(event, context):
+    logger.info(event)
+    physical_resource_id = event.get("PhysicalResourceId")
+
+    request_type = event["RequestType"]
+    if request_type == "Create":
+        return on_create()
+    if request_type == "Update":
+        return on_update(physical_resource_id)
+    if request_type == "Delete":
+        return on_delete(physical_resource_id)
+    raise Exception(f"Invalid request type: {request_type}")
+
+
+def is_complete_handler(event, context):
+    logger.info(event)
+    properties = get_properties(event.get("ResourceProperties", {}))
+    request_type = event["RequestType"]
+
+    if request_type == "Create":
+        return is_create_complete(*properties)
+    if request_type == "Update":
+        return is_update_complete(*properties)
+    if request_type == "Delete":
+        return is_delete_complete()
+    raise Exception(f"Invalid request type: {request_type}")
+
+
+def schedule_handler(event, context):
+    """Warms up the spaces on a schedule, polling until all apps are
+    InService or the lambda is about to time out"""
+    logger.info(event)
+    properties = get_properties(event)
+
+    status = warm_up_spaces(*properties)
+    while (
+        not is_warm(status)
+        and context.get_remaining_time_in_millis()
+        > SCHEDULE_SAFETY_MARGIN_MS + SCHEDULE_POLL_INTERVAL_SECONDS * 1000
+    ):
+        time.sleep(SCHEDULE_POLL_INTERVAL_SECONDS)
+        status = warm_up_spaces(*properties)
+    return status
@@ -0,0 +1,285 @@
+import json
+import math
+from typing import Dict, List, Optional
+import logging
+from botocore.exceptions import ClientError
+from studio_common.aio import call, gather, run
+from studio_common.plan import POLL_INTERVAL_SECONDS, TeardownPlan
+from studio_common.rate_limiter import rate_limited_client
+from studio_common.records import AppRecord, Status
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+sm_client = rate_limited_client("sagemaker")
+efs_client = rate_limited_client("efs")
+ec2_client = rate_limited_client("ec2")
+sfn_client = rate_limited_client("stepfunctions")
+
+# security groups SageMaker creates for the home file system of a domain
+NFS_SECURITY_GROUP_NAMES = [
+    "security-group-for-inbound-nfs-{domain_id}",
+    "security-group-for-outbound-nfs-{domain_id}",
+]
+GONE_APP_STATUSES = [Status.DELETED, Status.FAILED]
+
+# rough durations from the delete call until the resource is gone, by the
+# resource types of the state machine's Map states
+DELETE_SECONDS = {
+    "apps": 90,
+    "spaces": 30,
+    "user_profiles": 5,
+    "mount_targets": 90,
+    "security_groups": 1,
+}
+
+
+class DependencyViolation(Exception):
+    """A security group is still in use, e.g. by the network interface of a
+    mount target being deleted, the state machine retries the deletion"""
+
+
+def execution_name(request_id: str) -> str:
+    return f"teardown-{request_id}"
+
+
+def execution_arn(state_machine_arn: str, request_id: str) -> str:
+    return (
+        state_machine_arn.replace(":stateMachine:", ":execution:")
+        + f":{execution_name(request_id)}"
+    )
+
+
+def on_delete(
+    domain_id: str, state_machine_arn: str, physical_resource_id: str, request_id: str
+):
+    """Starts the teardown execution, named after the request so that a
+    retried event does not start a second one"""
+    try:
+        response = sfn_client.start_execution(
+            stateMachineArn=state_machine_arn,
+            name=execution_name(request_id),
+            input=json.dumps({"domain_id": domain_id}),
+        )
+    except sfn_client.exceptions.ExecutionAlreadyExists:
+        logger.info({"status": "teardown execution already started"})
+    else:
+        logger.info(
+            {
+                "status": "started teardown execution",
+                "execution_arn": response["executionArn"],
+            }
+        )
+    return {"Status": "SUCCESS", "PhysicalResourceId": physical_resource_id}
+
+
+def is_delete_complete(state_machine_arn: str, request_id: str):
+    """Waits for the teardown execution, a failed one fails the deletion of
+    the custom resource, deleting the stack again starts a new execution"""
+    response = sfn_client.describe_execution(
+        executionArn=execution_arn(state_machine_arn, request_id)
+    )
+    status = response["status"]
+    logger.info({"status": "teardown execution", "execution_status": status})
+    if status == "RUNNING":
+        return {"IsComplete": False}
+    if status == "SUCCEEDED":
+        return {"IsComplete": True}
+    raise Exception(
+        f"teardown execution {status}: {response.get('error')} {response.get('cause')}"
+    )
+
+
+def describe_domain(domain_id: str) -> Optional[Dict]:
+    try:
+        return sm_client.describe_domain(DomainId=domain_id)
+    except sm_client.exceptions.ResourceNotFound:
+        return None
+
+
+def list_domain(operation: str, key: str, domain_id: str) -> List[Dict]:
+    items = []
+    paginator = sm_client.get_paginator(operation)
+    for page in paginator.paginate(DomainIdEquals=domain_id):
+        items += page.get(key, [])
+    return items
+
+
+def list_mount_targets(fs_id: Optional[str]) -> List[Dict]:
+    if not fs_id:
+        return []
+    try:
+        return efs_client.describe_mount_targets(FileSystemId=fs_id).get(
+            "MountTargets", []
+        )
+    except efs_client.exceptions.FileSystemNotFound:
+        return []
+
+
+def list_nfs_security_groups(domain_id: str, vpc_id: Optional[str]) -> List[Dict]:
+    if not vpc_id:
+        return []
+    return ec2_client.describe_security_groups(
+        Filters=[
+            {"Name": "vpc-id", "Values": [vpc_id]},
+            {
+                "Name": "group-name",
+                "Values": [
+                    name.format(domain_id=domain_id)
+                    for name in NFS_SECURITY_GROUP_NAMES
+                ],
+            },
+        ]
+    ).get("SecurityGroups", [])
+
+
+async def list_resources(domain_id: str) -> Dict[str, List[Dict]]:
+    domain = await call(describe_domain, domain_id)
+    if not domain:
+        return {resource_type: [] for resource_type in DELETE_SECONDS}
+    apps, spaces, user_profiles, mount_targets, security_groups = await gather(
+        call(list_domain, "list_apps", "Apps", domain_id),
+        call(list_domain, "list_spaces", "Spaces", domain_id),
+        call(list_domain, "list_user_profiles", "UserProfiles", domain_id),
+        call(list_mount_targets, domain.get("HomeEfsFileSystemId")),
+        call(list_nfs_security_groups, domain_id, domain.get("VpcId")),
+    )
+    records = [AppRecord.from_response(app) for app in apps]
+    return {
+        "apps": [
+            record.reference()
+            for record in records
+            if record.status not in GONE_APP_STATUSES
+        ],
+        "spaces": [
+            {"DomainId": domain_id, "SpaceName": space["SpaceName"]}
+            for space in spaces
+            if space.get("Status") != Status.DELETED
+        ],
+        "user_profiles": [
+            {"DomainId": domain_id, "UserProfileName": profile["UserProfileName"]}
+            for profile in user_profiles
+            if profile.get("Status") != Status.DELETED
+        ],
+        "mount_targets": [
+            {"MountTargetId": mount_target["MountTargetId"]}
+            for mount_target in mount_targets
+            if mount_target.get("LifeCycleState") != "deleted"
+        ],
+        "security_groups": [
+            {"GroupId": sg["GroupId"], "GroupName": sg["GroupName"]}
+            for sg in security_groups
+        ],
+    }
+
+
+def inventory_handler(event, context):
+    """First state of the teardown, lists the domain's resources as the
+    items of the Map states"""
+    logger.info(event)
+    resources = run(list_resources(event["domain_id"]))
+    logger.info(
+        {
+            "status": "listed domain resources",
+            **{resource_type: len(items) for resource_type, items in resources.items()},
+        }
+    )
+    return resources
+
+
+def security_group_handler(event, context):
+    """Revokes the rules of a security group and deletes it, the NFS groups
+    of a domain reference each other"""
+    logger.info(event)
+    group_id = event["GroupId"]
+    try:
+        security_groups = ec2_client.describe_security_groups(
+            Filters=[{"Name": "group-id", "Values": [group_id]}]
+        ).get("SecurityGroups", [])
+        for sg in security_groups:
+            if sg["IpPermissions"]:
+                ec2_client.revoke_security_group_ingress(
+                    GroupId=group_id, IpPermissions=sg["IpPermissions"]
+                )
+            if sg["IpPermissionsEgress"]:
+                ec2_client.revoke_security_group_egress(
+                    GroupId=group_id, IpPermissions=sg["IpPermissionsEgress"]
+                )
+        if security_groups:
+            ec2_client.delete_security_group(GroupId=group_id)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "DependencyViolation":
+            raise DependencyViolation(str(e))
+        if e.response["Error"]["Code"] != "InvalidGroup.NotFound":
+            raise
+    logger.info({"status": "deleted security group", "group_id": group_id})
+    return {"GroupId": group_id}
+
+
+def plan_teardown(domain_id: str, max_concurrency: Dict, wait_seconds: int) -> Dict:
+    """Computes what the teardown execution would delete, using read only
+    calls
+
+    Each Map state deletes its resources in batches of its MaxConcurrency,
+    so one step per resource type stands for all batches of the type. A
+    resource type missing from max_concurrency is counted one at a time.
+
+    Returns:
+        plan (dict): deletion stages, api call count and estimated duration
+    """
+    plan = TeardownPlan(f"domain {domain_id}")
+    resources = run(list_resources(domain_id))
+    previous: List[str] = []
+    for resource_type, items in resources.items():
+        if not items:
+            continue
+        batches = math.ceil(len(items) / int(max_concurrency.get(resource_type, 1)))
+        seconds = DELETE_SECONDS[resource_type]
+        previous = [
+            plan.add(
+                f"delete:{resource_type}",
+                f"delete_{resource_type}",
+                f"{len(items)} {resource_type}",
+                seconds * batches,
+                depends_on=previous,
+                api_calls=len(items) * (1 + math.ceil(seconds / int(wait_seconds))),
+            )
+        ]
+    return plan.to_dict()
+
+
+def on_event_handler(event, context):
+    logger.info(event)
+    properties = event.get("ResourceProperties", {})
+    domain_id = properties.get("domain_id")
+    state_machine_arn = properties.get("state_machine_arn")
+    physical_resource_id = event.get("PhysicalResourceId")
+
+    request_type = event["RequestType"]
+    if request_type in ["Create", "Update"]:
+        logger.info({"status": f"{request_type} not needed for teardown orchestrator"})
+        return {"Status": "SUCCESS"}
+    if request_type == "Delete":
+        return on_delete(
+            domain_id, state_machine_arn, physical_resource_id, event["RequestId"]
+        )
+    if request_type == "Plan":
+        return plan_teardown(
+            domain_id,
+            properties.get("max_concurrency", {}),
+            properties.get("wait_seconds", POLL_INTERVAL_SECONDS),
+        )
+    raise Exception(f"Invalid request type: {request_type}")
+
+
+def is_complete_handler(event, context):
+    logger.info(event)
+    properties = event.get("ResourceProperties", {})
+    request_type = event["RequestType"]
+
+    if request_type in ["Create", "Update"]:
+        return {"IsComplete": True}
+    if request_type == "Delete":
+        return is_delete_complete(
+            properties.get("state_machine_arn"), event["RequestId"]
+        )
+    raise Exception(f"Invalid request type: {request_type}")
@@ -1,10 +1,17 @@
-from typing import List, TypedDict
-import boto3
+from typing import Dict, List, TypedDict
 import logging
+from studio_common.aio import call, gather, gather_map, run
+from studio_common.checkpoints import checkpoint_store
+from studio_common.plan import TeardownPlan
+from studio_common.rate_limiter import rate_limited_client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-ec2_client = boto3.client("ec2")
+ec2_client = rate_limited_client("ec2")
+
+# rough durations of the security group calls
+REVOKE_SECONDS = 1
+SECURITY_GROUP_DELETE_SECONDS = 1
 
 
 class SecurityGroupDescription(TypedDict):
@@ -112,12 +119,191 @@ def on_delete(vpc_id: str, physical_resource_id: str):
     return {"Status": "SUCCESS"}
 
 
-def is_delete_complete(vpc_id: str):
+async def revoke_rules(sg: SecurityGroupDescription) -> bool:
+    revokes = []
+    if sg["IpPermissions"]:
+        revokes.append(
+            call(
+                ec2_client.revoke_security_group_ingress,
+                GroupId=sg["GroupId"],
+                IpPermissions=[*sg["IpPermissions"]],
+            )
+        )
+    if sg["IpPermissionsEgress"]:
+        revokes.append(
+            call(
+                ec2_client.revoke_security_group_egress,
+                GroupId=sg["GroupId"],
+                IpPermissions=[*sg["IpPermissionsEgress"]],
+            )
+        )
+    await gather(*revokes)
+    return True
+
+
+async def delete_security_group(sg: SecurityGroupDescription) -> bool:
+    try:
+        await call(ec2_client.delete_security_group, GroupId=sg["GroupId"])
+    except Exception as e:
+        logger.exception(
+            {"status": f"failed to delete sg: {sg['GroupId']}", "exception": e}
+        )
+        return False
+    logger.info({"status": f"deleted sg: {sg['GroupId']}"})
+    return True
+
+
+async def delete_poll(vpc_id: str, checkpoint: Dict) -> bool:
+    """Advances the teardown by one poll, all independent calls run
+    concurrently
+
+    Returns:
+        complete (bool): whether all security groups are deleted
+    """
+    outstanding = checkpoint.get("outstanding_group_ids")
+    if outstanding is None:
+        filters = [{"Name": "vpc-id", "Values": [vpc_id]}]
+    elif outstanding:
+        # a filter does not fail on groups deleted in the meantime
+        filters = [{"Name": "group-id", "Values": outstanding}]
+    else:
+        return True
+    describe_sgs_response: DescribeResponse = await call(
+        ec2_client.describe_security_groups, Filters=filters
+    )
+
+    revoked = checkpoint.setdefault("revoked_group_ids", [])
+    deleted = checkpoint.setdefault("deleted_group_ids", [])
+    security_groups = [
+        sg
+        for sg in describe_sgs_response.get("SecurityGroups", [])
+        if sg["GroupId"] not in deleted
+    ]
+
+    to_revoke = [sg for sg in security_groups if sg["GroupId"] not in revoked]
+    for sg, is_revoked in zip(to_revoke, await gather_map(revoke_rules, to_revoke)):
+        if is_revoked:
+            revoked.append(sg["GroupId"])
+
+    # delete nfs inbound sgs at the end, the default sg is deleted with the vpc
+    to_delete = [sg for sg in security_groups if sg["GroupName"] != "default"]
+    outstanding = []
+    for batch in [
+        [sg for sg in to_delete if not is_nfs_inbound(sg)],
+        [sg for sg in to_delete if is_nfs_inbound(sg)],
+    ]:
+        for sg, is_deleted in zip(
+            batch, await gather_map(delete_security_group, batch)
+        ):
+            (deleted if is_deleted else outstanding).append(sg["GroupId"])
+
+    checkpoint["outstanding_group_ids"] = outstanding
+    return not outstanding
+
+
+def is_delete_complete(vpc_id: str, request_id: str):
+    """Deletes the remaining security groups of the vpc
+
+    The first poll lists the security groups of the vpc, later polls only
+    describe the groups that were not deleted yet and skip the rules that
+    were already revoked.
+    """
     logger.info({"status": "calling is_delete_complete"})
-    resp = on_delete(vpc_id, "")
-    if resp.get("Status") == "SUCCESS":
-        return {"IsComplete": True}
-    return {"IsComplete": False}
+    store = checkpoint_store()
+
+    try:
+        checkpoint = store.get(request_id)
+        if not run(delete_poll(vpc_id, checkpoint)):
+            store.put(request_id, checkpoint)
+            return {"IsComplete": False}
+
+    except Exception as e:
+        logger.exception({"status": "failed to delete sgs", "exception": e})
+        return {"IsComplete": False}
+    store.delete(request_id)
+    return {"IsComplete": True}
+
+
+def is_nfs_inbound(sg: SecurityGroupDescription) -> bool:
+    return "nfs" in sg["GroupName"] and "inbound" in sg["GroupName"]
+
+
+def list_vpc(vpc_id: str, operation: str, key: str) -> List[Dict]:
+    items = []
+    paginator = ec2_client.get_paginator(operation)
+    for page in paginator.paginate(Filters=[{"Name": "vpc-id", "Values": [vpc_id]}]):
+        items += page.get(key, [])
+    return items
+
+
+def plan_teardown(vpc_id: str) -> Dict:
+    """Computes what is_delete_complete would delete, using read only calls
+
+    Network interfaces still attached to a security group, e.g. left behind
+    by SageMaker apps, are reported as warnings since they make the
+    deletion of the group fail until they are released.
+
+    Returns:
+        plan (dict): deletion stages, api call count and estimated duration
+    """
+    plan = TeardownPlan(f"vpc {vpc_id}")
+    security_groups, network_interfaces = run(
+        gather(
+            call(list_vpc, vpc_id, "describe_security_groups", "SecurityGroups"),
+            call(list_vpc, vpc_id, "describe_network_interfaces", "NetworkInterfaces"),
+        )
+    )
+
+    revoke_steps = []
+    for sg in security_groups:
+        api_calls = bool(sg["IpPermissions"]) + bool(sg["IpPermissionsEgress"])
+        if api_calls:
+            revoke_steps.append(
+                plan.add(
+                    f"revoke:{sg['GroupId']}",
+                    "revoke_security_group_rules",
+                    sg["GroupId"],
+                    REVOKE_SECONDS,
+                    api_calls=api_calls,
+                )
+            )
+
+    # groups can reference each other, so all rules are revoked first and
+    # the nfs inbound groups are deleted last
+    to_delete = [sg for sg in security_groups if sg["GroupName"] != "default"]
+    delete_steps = [
+        plan.add(
+            f"delete:{sg['GroupId']}",
+            "delete_security_group",
+            sg["GroupId"],
+            SECURITY_GROUP_DELETE_SECONDS,
+            depends_on=revoke_steps,
+            api_calls=1,
+        )
+        for sg in to_delete
+        if not is_nfs_inbound(sg)
+    ]
+    for sg in to_delete:
+        if is_nfs_inbound(sg):
+            plan.add(
+                f"delete:{sg['GroupId']}",
+                "delete_security_group",
+                sg["GroupId"],
+                SECURITY_GROUP_DELETE_SECONDS,
+                depends_on=revoke_steps + delete_steps,
+                api_calls=1,
+            )
+
+    group_ids = {sg["GroupId"] for sg in to_delete}
+    for eni in network_interfaces:
+        for group in eni.get("Groups", []):
+            if group["GroupId"] in group_ids:
+                plan.warn(
+                    f"network interface {eni['NetworkInterfaceId']} "
+                    f"({eni.get('Description', '')}, {eni.get('Status')}) "
+                    f"still uses security group {group['GroupId']}"
+                )
+    return plan.to_dict()
 
 
 def on_event_handler(event, context):
@@ -132,6 +318,8 @@ def on_event_handler(event, context):
         return on_update()
     if request_type == "Delete":
         return on_delete(vpc_id, physical_resource_id)
+    if request_type == "Plan":
+        return plan_teardown(vpc_id)
     raise Exception(f"Invalid request type: {request_type}")
 
 
@@ -145,5 +333,5 @@ def is_complete_handler(event, context):
     if request_type == "Update":
         return is_update_complete()
     if request_type == "Delete":
-        return is_delete_complete(vpc_id)
+        return is_delete_complete(vpc_id, event["RequestId"])
     raise Exception(f"Invalid request type: {request_type}")
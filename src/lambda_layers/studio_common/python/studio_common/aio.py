@@ -0,0 +1,67 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, TypeVar
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+T = TypeVar("T")
+
+# matches the connection pool of the clients created by rate_limited_client
+MAX_CONCURRENCY = 10
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY)
+
+
+async def call(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking boto3 call without blocking the event loop
+
+    boto3 clients are thread safe, so all calls of an invocation share the
+    client's connection pool. The executor is kept between warm invocations.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def gather_map(
+    fn: Callable[[Any], Awaitable[T]], items: Iterable[Any]
+) -> List[Optional[T]]:
+    """Awaits fn for every item concurrently, results in the order of items
+
+    A failing item is logged and its result is None, the other items still
+    run to the end, so fn should return a truthy result where the caller
+    needs to tell the failed items apart.
+    """
+    items = list(items)
+    results = await asyncio.gather(
+        *(fn(item) for item in items), return_exceptions=True
+    )
+    for item, result in zip(items, results):
+        if isinstance(result, BaseException):
+            logger.error(
+                {"status": "failed item", "item": item, "exception": result},
+                exc_info=result,
+            )
+    return [None if isinstance(result, BaseException) else result for result in results]
+
+
+async def gather(*awaitables: Awaitable[Any]) -> List[Any]:
+    """Awaits all awaitables concurrently, results in their order
+
+    Every awaitable runs to the end before the first failure is raised, the
+    others are logged.
+    """
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors[1:]:
+        logger.error({"status": "failed call", "exception": error}, exc_info=error)
+    if errors:
+        raise errors[0]
+    return list(results)
+
+
+def run(coroutine: Awaitable[T]) -> T:
+    """Sync façade for the lambda handlers"""
+    return asyncio.run(coroutine)
@@ -0,0 +1,155 @@
+"""Boot latency report of the studio lifecycle configs
+
+Every step of a lifecycle config script logs its start and end as a JSON line
+to the app container log, see STEP_RUNNER in
+stacks/sagemaker/lifecycle/LifecycleScript.py. The report groups the end
+lines by lcc, version and phase and prints the p50, p95 and p99 durations of
+the phases that ran, from exported log files:
+
+    PYTHONPATH=src/lambda_layers/studio_common/python \
+        python -m studio_common.boot_report --file app_container.log
+
+or from the studio log group of a domain:
+
+    PYTHONPATH=src/lambda_layers/studio_common/python \
+        python -m studio_common.boot_report --domain-id <DomainId> --hours 48
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+import boto3
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# lifecycle config and app container output of JupyterLab apps, one stream per
+# space and app
+STUDIO_LOG_GROUP = "/aws/sagemaker/studio"
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+# whole script, logged after the last step of a successful run
+TOTAL_PHASE = "total"
+
+
+def percentile(values: List[int], q: float) -> int:
+    """Nearest rank percentile"""
+    ranked = sorted(values)
+    return ranked[max(math.ceil(q * len(ranked)) - 1, 0)]
+
+
+def parse_events(lines: Iterable[str]) -> Iterator[Dict]:
+    """End events of the phases in log lines, lines may have a prefix like
+    the timestamp of an export, other lines are skipped"""
+    for line in lines:
+        start = line.find('{"lcc_phase"')
+        if start < 0:
+            continue
+        try:
+            event = json.loads(line[start:])
+        except ValueError:
+            continue
+        if event.get("event") == "end":
+            yield event
+
+
+def read_files(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        with open(path) as f:
+            yield from f
+
+
+def read_log_group(domain_id: str, since: int) -> Iterator[str]:
+    """Messages of the phase end events of a domain's apps since the epoch
+    time since"""
+    paginator = boto3.client("logs").get_paginator("filter_log_events")
+    for page in paginator.paginate(
+        logGroupName=STUDIO_LOG_GROUP,
+        logStreamNamePrefix=f"{domain_id}/",
+        filterPattern='{ $.lcc_phase = "*" && $.event = "end" }',
+        startTime=since * 1000,
+    ):
+        for event in page.get("events", []):
+            yield event["message"]
+
+
+def report(events: Iterable[Dict]) -> List[Dict]:
+    """Phase durations by lcc, version and phase
+
+    Returns:
+        rows (list): one dict per phase with the number of runs, skipped and
+            failed runs and the duration percentiles in ms of the runs that
+            succeeded
+    """
+    groups: Dict[Tuple[str, str, str], Dict] = {}
+    last_end: Dict[Tuple[str, str], int] = {}
+    for event in events:
+        key = (event["lcc"], event["version"], event["lcc_phase"])
+        group = groups.setdefault(key, {"succeeded": [], "skipped": 0, "failed": 0})
+        if event["status"] == "succeeded":
+            group["succeeded"].append(event["duration_ms"])
+        elif event["status"] in ("skipped", "failed"):
+            group[event["status"]] += 1
+        version_key = (event["lcc"], event["version"])
+        last_end[version_key] = max(last_end.get(version_key, 0), event["end_ms"])
+
+    rows = []
+    for (lcc, version, phase), group in groups.items():
+        durations = group["succeeded"]
+        row = {
+            "lcc": lcc,
+            "version": version,
+            "phase": phase,
+            "runs": len(durations) + group["skipped"] + group["failed"],
+            "skipped": group["skipped"],
+            "failed": group["failed"],
+        }
+        if durations:
+            row.update(
+                {name: percentile(durations, q) for name, q in PERCENTILES.items()}
+            )
+        rows.append(row)
+    # newest version of each lcc first, the whole script after its phases
+    rows.sort(
+        key=lambda row: (
+            row["lcc"],
+            -last_end[(row["lcc"], row["version"])],
+            row["phase"] == TOTAL_PHASE,
+            row["phase"],
+        )
+    )
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--file", action="append", help="app container log file, can be repeated"
+    )
+    source.add_argument("--domain-id", help="read the studio log group of the domain")
+    parser.add_argument(
+        "--hours", type=int, default=24, help="hours of the log group to read"
+    )
+    parser.add_argument("--lcc", help="only report this lcc")
+    args = parser.parse_args(argv)
+
+    if args.file:
+        lines = read_files(args.file)
+    else:
+        lines = read_log_group(args.domain_id, int(time.time()) - args.hours * 3600)
+    rows = report(
+        event
+        for event in parse_events(lines)
+        if not args.lcc or event["lcc"] == args.lcc
+    )
+    logger.info({"status": "reported lcc boot phases", "rows": len(rows)})
+    for row in rows:
+        sys.stdout.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
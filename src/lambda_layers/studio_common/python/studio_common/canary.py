@@ -0,0 +1,187 @@
+"""Staged rollout of a new version of a studio lifecycle config
+
+Instead of replacing the lcc of every user through the domain default, a
+canary creates the new version next to the old one and attaches it to the
+JupyterLab settings of a few user profiles only. The scheduled evaluator in
+src/lambda/lcc_canary compares the boot times of both versions and calls
+finish(), which promotes the new version to the domain default or restores
+the canary users and deletes it.
+"""
+
+from typing import Dict, List, Optional, Tuple, TypedDict
+import logging
+from studio_common.checkpoints import checkpoint_store, now
+from studio_common.lcc_settings import (
+    delete_lcc,
+    domain_settings,
+    profile_settings,
+    references,
+    replace_arn,
+    replace_everywhere,
+    update_profile_settings,
+)
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# a canary waits days for enough boots, and after a rollback its state is
+# what tells the version in the template from the version the users run
+CANARY_TTL_SECONDS = 365 * 24 * 60 * 60
+
+RUNNING = "running"
+PROMOTED = "promoted"
+ROLLED_BACK = "rolled_back"
+
+
+class CanaryConfig(TypedDict):
+    user_profile_names: List[str]
+    min_boots: int
+    max_regression_percent: int
+    max_hours: int
+
+
+class CanaryState(TypedDict, total=False):
+    domain_id: str
+    script_name: str
+    old_arn: str
+    new_arn: str
+    old_version: Optional[str]
+    new_version: str
+    config: CanaryConfig
+    # JupyterLab settings of the canary users before the canary, None for
+    # users that followed the domain default
+    previous_settings: Dict[str, Optional[Dict]]
+    started_at: int
+    finished_at: int
+    status: str
+    report: Dict
+
+
+def canary_key(domain_id: str, script_name: str) -> str:
+    return f"canary#{domain_id}#{script_name}"
+
+
+def versioned_name(name: str, version: str) -> str:
+    return f"{name}-{version}"
+
+
+def get(domain_id: str, script_name: str) -> CanaryState:
+    return checkpoint_store().get(canary_key(domain_id, script_name))
+
+
+def put(state: CanaryState) -> None:
+    checkpoint_store().put(
+        canary_key(state["domain_id"], state["script_name"]),
+        state,
+        ttl_seconds=CANARY_TTL_SECONDS,
+    )
+
+
+def clear(domain_id: str, script_name: str) -> None:
+    checkpoint_store().delete(canary_key(domain_id, script_name))
+
+
+def running(domain_id: str, script_name: str) -> Optional[CanaryState]:
+    state = get(domain_id, script_name)
+    return state if state.get("status") == RUNNING else None
+
+
+def current(
+    domain_id: str, script_name: str, lcc_arn: str, version: Optional[str]
+) -> Tuple[str, Optional[str]]:
+    """The lcc and version the users run in place of lcc_arn, the physical
+    resource id, which still names the new version after a rollback"""
+    state = get(domain_id, script_name)
+    if state.get("status") == ROLLED_BACK and state["new_arn"] == lcc_arn:
+        return state["old_arn"], state["old_version"]
+    return lcc_arn, version
+
+
+def start(
+    domain_id: str,
+    script_name: str,
+    old_arn: str,
+    new_arn: str,
+    old_version: Optional[str],
+    new_version: str,
+    config: CanaryConfig,
+) -> CanaryState:
+    """Attaches new_arn in place of old_arn to the canary users
+
+    Users without JupyterLab settings of their own get a copy of the domain
+    default with the new version. Users whose settings do not include the
+    old version, like users with a resource profile without it, are skipped.
+    """
+    defaults = domain_settings(domain_id)
+    previous_settings = {}
+    for user_profile_name in config["user_profile_names"]:
+        settings = profile_settings(domain_id, user_profile_name)
+        if settings is not None and not references(settings, old_arn):
+            continue
+        previous_settings[user_profile_name] = settings
+        update_profile_settings(
+            domain_id,
+            user_profile_name,
+            replace_arn({**defaults, **(settings or {})}, old_arn, new_arn),
+        )
+
+    state: CanaryState = {
+        "domain_id": domain_id,
+        "script_name": script_name,
+        "old_arn": old_arn,
+        "new_arn": new_arn,
+        "old_version": old_version,
+        "new_version": new_version,
+        "config": config,
+        "previous_settings": previous_settings,
+        "started_at": now(),
+        "status": RUNNING,
+    }
+    put(state)
+    logger.info(
+        {
+            "status": "started lcc canary",
+            "script_name": script_name,
+            "new_arn": new_arn,
+            "user_profiles": config["user_profile_names"],
+        }
+    )
+    return state
+
+
+def finish(state: CanaryState, promote: bool) -> CanaryState:
+    """Promotes the new version to the domain default and every user, or
+    restores the canary users, then deletes the version that lost
+
+    Canary users that followed the domain default before keep a profile
+    copy of the settings, SageMaker cannot unset them again.
+    """
+    domain_id, old_arn, new_arn = state["domain_id"], state["old_arn"], state["new_arn"]
+    if promote:
+        replace_everywhere(domain_id, old_arn, new_arn)
+        delete_lcc(old_arn)
+    else:
+        for user_profile_name, previous in state["previous_settings"].items():
+            settings = previous or replace_arn(
+                profile_settings(domain_id, user_profile_name), new_arn, old_arn
+            )
+            update_profile_settings(domain_id, user_profile_name, settings)
+        delete_lcc(new_arn)
+
+    state["status"] = PROMOTED if promote else ROLLED_BACK
+    state["finished_at"] = now()
+    put(state)
+    logger.info(
+        {
+            "status": f"lcc canary {state['status']}",
+            "script_name": state["script_name"],
+            "report": state.get("report"),
+        }
+    )
+    return state
+
+
+def protects(state: Optional[CanaryState], lcc_arn: str) -> bool:
+    """Whether a running canary still needs lcc_arn, CloudFormation deletes
+    the old version right after the update that starts the canary"""
+    return bool(state) and state["old_arn"] == lcc_arn
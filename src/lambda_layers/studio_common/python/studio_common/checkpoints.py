@@ -0,0 +1,118 @@
+import abc
+import os
+import time
+from decimal import Decimal
+from typing import Any, Dict, Optional
+import boto3
+import logging
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# checkpoints are only needed while a teardown is polling
+CHECKPOINT_TTL_SECONDS = 24 * 60 * 60
+
+
+class CheckpointStore(abc.ABC):
+    """Keeps the progress of a custom resource request between is_complete
+    polls, keyed by the CloudFormation request id
+
+    State that outlives a request, like a running lcc canary, is kept under
+    its own key with a longer ttl_seconds.
+    """
+
+    @abc.abstractmethod
+    def get(self, request_id: str) -> Dict:
+        """Checkpoint of the request id, empty if there is none"""
+
+    @abc.abstractmethod
+    def put(
+        self,
+        request_id: str,
+        checkpoint: Dict,
+        ttl_seconds: int = CHECKPOINT_TTL_SECONDS,
+    ) -> None:
+        """Replaces the checkpoint, it expires after ttl_seconds"""
+
+    @abc.abstractmethod
+    def delete(self, request_id: str) -> None:
+        """Removes the checkpoint, missing ones are ignored"""
+
+
+class InMemoryCheckpointStore(CheckpointStore):
+    """Local stand-in for the DynamoDB table, only survives warm invocations"""
+
+    def __init__(self) -> None:
+        self.checkpoints: Dict[str, Dict] = {}
+
+    def get(self, request_id: str) -> Dict:
+        return dict(self.checkpoints.get(request_id, {}))
+
+    def put(
+        self,
+        request_id: str,
+        checkpoint: Dict,
+        ttl_seconds: int = CHECKPOINT_TTL_SECONDS,
+    ) -> None:
+        self.checkpoints[request_id] = dict(checkpoint)
+
+    def delete(self, request_id: str) -> None:
+        self.checkpoints.pop(request_id, None)
+
+
+class DynamoDbCheckpointStore(CheckpointStore):
+    def __init__(self, table_name: str) -> None:
+        self.table = boto3.resource("dynamodb").Table(table_name)
+
+    def get(self, request_id: str) -> Dict:
+        item = self.table.get_item(Key={"request_id": request_id}).get("Item")
+        return from_dynamodb(item.get("checkpoint", {})) if item else {}
+
+    def put(
+        self,
+        request_id: str,
+        checkpoint: Dict,
+        ttl_seconds: int = CHECKPOINT_TTL_SECONDS,
+    ) -> None:
+        self.table.put_item(
+            Item={
+                "request_id": request_id,
+                "checkpoint": checkpoint,
+                "expires_at": int(time.time()) + ttl_seconds,
+            }
+        )
+
+    def delete(self, request_id: str) -> None:
+        self.table.delete_item(Key={"request_id": request_id})
+
+
+def from_dynamodb(value: Any) -> Any:
+    """Converts the Decimal numbers returned by DynamoDB back to int"""
+    if isinstance(value, Decimal):
+        return int(value)
+    if isinstance(value, dict):
+        return {key: from_dynamodb(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [from_dynamodb(item) for item in value]
+    return value
+
+
+_store: Optional[CheckpointStore] = None
+
+
+def checkpoint_store() -> CheckpointStore:
+    """Returns the DynamoDB store if CHECKPOINT_TABLE_NAME is set, an in
+    memory store otherwise"""
+    global _store
+    if _store is None:
+        table_name = os.environ.get("CHECKPOINT_TABLE_NAME")
+        if table_name:
+            _store = DynamoDbCheckpointStore(table_name)
+        else:
+            logger.info({"status": "no checkpoint table, using in memory store"})
+            _store = InMemoryCheckpointStore()
+    return _store
+
+
+def now() -> int:
+    return int(time.time())
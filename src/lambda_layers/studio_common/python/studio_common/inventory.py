@@ -0,0 +1,179 @@
+"""Streaming inventory of the Studio resources of one or more domains
+
+Records are fetched page by page and written as newline delimited JSON, so
+memory use does not grow with the size of the domain:
+
+    PYTHONPATH=src/lambda_layers/studio_common/python \
+        python -m studio_common.inventory --output inventory.ndjson \
+        --watermark-file inventory.watermark
+
+With --watermark-file, only user profiles and spaces modified since the
+previous run are exported, apps are exported in full. The file keeps one
+watermark per resource type, moved forward once the export completed.
+"""
+
+import argparse
+import datetime
+import json
+import sys
+from typing import Dict, Iterator, List, Optional, TextIO
+import logging
+import boto3
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# (resource type, list operation, response key, timestamp used as watermark)
+RESOURCE_TYPES = [
+    ("user_profile", "list_user_profiles", "UserProfiles", "LastModifiedTime"),
+    ("space", "list_spaces", "Spaces", "LastModifiedTime"),
+    # apps have no modification time, their status changes without a new
+    # CreationTime, so they are listed in full on every run
+    ("app", "list_apps", "Apps", None),
+]
+
+_sm_client = None
+
+
+def sm_client():
+    global _sm_client
+    if _sm_client is None:
+        _sm_client = boto3.client("sagemaker")
+    return _sm_client
+
+
+def iter_domain_ids() -> Iterator[str]:
+    for page in sm_client().get_paginator("list_domains").paginate():
+        for domain in page.get("Domains", []):
+            yield domain["DomainId"]
+
+
+def iter_resources(
+    domain_id: str,
+    resource_type: str,
+    operation: str,
+    key: str,
+    timestamp: Optional[str],
+    since: Optional[datetime.datetime] = None,
+) -> Iterator[Dict]:
+    """Yields the domain's resources newest first, stopping at the first one
+    not newer than since, all of them if timestamp is None"""
+    paginator = sm_client().get_paginator(operation)
+    if timestamp:
+        pages = paginator.paginate(
+            DomainIdEquals=domain_id,
+            SortBy=timestamp,
+            SortOrder="Descending",
+        )
+    else:
+        pages = paginator.paginate(DomainIdEquals=domain_id)
+    for page in pages:
+        for resource in page.get(key, []):
+            if timestamp and since and resource[timestamp] <= since:
+                return
+            yield {"resource_type": resource_type, **resource}
+
+
+def to_json(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def export(
+    out: TextIO,
+    domain_ids: Optional[List[str]] = None,
+    watermarks: Optional[Dict[str, datetime.datetime]] = None,
+) -> Dict[str, datetime.datetime]:
+    """Writes one json line per resource to out
+
+    Args:
+        out (TextIO): destination of the json lines
+        domain_ids (list): domains to export, all domains of the region if None
+        watermarks (dict): by resource type, only export resources of that
+            type modified after this time
+
+    Returns:
+        watermarks (dict): latest modification time seen per resource type,
+            the given watermark if none
+    """
+    watermarks = dict(watermarks or {})
+    since = dict(watermarks)
+    count = 0
+    for domain_id in domain_ids or iter_domain_ids():
+        for resource_type, operation, key, timestamp in RESOURCE_TYPES:
+            for resource in iter_resources(
+                domain_id,
+                resource_type,
+                operation,
+                key,
+                timestamp,
+                since.get(resource_type),
+            ):
+                out.write(json.dumps(resource, default=to_json) + "\n")
+                count += 1
+                if timestamp and (
+                    resource_type not in watermarks
+                    or resource[timestamp] > watermarks[resource_type]
+                ):
+                    watermarks[resource_type] = resource[timestamp]
+    logger.info({"status": "exported studio inventory", "count": count})
+    return watermarks
+
+
+def read_watermarks(path: str) -> Dict[str, datetime.datetime]:
+    """Watermarks by resource type, none for a missing file or a file of the
+    single watermark of older versions"""
+    try:
+        with open(path) as f:
+            watermarks = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(watermarks, dict):
+        return {}
+    return {
+        resource_type: datetime.datetime.fromisoformat(watermark)
+        for resource_type, watermark in watermarks.items()
+    }
+
+
+def write_watermarks(path: str, watermarks: Dict[str, datetime.datetime]) -> None:
+    if watermarks:
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    resource_type: watermark.isoformat()
+                    for resource_type, watermark in watermarks.items()
+                },
+                f,
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--domain-id",
+        action="append",
+        dest="domain_ids",
+        help="domain to export, can be repeated, defaults to all domains",
+    )
+    parser.add_argument("--output", help="ndjson file, defaults to stdout")
+    parser.add_argument(
+        "--watermark-file",
+        help="only export resources modified since the times stored in this file",
+    )
+    args = parser.parse_args(argv)
+
+    watermarks = read_watermarks(args.watermark_file) if args.watermark_file else {}
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        watermarks = export(out, args.domain_ids, watermarks)
+    finally:
+        if args.output:
+            out.close()
+    if args.watermark_file:
+        write_watermarks(args.watermark_file, watermarks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""JupyterLab app settings of the domain and its user profiles
+
+The lifecycle configs a user can run are the LifecycleConfigArns of the
+user profile's JupyterLab settings if the profile has its own, of the
+domain's default settings otherwise. DefaultResourceSpec names the lcc that
+runs when the user does not pick one.
+"""
+
+import base64
+from typing import Dict, Iterable, List, Optional
+import logging
+from studio_common.rate_limiter import rate_limited_client
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+_sm_client = None
+
+
+def sm_client():
+    global _sm_client
+    if _sm_client is None:
+        _sm_client = rate_limited_client("sagemaker")
+    return _sm_client
+
+
+def lcc_name(lcc_arn: str) -> str:
+    """Name of a studio lifecycle config from its arn"""
+    return lcc_arn.split("/", 1)[-1]
+
+
+def replace_arn(settings: Optional[Dict], old_arn: str, new_arn: str) -> Dict:
+    """JupyterLab app settings with old_arn replaced by new_arn, new_arn is
+    added if the settings did not reference old_arn"""
+    settings = dict(settings or {})
+    arns = [arn for arn in settings.get("LifecycleConfigArns", []) if arn != old_arn]
+    settings["LifecycleConfigArns"] = arns + ([new_arn] if new_arn not in arns else [])
+    spec = settings.get("DefaultResourceSpec")
+    if spec and spec.get("LifecycleConfigArn") == old_arn:
+        settings["DefaultResourceSpec"] = {**spec, "LifecycleConfigArn": new_arn}
+    return settings
+
+
+def references(settings: Optional[Dict], lcc_arn: str) -> bool:
+    settings = settings or {}
+    return (
+        lcc_arn in settings.get("LifecycleConfigArns", [])
+        or settings.get("DefaultResourceSpec", {}).get("LifecycleConfigArn") == lcc_arn
+    )
+
+
+def domain_settings(domain_id: str) -> Dict:
+    response = sm_client().describe_domain(DomainId=domain_id)
+    return response.get("DefaultUserSettings", {}).get("JupyterLabAppSettings", {})
+
+
+def profile_settings(domain_id: str, user_profile_name: str) -> Optional[Dict]:
+    response = sm_client().describe_user_profile(
+        DomainId=domain_id, UserProfileName=user_profile_name
+    )
+    return response.get("UserSettings", {}).get("JupyterLabAppSettings")
+
+
+def update_profile_settings(
+    domain_id: str, user_profile_name: str, settings: Dict
+) -> None:
+    sm_client().update_user_profile(
+        DomainId=domain_id,
+        UserProfileName=user_profile_name,
+        UserSettings={"JupyterLabAppSettings": settings},
+    )
+
+
+def replace_in_profiles(domain_id: str, old_arn: str, new_arn: str) -> None:
+    """Replaces old_arn in the user profiles that override the domain's
+    JupyterLab settings, those do not follow the domain default"""
+    paginator = sm_client().get_paginator("list_user_profiles")
+    for page in paginator.paginate(DomainIdEquals=domain_id):
+        for profile in page.get("UserProfiles", []):
+            name = profile["UserProfileName"]
+            settings = profile_settings(domain_id, name)
+            if references(settings, old_arn):
+                update_profile_settings(
+                    domain_id, name, replace_arn(settings, old_arn, new_arn)
+                )
+                logger.info(
+                    {"status": "replaced lcc of user profile", "user_profile": name}
+                )
+
+
+def replace_everywhere(domain_id: str, old_arn: str, new_arn: str) -> None:
+    """Points the domain default and the user profiles at new_arn"""
+    sm_client().update_domain(
+        DomainId=domain_id,
+        DefaultUserSettings={
+            "JupyterLabAppSettings": replace_arn(
+                domain_settings(domain_id), old_arn, new_arn
+            )
+        },
+    )
+    replace_in_profiles(domain_id, old_arn, new_arn)
+
+
+def apply_resource_profiles(
+    domain_id: str,
+    lcc_arn: str,
+    script_name: str,
+    user_resource_profiles: Dict[str, Dict],
+    skip: Iterable[str] = (),
+) -> None:
+    """Adds lcc_arn to or removes it from the JupyterLab settings of the
+    users with a resource profile, see ResourceProfile.settings
+
+    Profiles without settings of their own start from empty settings, each
+    lifecycle config custom resource adds its own lcc. Users in skip, like
+    the users of a running canary, are left alone.
+    """
+    for user_profile_name, resource_profile in user_resource_profiles.items():
+        if user_profile_name in skip:
+            continue
+        settings = dict(profile_settings(domain_id, user_profile_name) or {})
+        arns = [
+            arn for arn in settings.get("LifecycleConfigArns", []) if arn != lcc_arn
+        ]
+        if script_name in resource_profile["lifecycle_configs"]:
+            arns.append(lcc_arn)
+        spec = dict(settings.get("DefaultResourceSpec", {}))
+        if resource_profile["default_lifecycle_config"] == script_name:
+            spec["LifecycleConfigArn"] = lcc_arn
+        elif spec.get("LifecycleConfigArn") == lcc_arn:
+            del spec["LifecycleConfigArn"]
+        spec["InstanceType"] = resource_profile["instance_type"]
+        settings.update({"LifecycleConfigArns": arns, "DefaultResourceSpec": spec})
+        update_profile_settings(domain_id, user_profile_name, settings)
+        logger.info(
+            {
+                "status": "applied resource profile",
+                "user_profile": user_profile_name,
+                "lcc_arns": arns,
+            }
+        )
+
+
+def reset_resource_profiles(
+    domain_id: str, user_profile_names: List[str], skip: Iterable[str] = ()
+) -> None:
+    """Puts the users taken out of the resource profiles back on the domain
+    default
+
+    apply_resource_profiles gave them JupyterLab settings of their own, their
+    LifecycleConfigArns and DefaultResourceSpec are replaced by the domain's.
+    Users in skip, like the users of a running canary, are left alone.
+    """
+    default = domain_settings(domain_id)
+    for user_profile_name in user_profile_names:
+        if user_profile_name in skip:
+            continue
+        try:
+            settings = dict(profile_settings(domain_id, user_profile_name) or {})
+        except sm_client().exceptions.ResourceNotFound:
+            logger.info(
+                {
+                    "status": "user profile already deleted",
+                    "user_profile": user_profile_name,
+                }
+            )
+            continue
+        settings["LifecycleConfigArns"] = list(default.get("LifecycleConfigArns", []))
+        if default.get("DefaultResourceSpec"):
+            settings["DefaultResourceSpec"] = dict(default["DefaultResourceSpec"])
+        else:
+            settings.pop("DefaultResourceSpec", None)
+        update_profile_settings(domain_id, user_profile_name, settings)
+        logger.info(
+            {"status": "reset resource profile", "user_profile": user_profile_name}
+        )
+
+
+def create_lcc(name: str, lcc_script: str) -> str:
+    response = sm_client().create_studio_lifecycle_config(
+        StudioLifecycleConfigName=name,
+        StudioLifecycleConfigContent=base64.b64encode(lcc_script.encode()).decode(),
+        StudioLifecycleConfigAppType="JupyterLab",
+    )
+    logger.info({"status": "created lcc", "name": name})
+    return response["StudioLifecycleConfigArn"]
+
+
+def delete_lcc(lcc_arn: str) -> None:
+    try:
+        sm_client().delete_studio_lifecycle_config(
+            StudioLifecycleConfigName=lcc_name(lcc_arn)
+        )
+        logger.info({"status": "deleted lcc", "lcc_arn": lcc_arn})
+    except sm_client().exceptions.ResourceNotFound:
+        logger.info({"status": "lcc already deleted", "lcc_arn": lcc_arn})
@@ -0,0 +1,356 @@
+"""Local stand-in for Step Functions, running a state machine definition
+against lambda handlers and boto3 style clients in the same process
+
+Covers the states and fields the stack's state machines use: Task states
+invoking lambdas (arn:aws:states:::lambda:invoke) or AWS SDK integrations
+(arn:aws:states:::aws-sdk:<service>:<action>), Map with MaxConcurrency, Wait,
+Choice, Pass, Succeed and Fail, the input and output paths, Retry and Catch.
+E.g. the domain teardown with fake clients:
+
+    machine = LocalStateMachine(
+        teardown_definition("inventory", "security-group"),
+        functions={"inventory": inventory_handler, ...},
+        clients={"sagemaker": fake_sagemaker, "efs": fake_efs},
+        sleep=lambda seconds: None,
+    )
+    machine.execute({"domain_id": "d-xxx"})
+
+SDK integration errors are named like those of Step Functions,
+<service>.<error code>Exception, from the error code of a botocore
+ClientError or of any exception with a similar response attribute. Lambda
+errors are named after the exception class, as the lambda error type.
+"""
+
+import copy
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+LAMBDA_RESOURCE = "arn:aws:states:::lambda:invoke"
+SDK_RESOURCE_PREFIX = "arn:aws:states:::aws-sdk:"
+# service names in the errors of the SDK integrations
+SDK_ERROR_PREFIXES = {"sagemaker": "SageMaker", "efs": "Efs", "ec2": "Ec2"}
+PATH_TOKEN = re.compile(r"\.([^.\[]+)|\[(\d+)\]")
+MAX_STATE_TRANSITIONS = 100000
+
+
+class StatesError(Exception):
+    """Error of a state, matched by the ErrorEquals of Retry and Catch"""
+
+    def __init__(self, error: str, cause: str = "") -> None:
+        super().__init__(f"{error}: {cause}" if cause else error)
+        self.error = error
+        self.cause = cause
+
+
+def parse_path(path: str) -> List[Any]:
+    if not path.startswith("$"):
+        raise ValueError(f"Invalid path: {path}")
+    tokens = []
+    position = 1
+    while position < len(path):
+        match = PATH_TOKEN.match(path, position)
+        if not match:
+            raise ValueError(f"Invalid path: {path}")
+        key, index = match.groups()
+        tokens.append(key if key is not None else int(index))
+        position = match.end()
+    return tokens
+
+
+def read_path(data: Any, path: str, context: Optional[Dict] = None) -> Any:
+    if path.startswith("$$"):
+        data, path = context, path[1:]
+    for token in parse_path(path):
+        try:
+            data = data[token]
+        except (KeyError, IndexError, TypeError):
+            raise StatesError("States.Runtime", f"{path} not found in the input")
+    return data
+
+
+def write_path(data: Any, path: Optional[str], value: Any) -> Any:
+    """ResultPath: None keeps the input, "$" replaces it"""
+    if path is None:
+        return data
+    tokens = parse_path(path)
+    if not tokens:
+        return value
+    data = copy.deepcopy(data)
+    target = data
+    for token in tokens[:-1]:
+        target = target.setdefault(token, {})
+    target[tokens[-1]] = value
+    return data
+
+
+def resolve(template: Any, data: Any, context: Dict) -> Any:
+    """Parameters, ItemSelector and ResultSelector, keys ending in .$ are
+    paths into the input or, starting with $$, into the context object"""
+    if isinstance(template, dict):
+        resolved = {}
+        for key, value in template.items():
+            if key.endswith(".$"):
+                resolved[key[:-2]] = read_path(data, value, context)
+            else:
+                resolved[key] = resolve(value, data, context)
+        return resolved
+    if isinstance(template, list):
+        return [resolve(value, data, context) for value in template]
+    return template
+
+
+def snake_case(action: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", action).lower()
+
+
+def error_name(e: Exception, service: Optional[str] = None) -> str:
+    if isinstance(e, StatesError):
+        return e.error
+    if service is None:
+        return type(e).__name__
+    code = getattr(e, "response", {}).get("Error", {}).get("Code")
+    if not code:
+        return "States.TaskFailed"
+    if not code.endswith("Exception"):
+        code = f"{code}Exception"
+    return f"{SDK_ERROR_PREFIXES.get(service, service.capitalize())}.{code}"
+
+
+def matches(error: str, error_equals: List[str]) -> bool:
+    return error in error_equals or (
+        "States.ALL" in error_equals and error != "States.Runtime"
+    )
+
+
+def test_choice(rule: Dict, data: Any) -> bool:
+    if "And" in rule:
+        return all(test_choice(r, data) for r in rule["And"])
+    if "Or" in rule:
+        return any(test_choice(r, data) for r in rule["Or"])
+    if "Not" in rule:
+        return not test_choice(rule["Not"], data)
+    try:
+        value = read_path(data, rule["Variable"])
+    except StatesError:
+        return rule.get("IsPresent") is False
+    if "IsPresent" in rule:
+        return rule["IsPresent"]
+    for operator, test in [
+        ("StringEquals", lambda a, b: a == b),
+        ("NumericEquals", lambda a, b: a == b),
+        ("NumericLessThan", lambda a, b: a < b),
+        ("NumericGreaterThan", lambda a, b: a > b),
+        ("BooleanEquals", lambda a, b: a is b),
+    ]:
+        if operator in rule:
+            return test(value, rule[operator])
+    raise ValueError(f"Unsupported choice rule: {rule}")
+
+
+class LocalStateMachine:
+    """Runs an Amazon States Language definition locally
+
+    Args:
+        definition (dict): state machine definition
+        functions (dict): lambda handlers by the FunctionName of the Task
+            states, called with (payload, None)
+        clients (dict): boto3 style clients by the service of the aws-sdk
+            Task states, actions are called as snake case methods
+        sleep (callable): called with the seconds of Wait states and retry
+            intervals, e.g. to skip them in tests
+    """
+
+    def __init__(
+        self,
+        definition: Dict,
+        functions: Optional[Dict[str, Callable]] = None,
+        clients: Optional[Dict[str, Any]] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.definition = definition
+        self.functions = functions or {}
+        self.clients = clients or {}
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        # names of the states entered, in order per branch
+        self.history: List[str] = []
+        # highest number of iterations running at once, by Map state
+        self.max_running: Dict[str, int] = {}
+
+    def execute(self, execution_input: Dict) -> Any:
+        """Runs the state machine to its end
+
+        Returns:
+            output: output of the last state, a Fail state or an unhandled
+                error raises StatesError
+        """
+        logger.info({"status": "starting local execution"})
+        output = self.run_states(self.definition, execution_input, {"Map": None})
+        logger.info({"status": "local execution succeeded"})
+        return output
+
+    def run_states(self, machine: Dict, data: Any, context: Dict) -> Any:
+        name = machine["StartAt"]
+        for _ in range(MAX_STATE_TRANSITIONS):
+            state = machine["States"][name]
+            with self.lock:
+                self.history.append(name)
+            data, name = self.run_state(name, state, data, context)
+            if name is None:
+                return data
+        raise StatesError("States.Timeout", "too many state transitions")
+
+    def run_state(
+        self, name: str, state: Dict, data: Any, context: Dict
+    ) -> Tuple[Any, Optional[str]]:
+        """Returns the output of the state and the next state, None at the end"""
+        kind = state["Type"]
+        if kind == "Succeed":
+            return (
+                self.output(state, read_path(data, state.get("InputPath", "$"))),
+                None,
+            )
+        if kind == "Fail":
+            raise StatesError(state.get("Error", "States.Fail"), state.get("Cause", ""))
+        if kind == "Choice":
+            effective = read_path(data, state.get("InputPath", "$"))
+            for rule in state["Choices"]:
+                if test_choice(rule, effective):
+                    return self.output(state, effective), rule["Next"]
+            if "Default" not in state:
+                raise StatesError("States.NoChoiceMatched", name)
+            return self.output(state, effective), state["Default"]
+        if kind == "Wait":
+            self.sleep(state["Seconds"])
+            return self.output(state, read_path(data, state.get("InputPath", "$"))), (
+                self.next_state(state)
+            )
+
+        attempts: Dict[int, int] = {}
+        while True:
+            try:
+                return self.run_work(name, state, data, context), self.next_state(state)
+            except Exception as e:
+                error = error_name(e, self.sdk_service(state))
+                cause = e.cause if isinstance(e, StatesError) else str(e)
+            retrier = self.retrier(state, error, attempts)
+            if retrier is not None:
+                continue
+            for catcher in state.get("Catch", []):
+                if matches(error, catcher["ErrorEquals"]):
+                    logger.info(
+                        {"status": "caught error", "state": name, "error": error}
+                    )
+                    return (
+                        write_path(
+                            data,
+                            catcher.get("ResultPath", "$"),
+                            {"Error": error, "Cause": cause},
+                        ),
+                        catcher["Next"],
+                    )
+            raise StatesError(error, cause)
+
+    def retrier(
+        self, state: Dict, error: str, attempts: Dict[int, int]
+    ) -> Optional[Dict]:
+        """Sleeps and returns the first retrier matching the error, None once
+        it ran out of attempts"""
+        for index, retrier in enumerate(state.get("Retry", [])):
+            if not matches(error, retrier["ErrorEquals"]):
+                continue
+            attempt = attempts.get(index, 0)
+            if attempt >= retrier.get("MaxAttempts", 3):
+                return None
+            attempts[index] = attempt + 1
+            self.sleep(
+                retrier.get("IntervalSeconds", 1)
+                * retrier.get("BackoffRate", 2.0) ** attempt
+            )
+            return retrier
+        return None
+
+    def run_work(self, name: str, state: Dict, data: Any, context: Dict) -> Any:
+        """Task, Map and Pass states, from the state input to its output"""
+        effective = read_path(data, state.get("InputPath", "$"))
+        if state["Type"] == "Map":
+            result = self.run_map(name, state, effective, context)
+        else:
+            if "Parameters" in state:
+                effective = resolve(state["Parameters"], effective, context)
+            if state["Type"] == "Pass":
+                result = state.get("Result", effective)
+            else:
+                result = self.run_task(state, effective)
+        if "ResultSelector" in state:
+            result = resolve(state["ResultSelector"], result, context)
+        return self.output(
+            state, write_path(data, state.get("ResultPath", "$"), result)
+        )
+
+    def run_task(self, state: Dict, effective: Any) -> Any:
+        resource = state["Resource"]
+        if resource == LAMBDA_RESOURCE:
+            handler = self.functions[effective["FunctionName"]]
+            return {"Payload": handler(effective.get("Payload"), None)}
+        service = self.sdk_service(state)
+        if service is None:
+            raise ValueError(f"Unsupported resource: {resource}")
+        action = resource.rsplit(":", 1)[1]
+        method = getattr(self.clients[service], snake_case(action))
+        return method(**effective)
+
+    def run_map(
+        self, name: str, state: Dict, effective: Any, context: Dict
+    ) -> List[Any]:
+        items = read_path(effective, state.get("ItemsPath", "$"))
+        processor = state.get("ItemProcessor") or state["Iterator"]
+        running = 0
+
+        def iteration(index: int) -> Any:
+            nonlocal running
+            item_context = {
+                **context,
+                "Map": {"Item": {"Index": index, "Value": items[index]}},
+            }
+            item = items[index]
+            if "ItemSelector" in state or "Parameters" in state:
+                item = resolve(
+                    state.get("ItemSelector", state.get("Parameters")),
+                    effective,
+                    item_context,
+                )
+            with self.lock:
+                running += 1
+                self.max_running[name] = max(self.max_running.get(name, 0), running)
+            try:
+                return self.run_states(processor, item, item_context)
+            finally:
+                with self.lock:
+                    running -= 1
+
+        workers = state.get("MaxConcurrency") or len(items) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(iteration, range(len(items))))
+
+    @staticmethod
+    def sdk_service(state: Dict) -> Optional[str]:
+        resource = state.get("Resource", "")
+        if not resource.startswith(SDK_RESOURCE_PREFIX):
+            return None
+        return resource[len(SDK_RESOURCE_PREFIX) :].split(":")[0]
+
+    @staticmethod
+    def next_state(state: Dict) -> Optional[str]:
+        return None if state.get("End") else state["Next"]
+
+    @staticmethod
+    def output(state: Dict, data: Any) -> Any:
+        return read_path(data, state.get("OutputPath", "$"))
@@ -0,0 +1,114 @@
+import math
+from typing import Dict, List, Optional, TypedDict
+
+# the Provider framework polls is_complete every 5 seconds by default
+POLL_INTERVAL_SECONDS = 5
+
+
+class PlanStep(TypedDict):
+    id: str
+    action: str
+    resource: str
+    depends_on: List[str]
+    api_calls: int
+    estimated_seconds: float
+
+
+class TeardownPlan:
+    """Deletion plan of a custom resource, computed without side effects
+
+    Steps form a DAG through depends_on. Steps without a path between them
+    run in the same polls, so the teardown takes as long as the critical
+    path, not the sum of all steps.
+    """
+
+    def __init__(self, resource: str) -> None:
+        self.resource = resource
+        self.steps: Dict[str, PlanStep] = {}
+        self.warnings: List[str] = []
+
+    def add(
+        self,
+        step_id: str,
+        action: str,
+        resource: str,
+        estimated_seconds: float,
+        depends_on: Optional[List[str]] = None,
+        api_calls: Optional[int] = None,
+    ) -> str:
+        """Adds a step, by default counting one call for the action and
+        one describe per poll until it is done"""
+        if api_calls is None:
+            api_calls = 1 + math.ceil(estimated_seconds / POLL_INTERVAL_SECONDS)
+        self.steps[step_id] = {
+            "id": step_id,
+            "action": action,
+            "resource": resource,
+            "depends_on": [
+                dependency
+                for dependency in (depends_on or [])
+                if dependency in self.steps
+            ],
+            "api_calls": api_calls,
+            "estimated_seconds": estimated_seconds,
+        }
+        return step_id
+
+    def warn(self, warning: str) -> None:
+        self.warnings.append(warning)
+
+    def order(self) -> List[List[str]]:
+        """Groups the steps into stages, each stage only depending on earlier ones"""
+        stages = []
+        done = set()
+        remaining = dict(self.steps)
+        while remaining:
+            stage = sorted(
+                step_id
+                for step_id, step in remaining.items()
+                if all(dependency in done for dependency in step["depends_on"])
+            )
+            if not stage:
+                raise ValueError(f"cycle between plan steps: {sorted(remaining)}")
+            stages.append(stage)
+            done.update(stage)
+            for step_id in stage:
+                del remaining[step_id]
+        return stages
+
+    def critical_path(self) -> List[str]:
+        finish: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+        for stage in self.order():
+            for step_id in stage:
+                step = self.steps[step_id]
+                slowest = max(step["depends_on"], key=lambda d: finish[d], default=None)
+                finish[step_id] = step["estimated_seconds"] + (
+                    finish[slowest] if slowest else 0
+                )
+                previous[step_id] = slowest
+
+        path = []
+        step_id = max(finish, key=finish.get, default=None)
+        while step_id:
+            path.insert(0, step_id)
+            step_id = previous[step_id]
+        return path
+
+    def to_dict(self) -> Dict:
+        critical_path = self.critical_path()
+        counts: Dict[str, int] = {}
+        for step in self.steps.values():
+            counts[step["action"]] = counts.get(step["action"], 0) + 1
+        return {
+            "resource": self.resource,
+            "counts": counts,
+            "stages": self.order(),
+            "steps": list(self.steps.values()),
+            "api_calls": sum(step["api_calls"] for step in self.steps.values()),
+            "critical_path": critical_path,
+            "estimated_seconds": sum(
+                self.steps[step_id]["estimated_seconds"] for step_id in critical_path
+            ),
+            "warnings": self.warnings,
+        }
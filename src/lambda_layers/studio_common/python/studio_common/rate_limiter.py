@@ -0,0 +1,313 @@
+import abc
+import os
+import random
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+import boto3
+import logging
+from botocore.config import Config
+from studio_common.aio import MAX_CONCURRENCY
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+THROTTLING_ERROR_CODES = [
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "SlowDown",
+]
+
+# throttled calls are retried with backoff instead of failing the poll, the
+# connection pool serves all concurrent calls of studio_common.aio
+RETRY_CONFIG = Config(
+    retries={"mode": "standard", "max_attempts": 10},
+    max_pool_connections=MAX_CONCURRENCY,
+)
+
+# a window counter is only used during its own second
+COUNTER_TTL_SECONDS = 60 * 60
+
+# a limiter leases this share of the window's calls at once, so that a lambda
+# writes the counter a few times per second instead of once per call. Leased
+# calls left at the end of the window are lost, the fleet stays under the rate
+LEASE_FRACTION = 4
+
+
+class RateCounter(abc.ABC):
+    """Fleet wide state of the rate limiters: a call counter per one second
+    window and the learned call rate of each service"""
+
+    @abc.abstractmethod
+    def claim(self, key: str, limit: int, count: int) -> int:
+        """Counts up to count calls in the window key without passing limit,
+        returns how many were counted"""
+
+    @abc.abstractmethod
+    def get_rate(self, service: str) -> Optional[float]:
+        """Learned call rate of the service, None before the first update"""
+
+    @abc.abstractmethod
+    def update_rate(self, service: str, rate: float, not_updated_since: float) -> bool:
+        """Sets the rate unless another worker changed it after not_updated_since"""
+
+
+class InMemoryRateCounter(RateCounter):
+    """Local stand-in for the DynamoDB table, shared by the threads of one
+    lambda container"""
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, int] = {}
+        self.rates: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, limit: int, count: int) -> int:
+        with self._lock:
+            claimed = max(min(count, limit - self.calls.get(key, 0)), 0)
+            self.calls[key] = self.calls.get(key, 0) + claimed
+            return claimed
+
+    def get_rate(self, service: str) -> Optional[float]:
+        with self._lock:
+            rate = self.rates.get(service)
+            return rate[0] if rate else None
+
+    def update_rate(self, service: str, rate: float, not_updated_since: float) -> bool:
+        with self._lock:
+            current = self.rates.get(service)
+            if current and current[1] >= not_updated_since:
+                return False
+            self.rates[service] = (rate, time.time())
+            return True
+
+
+class DynamoDbRateCounter(RateCounter):
+    """Keeps the counters in the shared checkpoint table, under request ids
+    prefixed with rate-limit#"""
+
+    def __init__(self, table_name: str) -> None:
+        self.table = boto3.resource("dynamodb").Table(table_name)
+
+    def claim(self, key: str, limit: int, count: int) -> int:
+        # a full batch, or a single call once the window is nearly used up
+        for claimed in sorted({count, 1}, reverse=True):
+            try:
+                self.table.update_item(
+                    Key={"request_id": f"rate-limit#{key}"},
+                    UpdateExpression="ADD calls :count SET expires_at = :expires_at",
+                    ConditionExpression="attribute_not_exists(calls) OR calls <= :room",
+                    ExpressionAttributeValues={
+                        ":count": claimed,
+                        ":room": limit - claimed,
+                        ":expires_at": int(time.time()) + COUNTER_TTL_SECONDS,
+                    },
+                )
+                return claimed
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                continue
+        return 0
+
+    def get_rate(self, service: str) -> Optional[float]:
+        item = self.table.get_item(Key={"request_id": f"rate-limit#{service}"}).get(
+            "Item"
+        )
+        return float(item["rate"]) if item else None
+
+    def update_rate(self, service: str, rate: float, not_updated_since: float) -> bool:
+        try:
+            self.table.update_item(
+                Key={"request_id": f"rate-limit#{service}"},
+                UpdateExpression="SET #rate = :rate, updated_at = :now",
+                ConditionExpression="attribute_not_exists(updated_at) OR updated_at < :since",
+                ExpressionAttributeNames={"#rate": "rate"},
+                ExpressionAttributeValues={
+                    ":rate": Decimal(str(round(rate, 3))),
+                    ":now": Decimal(str(round(time.time(), 3))),
+                    ":since": Decimal(str(round(not_updated_since, 3))),
+                },
+            )
+            return True
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+
+class AdaptiveRateLimiter:
+    """Client side AIMD rate limiter shared by every lambda calling a service
+
+    Each call takes a slot in the fleet wide counter of the current one second
+    window and waits for the next window once the learned rate is used up.
+    Slots are leased in batches of a LEASE_FRACTION share of the rate, the
+    calls of a batch only count locally.
+    The rate grows additively while calls succeed and is halved on the first
+    throttling error. Both adjustments are applied at most once per cooldown
+    across the fleet, so parallel workers do not compound each other and the
+    fleet settles just under the rate the service accepts.
+
+    Errors of the counter itself never block a call, the limiter then only
+    applies the locally known rate.
+
+    Args:
+        service (str): service the rate is learned for
+        counter (RateCounter): fleet wide counters
+        initial_rate (float): calls per second before anything is learned
+        min_rate (float): lower bound of the learned rate
+        max_rate (float): upper bound of the learned rate
+        increase (float): calls per second added after a cooldown without throttling
+        decrease (float): factor applied to the rate when throttled
+        cooldown_seconds (float): minimum time between two adjustments
+    """
+
+    def __init__(
+        self,
+        service: str,
+        counter: RateCounter,
+        initial_rate: float = 4.0,
+        min_rate: float = 1.0,
+        max_rate: float = 40.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        cooldown_seconds: float = 5.0,
+    ) -> None:
+        self.service = service
+        self.counter = counter
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown_seconds = cooldown_seconds
+        self._rate = initial_rate
+        self._refreshed_at = 0.0
+        self._adjusted_at = time.time()
+        # slots left from the last lease and its window
+        self._leased = 0
+        self._lease_window = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        if time.time() - self._refreshed_at >= self.cooldown_seconds:
+            self._refreshed_at = time.time()
+            try:
+                shared_rate = self.counter.get_rate(self.service)
+                if shared_rate:
+                    self._rate = shared_rate
+            except Exception as e:
+                logger.warning({"status": "failed to read call rate", "exception": e})
+        return self._rate
+
+    def acquire(self) -> None:
+        while True:
+            now = time.time()
+            window = int(now)
+            with self._lock:
+                if self._lease_window == window and self._leased > 0:
+                    self._leased -= 1
+                    return
+                limit = max(int(self.rate), 1)
+                try:
+                    claimed = self.counter.claim(
+                        f"{self.service}#{window}",
+                        limit,
+                        max(limit // LEASE_FRACTION, 1),
+                    )
+                except Exception as e:
+                    logger.warning({"status": "failed to count call", "exception": e})
+                    return
+                if claimed:
+                    self._leased = claimed - 1
+                    self._lease_window = window
+                    return
+            # wait for the next window, jittered so waiting workers do not
+            # all wake up at once
+            time.sleep(window + 1 - now + random.uniform(0, 0.1))
+
+    def on_throttle(self) -> None:
+        self._adjust(max(self.rate * self.decrease, self.min_rate), "decreased")
+
+    def on_success(self) -> None:
+        if time.time() - self._adjusted_at < self.cooldown_seconds:
+            return
+        self._adjust(min(self.rate + self.increase, self.max_rate), "increased")
+
+    def _adjust(self, rate: float, direction: str) -> None:
+        now = time.time()
+        self._adjusted_at = now
+        try:
+            if not self.counter.update_rate(
+                self.service, rate, now - self.cooldown_seconds
+            ):
+                return
+        except Exception as e:
+            logger.warning({"status": "failed to update call rate", "exception": e})
+        if rate != self._rate:
+            logger.info(
+                {
+                    "status": f"{direction} call rate",
+                    "service": self.service,
+                    "rate": rate,
+                }
+            )
+        self._rate = rate
+        self._refreshed_at = now
+
+
+_counter: Optional[RateCounter] = None
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+
+def rate_counter() -> RateCounter:
+    """Returns the DynamoDB counter if RATE_LIMIT_TABLE_NAME is set, an in
+    memory counter otherwise"""
+    global _counter
+    if _counter is None:
+        table_name = os.environ.get("RATE_LIMIT_TABLE_NAME")
+        if table_name:
+            _counter = DynamoDbRateCounter(table_name)
+        else:
+            logger.info({"status": "no rate limit table, using in memory counter"})
+            _counter = InMemoryRateCounter()
+    return _counter
+
+
+def rate_limiter(service: str) -> AdaptiveRateLimiter:
+    if service not in _limiters:
+        _limiters[service] = AdaptiveRateLimiter(service, rate_counter())
+    return _limiters[service]
+
+
+def rate_limited_client(service_name: str, config: Optional[Config] = None, **kwargs):
+    """Creates a boto3 client whose calls go through the service's rate limiter
+
+    The limiter is called for every attempt, including botocore's retries,
+    and learns from the throttling errors botocore sees. config is merged
+    over RETRY_CONFIG.
+    """
+    config = RETRY_CONFIG.merge(config) if config else RETRY_CONFIG
+    client = boto3.client(service_name, config=config, **kwargs)
+    limiter = rate_limiter(service_name)
+    service_id = client.meta.service_model.service_id.hyphenize()
+
+    def before_send(**kwargs):
+        limiter.acquire()
+
+    def needs_retry(response=None, **kwargs):
+        if response and response[1].get("Error", {}).get("Code") in (
+            THROTTLING_ERROR_CODES
+        ):
+            limiter.on_throttle()
+
+    def after_call(http_response=None, **kwargs):
+        if http_response is not None and http_response.status_code < 300:
+            limiter.on_success()
+
+    client.meta.events.register(f"before-send.{service_id}", before_send)
+    # registered first, the retry handler stops the event once it decides to retry
+    client.meta.events.register_first(f"needs-retry.{service_id}", needs_retry)
+    client.meta.events.register(f"after-call.{service_id}", after_call)
+    return client
@@ -0,0 +1,143 @@
+import enum
+import sys
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Status(str, enum.Enum):
+    """Statuses of apps, spaces and user profiles, one shared instance each"""
+
+    DELETED = "Deleted"
+    DELETING = "Deleting"
+    FAILED = "Failed"
+    IN_SERVICE = "InService"
+    PENDING = "Pending"
+    UPDATING = "Updating"
+    UPDATE_FAILED = "Update_Failed"
+    DELETE_FAILED = "Delete_Failed"
+
+    @classmethod
+    def of(cls, value: Optional[str]) -> Optional["Status"]:
+        try:
+            return cls(value) if value else None
+        except ValueError:
+            # statuses added to the api later are treated like unknown ones
+            return None
+
+
+def intern(value: Optional[str]) -> Optional[str]:
+    """App types and domain ids repeat across records, interning keeps one
+    copy of each"""
+    return sys.intern(value) if value else None
+
+
+class AppRecord:
+    """The fields of a list_apps or describe_app response used by the handlers
+
+    A slotted record takes a fraction of the memory of the response dict,
+    which also holds the creation datetime and the resource spec.
+    """
+
+    __slots__ = (
+        "domain_id",
+        "user_profile_name",
+        "space_name",
+        "app_type",
+        "app_name",
+        "status",
+        "instance_type",
+    )
+
+    def __init__(
+        self,
+        domain_id: str,
+        app_type: str,
+        app_name: str,
+        user_profile_name: Optional[str] = None,
+        space_name: Optional[str] = None,
+        status: Optional[Status] = None,
+        instance_type: Optional[str] = None,
+    ) -> None:
+        self.domain_id = intern(domain_id)
+        self.user_profile_name = user_profile_name
+        self.space_name = space_name
+        self.app_type = intern(app_type)
+        self.app_name = intern(app_name)
+        self.status = status
+        self.instance_type = intern(instance_type)
+
+    @classmethod
+    def from_response(cls, app: Dict) -> "AppRecord":
+        """Builds the record from a list_apps entry or from reference()"""
+        return cls(
+            domain_id=app["DomainId"],
+            app_type=app["AppType"],
+            app_name=app["AppName"],
+            user_profile_name=app.get("UserProfileName"),
+            space_name=app.get("SpaceName"),
+            status=Status.of(app.get("Status")),
+            instance_type=app.get("ResourceSpec", {}).get("InstanceType"),
+        )
+
+    @property
+    def owner(self) -> str:
+        return self.user_profile_name or self.space_name
+
+    @property
+    def key(self) -> str:
+        return f"{self.owner}/{self.app_type}/{self.app_name}"
+
+    def reference(self) -> Dict:
+        """Arguments of describe_app and delete_app"""
+        reference = {
+            "DomainId": self.domain_id,
+            "AppType": self.app_type,
+            "AppName": self.app_name,
+        }
+        if self.user_profile_name:
+            reference["UserProfileName"] = self.user_profile_name
+        else:
+            reference["SpaceName"] = self.space_name
+        return reference
+
+    def __repr__(self) -> str:
+        return f"AppRecord({self.key}, {self.status and self.status.value})"
+
+
+class SpaceRecord:
+    """The fields of a list_spaces entry used by the handlers"""
+
+    __slots__ = ("domain_id", "space_name", "owner", "status")
+
+    def __init__(
+        self,
+        domain_id: str,
+        space_name: str,
+        owner: Optional[str] = None,
+        status: Optional[Status] = None,
+    ) -> None:
+        self.domain_id = intern(domain_id)
+        self.space_name = space_name
+        self.owner = owner
+        self.status = status
+
+    @classmethod
+    def from_response(cls, space: Dict) -> "SpaceRecord":
+        return cls(
+            domain_id=space["DomainId"],
+            space_name=space["SpaceName"],
+            owner=space.get("OwnershipSettingsSummary", {}).get("OwnerUserProfileName"),
+            status=Status.of(space.get("Status")),
+        )
+
+    def __repr__(self) -> str:
+        return f"SpaceRecord({self.space_name}, {self.status and self.status.value})"
+
+
+def group_by(records: Iterable[T], key: Callable[[T], str]) -> Dict[str, List[T]]:
+    """Groups records in one pass, e.g. group_by(apps, lambda app: app.owner)"""
+    groups: Dict[str, List[T]] = {}
+    for record in records:
+        groups.setdefault(key(record), []).append(record)
+    return groups
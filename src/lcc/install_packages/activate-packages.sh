@@ -0,0 +1,7 @@
+# Make the installed packages importable from the image's python environment,
+# ahead of the image's own site-packages, so that a dependency upgraded into
+# $LCC_SITE_PACKAGES shadows the image's older copy. A plain .pth path would
+# be appended after them.
+mkdir -p "$LCC_SITE_PACKAGES"
+SITE_PACKAGES_DIR=$(python -c "import sysconfig; print(sysconfig.get_paths()['purelib'])")
+echo "import sys; sys.path.insert(0, '$LCC_SITE_PACKAGES')" > "$SITE_PACKAGES_DIR/lcc-packages.pth"
@@ -0,0 +1,31 @@
+# Packages are installed into the space's home volume, so this step is
+# skipped at later app starts until the package list or the image changes.
+# pip resolves the packages against the image's environment and only the
+# distributions the image does not satisfy are installed, with --no-deps,
+# so dependencies the image already has are not copied to the home volume.
+# uv installs them in parallel, images without it fall back to pip. Both
+# keep their cache on the home volume, shared by all lccs.
+export UV_CACHE_DIR="$LCC_CACHE_DIR/uv" PIP_CACHE_DIR="$LCC_CACHE_DIR/pip"
+# emptied first, the packages of an earlier list must not satisfy the new one
+rm -rf "$LCC_SITE_PACKAGES"
+mkdir -p "$LCC_SITE_PACKAGES"
+LCC_PIP_REPORT=$(mktemp)
+pip install --dry-run --quiet --report "$LCC_PIP_REPORT" $PACKAGES
+REQUIREMENTS=$(python -c 'import json, sys
+for item in json.load(open(sys.argv[1]))["install"]:
+    metadata = item["metadata"]
+    direct = item.get("is_direct") and item["download_info"]["url"]
+    print(direct or "{}=={}".format(metadata["name"], metadata["version"]))
+' "$LCC_PIP_REPORT")
+rm -f "$LCC_PIP_REPORT"
+if [ -z "$REQUIREMENTS" ]; then
+	echo "The image already satisfies $PACKAGES."
+elif [ "$INSTALLER" = uv ] && command -v uv >/dev/null; then
+	echo "Installing packages with $(uv --version)."
+	uv pip install --python "$(command -v python)" --no-deps --target "$LCC_SITE_PACKAGES" $REQUIREMENTS
+else
+	if [ "$INSTALLER" = uv ]; then
+		echo "uv not found, installing packages with pip."
+	fi
+	pip install --no-deps --target "$LCC_SITE_PACKAGES" $REQUIREMENTS
+fi
@@ -0,0 +1,15 @@
+# Creating solution directory.
+sudo mkdir -p $SOLUTION_DIR
+
+# Downloading autostop idle Python package, once per space. The archive is
+# kept on the home volume, later app starts install it without network access.
+ASI_ARCHIVE="$LCC_STATE_DIR/$PYTHON_PACKAGE"
+if [ ! -s "$ASI_ARCHIVE" ]; then
+	echo "Downloading autostop idle Python package..."
+	mkdir -p "$LCC_STATE_DIR"
+	curl -fsSL -o "$ASI_ARCHIVE.part" "$ASI_URL"
+	mv "$ASI_ARCHIVE.part" "$ASI_ARCHIVE"
+fi
+# No dependency resolution and no isolated build environment, both download
+# packages, the image already has what the package needs.
+sudo $CONDA_HOME/pip install -U --no-deps --no-build-isolation -t $SOLUTION_DIR "$ASI_ARCHIVE"
@@ -0,0 +1,253 @@
+import csv
+import hashlib
+import importlib.metadata
+import json
+import os
+import re
+from typing import Dict, List, Optional, Set
+
+from aws_cdk import Annotations, App, CfnResource, Names, Stack
+from cdk_nag import AwsSolutionsChecks
+from constructs import Construct
+
+ANNOTATION_TYPES = {
+    "aws:cdk:error": "add_error",
+    "aws:cdk:warning": "add_warning",
+    "aws:cdk:info": "add_info",
+}
+# written by cdk-nag's NagReportLogger as is, its rows are quoted
+REPORT_HEADER = "Rule ID,Resource ID,Compliance,Exception Reason,Rule Level,Rule Info\n"
+SUB_REFERENCE = re.compile(r"\$\{([^}.!]+)")
+
+
+def references(value) -> Set[str]:
+    """Logical ids referenced through Ref, Fn::GetAtt and Fn::Sub"""
+    found: Set[str] = set()
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "Ref" and isinstance(item, str):
+                found.add(item)
+            elif key == "Fn::GetAtt":
+                found.add(item[0] if isinstance(item, list) else item.split(".")[0])
+            elif key == "Fn::Sub":
+                template = item[0] if isinstance(item, list) else item
+                found.update(SUB_REFERENCE.findall(template))
+                found |= references(item)
+            else:
+                found |= references(item)
+    elif isinstance(value, list):
+        for item in value:
+            found |= references(item)
+    return found
+
+
+class ScopedNagChecks:
+    """Runs AwsSolutionsChecks once per distinct resource content
+
+    Constructs created from the same Python class (for example one
+    StudioAppCustomResource per user) often produce identical resources.
+    Results are kept by a fingerprint of the resolved resource properties,
+    the nag suppressions and the properties of the resources it references
+    or that reference it, e.g. the flow logs of a VPC or the policies of a
+    role. A resource with the fingerprint of a resource checked before, in
+    this synth or a previous one through the cache file, gets the annotations
+    and NagReport rows of that check instead of being checked again. Rules
+    that match other resources by anything but a reference are not covered,
+    run nag_mode full before a release.
+
+    This is not registered as an aspect: a Python aspect is called back over
+    jsii for every construct in the app, which costs more than the checks it
+    saves. Call check() once the app is fully built and before app.synth(),
+    and save() after app.synth().
+
+    Args:
+        verbose (bool): forwarded to AwsSolutionsChecks
+        cache_file (str): path of the json cache, disabled if None
+    """
+
+    def __init__(self, verbose: bool = False, cache_file: Optional[str] = None):
+        self._checks = AwsSolutionsChecks(verbose=verbose)
+        self._verbose = verbose
+        self._cache_file = cache_file
+        self._cache: Dict[str, Dict] = self._load_cache()
+        # entries of the resources of this synth, the only ones saved
+        self._results: Dict[str, Dict] = {}
+        self._stacks: Dict[str, Dict] = {}
+        # rows of the NagReport files, which cdk-nag writes for the visited
+        # resources only, by path, and the length read back from each file
+        self._reports: Dict[str, List[List[str]]] = {}
+        self._report_offsets: Dict[str, int] = {}
+        self.checked = 0
+        self.skipped = 0
+        self.cache_hits = 0
+
+    def check(self, scope: Construct) -> None:
+        for construct in scope.node.find_all():
+            if isinstance(construct, CfnResource):
+                self._check_resource(construct)
+
+    def save(self) -> None:
+        """Writes the NagReport csv file of every checked stack and the
+        cache, without the entries no resource matched"""
+        for path, rows in self._reports.items():
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", newline="") as f:
+                f.write(REPORT_HEADER)
+                csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n").writerows(
+                    rows
+                )
+        if not self._cache_file:
+            return
+        with open(self._cache_file, "w") as f:
+            json.dump(self._results, f)
+
+    def _check_resource(self, resource: CfnResource) -> None:
+        stack = Stack.of(resource)
+        fingerprint = self._fingerprint(stack, resource)
+        result = self._results.get(fingerprint)
+        if result is not None:
+            self.skipped += 1
+        else:
+            result = self._cache.get(fingerprint)
+            if result is not None:
+                self.cache_hits += 1
+
+        if result is not None:
+            for annotation_type, message in result["annotations"]:
+                getattr(Annotations.of(resource), ANNOTATION_TYPES[annotation_type])(
+                    message
+                )
+        else:
+            self.checked += 1
+            existing = len(resource.node.metadata)
+            self._checks.visit(resource)
+            result = {
+                "annotations": [
+                    [entry.type, entry.data]
+                    for entry in resource.node.metadata[existing:]
+                    if entry.type in ANNOTATION_TYPES
+                ],
+                # without the resource id, replayed rows get the id of the
+                # resource they are replayed on
+                "report": [
+                    [row[0], *row[2:]]
+                    for row in self._read_report(self._stack(stack)["report_path"])
+                ],
+            }
+
+        self._results[fingerprint] = result
+        self._reports[self._stack(stack)["report_path"]].extend(
+            [row[0], resource.node.path, *row[1:]] for row in result["report"]
+        )
+
+    def _read_report(self, path: str) -> List[List[str]]:
+        """Rows appended to a NagReport file since the last read"""
+        if not os.path.exists(path):
+            return []
+        with open(path, newline="") as f:
+            f.seek(self._report_offsets.get(path, 0))
+            text = f.read()
+            self._report_offsets[path] = f.tell()
+        if text.startswith(REPORT_HEADER):
+            text = text[len(REPORT_HEADER) :]
+        return list(csv.reader(text.splitlines(keepends=True)))
+
+    def _load_cache(self) -> Dict[str, Dict]:
+        if not self._cache_file or not os.path.exists(self._cache_file):
+            return {}
+        try:
+            with open(self._cache_file) as f:
+                cache = json.load(f)
+        except ValueError:
+            return {}
+        # entries of older versions of this class have no report rows
+        return {
+            fingerprint: result
+            for fingerprint, result in cache.items()
+            if isinstance(result, dict)
+        }
+
+    @staticmethod
+    def _cfn_properties(resource: CfnResource) -> Dict:
+        """Properties of the resource as the cdk-nag rules read them
+
+        cfnProperties is the protected getter of CfnResource in the
+        aws-cdk-lib API reference, jsii exposes protected members with a
+        leading underscore. The rendered template, _toCloudFormation, is
+        internal and not exported through jsii. Like the typed properties the
+        rules inspect, cfnProperties leaves out raw property overrides.
+        aws-cdk-lib is pinned in requirements.txt, a missing getter fails the
+        synth instead of caching results under a fingerprint without
+        properties.
+        """
+        try:
+            return resource._cfn_properties
+        except AttributeError:
+            raise RuntimeError(
+                "CfnResource.cfnProperties is not available in this aws-cdk-lib "
+                "version, use nag_mode full"
+            )
+
+    def _stack(self, stack: Stack) -> Dict:
+        """Resolved resources of a stack by logical id, the logical ids that
+        reference each of them and the path of its NagReport"""
+        key = stack.node.path
+        if key in self._stacks:
+            return self._stacks[key]
+
+        resources: Dict[str, Dict] = {}
+        logical_ids: Dict[str, str] = {}
+        referenced_by: Dict[str, Set[str]] = {}
+        for construct in stack.node.find_all():
+            if not isinstance(construct, CfnResource) or Stack.of(construct) != stack:
+                continue
+            logical_id = stack.resolve(construct.logical_id)
+            properties = stack.resolve(self._cfn_properties(construct))
+            resources[logical_id] = {
+                "type": construct.cfn_resource_type,
+                "properties": properties,
+                "suppressions": construct.get_metadata("cdk_nag"),
+                "references": sorted(references(properties)),
+            }
+            logical_ids[construct.node.path] = logical_id
+            for reference in resources[logical_id]["references"]:
+                referenced_by.setdefault(reference, set()).add(logical_id)
+
+        stack_name = Names.unique_id(stack) if stack.nested else stack.stack_name
+        report_path = os.path.join(
+            App.of(stack).outdir,
+            f"{self._checks.read_pack_name}-{stack_name}-NagReport.csv",
+        )
+        self._stacks[key] = {
+            "resources": resources,
+            "logical_ids": logical_ids,
+            "referenced_by": referenced_by,
+            "metadata": stack.resolve(stack.template_options.metadata),
+            "report_path": report_path,
+        }
+        self._reports.setdefault(report_path, [])
+        return self._stacks[key]
+
+    def _fingerprint(self, stack: Stack, resource: CfnResource) -> str:
+        stack_resources = self._stack(stack)
+        resources = stack_resources["resources"]
+        logical_id = stack_resources["logical_ids"][resource.node.path]
+        related = set(resources[logical_id]["references"]) | stack_resources[
+            "referenced_by"
+        ].get(logical_id, set())
+        payload = json.dumps(
+            [
+                resources[logical_id],
+                {
+                    related_id: resources[related_id]
+                    for related_id in related
+                    if related_id in resources
+                },
+                stack_resources["metadata"],
+                self._verbose,
+                importlib.metadata.version("cdk-nag"),
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
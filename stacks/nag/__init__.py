@@ -0,0 +1 @@
+from stacks.nag.ScopedNagChecks import ScopedNagChecks
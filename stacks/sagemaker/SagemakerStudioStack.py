@@ -5,8 +5,11 @@ from cdk_nag import NagPackSuppression, NagSuppressions
 from stacks.sagemaker.constructs import (
     Roles,
     CustomResources,
+    Scheduled,
+    Storage,
 )
-from typing import List
+from stacks.sagemaker.profiles import RESOURCE_PROFILES, ResourceProfile
+from typing import Dict, List, Optional
 
 
 class SagemakerStudioStack(cdk.Stack):
@@ -20,10 +23,45 @@ class SagemakerStudioStack(cdk.Stack):
         vpc_id: str,
         subnet_ids: List[str],
         security_group_id: str,
+        prewarm_user_ids: Optional[List[str]] = None,
+        prewarm_schedule: Optional[str] = None,
+        home_cleanup: bool = False,
+        efs_throughput_mode: Optional[str] = None,
+        efs_provisioned_mibps_per_user: Optional[float] = None,
+        efs_transition_to_ia: Optional[str] = None,
+        efs_transition_to_primary_storage_class: Optional[str] = None,
+        install_packages_in_background: bool = False,
+        package_installer: str = "uv",
+        lcc_canary_user_ids: Optional[List[str]] = None,
+        lcc_canary_min_boots: int = 3,
+        lcc_canary_max_regression_percent: int = 20,
+        lcc_canary_max_hours: int = 72,
+        default_instance_type: str = "ml.t3.medium",
+        resource_profiles: Optional[Dict[str, ResourceProfile]] = None,
+        user_resource_profiles: Optional[Dict[str, str]] = None,
+        teardown_orchestrator: bool = False,
+        teardown_max_concurrency: Optional[Dict[str, int]] = None,
+        auto_stop_idle_sha256: Optional[str] = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        if teardown_orchestrator and home_cleanup:
+            raise ValueError(
+                "teardown_orchestrator replaces the per user teardown, "
+                "home_cleanup needs it"
+            )
+
+        # users without a resource profile follow the domain defaults
+        resource_profiles = {**RESOURCE_PROFILES, **(resource_profiles or {})}
+        user_profiles = {}
+        for user_id, profile_name in (user_resource_profiles or {}).items():
+            if profile_name not in resource_profiles:
+                raise ValueError(f"Invalid resource profile: {profile_name}")
+            if user_id not in user_ids:
+                raise ValueError(f"Unknown user in user_resource_profiles: {user_id}")
+            user_profiles[user_id] = resource_profiles[profile_name]
+
         sagemaker_default_role = Roles.StudioDefaultRole(
             self, "sagemaker-default-role", domain_name=domain_name
         )
@@ -51,9 +89,49 @@ class SagemakerStudioStack(cdk.Stack):
             domain_name=domain_name,
         )
 
+        cr_efs = CustomResources.EfsCustomResource(
+            self,
+            "efs-custom-resource-construct",
+            fs_id=domain.attr_home_efs_file_system_id,
+            throughput_mode=efs_throughput_mode,
+            user_count=len(user_ids) if efs_throughput_mode else None,
+            provisioned_mibps_per_user=efs_provisioned_mibps_per_user,
+            transition_to_ia=efs_transition_to_ia,
+            transition_to_primary_storage_class=efs_transition_to_primary_storage_class,
+        )
+        cr_efs.node.add_dependency(domain)
+
+        home_cleanup_function = None
+        if home_cleanup:
+            home_cleanup_function = Storage.HomeCleanupFunction(
+                self,
+                "home-cleanup",
+                domain_id=domain.attr_domain_id,
+                fs_id=domain.attr_home_efs_file_system_id,
+                vpc_id=vpc_id,
+                subnet_ids=subnet_ids,
+            )
+            # removed after the user profiles and before the file system
+            home_cleanup_function.node.add_dependency(cr_efs)
+
+        profiles = {}
+        spaces = {}
+        space_instance_types = {}
+        lcc_user_resource_profiles = {}
         for user_id in user_ids:
             user_profile_name = f"{workspace_id}-{user_id.lower()}"
             space_name = f"space-{user_profile_name}"
+            resource_profile = user_profiles.get(user_id)
+            ebs_size_gb = resource_profile and resource_profile.ebs_size_gb
+            space_instance_types[space_name] = (
+                resource_profile.instance_type
+                if resource_profile
+                else default_instance_type
+            )
+            if resource_profile:
+                lcc_user_resource_profiles[user_profile_name] = (
+                    resource_profile.settings()
+                )
 
             profile = sagemaker.CfnUserProfile(
                 self,
@@ -63,13 +141,23 @@ class SagemakerStudioStack(cdk.Stack):
                 user_settings=sagemaker.CfnUserProfile.UserSettingsProperty(
                     security_groups=[security_group_id],
                     execution_role=sagemaker_user_iam_role.role_arn,
+                    space_storage_settings=(
+                        sagemaker.CfnUserProfile.DefaultSpaceStorageSettingsProperty(
+                            default_ebs_storage_settings=sagemaker.CfnUserProfile.DefaultEbsStorageSettingsProperty(
+                                default_ebs_volume_size_in_gb=ebs_size_gb,
+                                maximum_ebs_volume_size_in_gb=ebs_size_gb,
+                            )
+                        )
+                        if ebs_size_gb
+                        else None
+                    ),
                 ),
                 tags=[
                     cdk.CfnTag(key="user_id", value=user_id),
                 ],
             )
 
-            sagemaker.CfnSpace(
+            space = sagemaker.CfnSpace(
                 self,
                 space_name,
                 domain_id=domain.attr_domain_id,
@@ -81,40 +169,123 @@ class SagemakerStudioStack(cdk.Stack):
                     app_type="JupyterLab",
                     jupyter_lab_app_settings=sagemaker.CfnSpace.SpaceJupyterLabAppSettingsProperty(
                         default_resource_spec=sagemaker.CfnSpace.ResourceSpecProperty(
-                            instance_type="ml.t3.medium"
+                            instance_type=space_instance_types[space_name]
                         ),
                     ),
+                    space_storage_settings=(
+                        sagemaker.CfnSpace.SpaceStorageSettingsProperty(
+                            ebs_storage_settings=sagemaker.CfnSpace.EbsStorageSettingsProperty(
+                                ebs_volume_size_in_gb=ebs_size_gb
+                            )
+                        )
+                        if ebs_size_gb
+                        else None
+                    ),
                 ),
                 space_sharing_settings=sagemaker.CfnSpace.SpaceSharingSettingsProperty(
                     sharing_type="Private"
                 ),
-            ).node.add_dependency(profile)
+            )
+            space.node.add_dependency(profile)
+            profiles[user_id] = profile
+            spaces[user_id] = space
+            if teardown_orchestrator:
+                continue
 
-            CustomResources.StudioAppCustomResource(
+            cr_studio_app = CustomResources.StudioAppCustomResource(
                 self,
                 f"{user_profile_name}-studio-cr",
                 user_profile_name=user_profile_name,
                 domain_id=domain.attr_domain_id,
                 space_name=space_name,
-            ).node.add_dependency(profile)
+                home_cleanup_function=(
+                    home_cleanup_function and home_cleanup_function.function
+                ),
+            )
+            cr_studio_app.node.add_dependency(profile)
+            if home_cleanup_function:
+                cr_studio_app.node.add_dependency(home_cleanup_function)
+
+        # one state machine execution deletes the resources of all users,
+        # before CloudFormation deletes the profiles, spaces and file system
+        if teardown_orchestrator:
+            teardown = CustomResources.DomainTeardownOrchestrator(
+                self,
+                "domain-teardown-orchestrator",
+                domain_id=domain.attr_domain_id,
+                max_concurrency=teardown_max_concurrency,
+            )
+            teardown.node.add_dependency(cr_efs, *profiles.values(), *spaces.values())
+
+        # updates of the lifecycle configs reach the canary users first
+        lcc_canary = None
+        if lcc_canary_user_ids:
+            lcc_canary = {
+                "user_profile_names": [
+                    profiles[user_id].user_profile_name
+                    for user_id in lcc_canary_user_ids
+                ],
+                "min_boots": lcc_canary_min_boots,
+                "max_regression_percent": lcc_canary_max_regression_percent,
+                "max_hours": lcc_canary_max_hours,
+            }
 
         cr_install_packages = CustomResources.InstallPackagesCustomResource(
             self,
             "install-packages-construct",
             domain_id=domain.attr_domain_id,
+            staging_role=sagemaker_user_iam_role,
+            background=install_packages_in_background,
+            installer=package_installer,
+            canary=lcc_canary,
+            user_resource_profiles=lcc_user_resource_profiles,
         )
 
-        CustomResources.ShutDownIdleAppsCustomResource(
+        cr_shut_down_idle_apps = CustomResources.ShutDownIdleAppsCustomResource(
             self,
             "shut-down-idle-apps-construct",
             domain_id=domain.attr_domain_id,
-        ).node.add_dependency(cr_install_packages)
+            staging_role=sagemaker_user_iam_role,
+            canary=lcc_canary,
+            user_resource_profiles=lcc_user_resource_profiles,
+            instance_type=default_instance_type,
+            auto_stop_idle_sha256=auto_stop_idle_sha256,
+        )
+        cr_shut_down_idle_apps.node.add_dependency(cr_install_packages)
 
-        CustomResources.EfsCustomResource(
-            self,
-            "efs-custom-resource-construct",
-            fs_id=domain.attr_home_efs_file_system_id,
-        ).node.add_dependency(domain)
+        if lcc_user_resource_profiles:
+            # the lifecycle config custom resources update these profiles
+            resource_profile_users = [profiles[user_id] for user_id in user_profiles]
+            cr_install_packages.node.add_dependency(*resource_profile_users)
+            cr_shut_down_idle_apps.node.add_dependency(*resource_profile_users)
+
+        if lcc_canary_user_ids:
+            canary_profiles = [profiles[user_id] for user_id in lcc_canary_user_ids]
+            cr_install_packages.node.add_dependency(*canary_profiles)
+            cr_shut_down_idle_apps.node.add_dependency(*canary_profiles)
+            Scheduled.LccCanaryEvaluator(
+                self,
+                "lcc-canary-evaluator",
+                domain_id=domain.attr_domain_id,
+                script_names=[
+                    cr_install_packages.script.name,
+                    cr_shut_down_idle_apps.script.name,
+                ],
+            )
+
+        if prewarm_user_ids:
+            prewarm_spaces = [spaces[user_id] for user_id in prewarm_user_ids]
+            cr_prewarm_apps = CustomResources.PreWarmAppsCustomResource(
+                self,
+                "prewarm-apps-construct",
+                domain_id=domain.attr_domain_id,
+                space_names=[space.space_name for space in prewarm_spaces],
+                instance_type=default_instance_type,
+                schedule=prewarm_schedule,
+                instance_types=space_instance_types,
+            )
+            # apps must start with both lifecycle configs attached to the domain
+            cr_prewarm_apps.node.add_dependency(cr_shut_down_idle_apps, *prewarm_spaces)
 
         cdk.Tags.of(self).add(key="workspace_id", value=workspace_id)
 
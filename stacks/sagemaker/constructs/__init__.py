@@ -1,2 +1,4 @@
 import stacks.sagemaker.constructs.custom_resources as CustomResources
 import stacks.sagemaker.constructs.roles as Roles
+import stacks.sagemaker.constructs.scheduled as Scheduled
+import stacks.sagemaker.constructs.storage as Storage
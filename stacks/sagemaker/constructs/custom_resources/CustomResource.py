@@ -8,6 +8,7 @@ from aws_cdk.custom_resources import Provider
 from constructs import Construct
 import os
 from typing import Dict
+from stacks.sagemaker.constructs.shared import StudioCommonLayer
 
 
 class CustomResource(Construct):
@@ -18,6 +19,8 @@ class CustomResource(Construct):
         properties: Dict,
         lambda_file_name: str,
         iam_policy: iam.PolicyStatement,
+        total_timeout: cdk.Duration = cdk.Duration.minutes(10),
+        checkpoints: bool = False,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -44,13 +47,17 @@ class CustomResource(Construct):
             initial_policy=[iam_policy],
             timeout=cdk.Duration.minutes(10),
         )
+        StudioCommonLayer.attach(on_event_lambda_fn, checkpoints)
+        StudioCommonLayer.attach(is_complete_lambda_fn, checkpoints)
+        self.on_event_lambda_fn = on_event_lambda_fn
+        self.is_complete_lambda_fn = is_complete_lambda_fn
 
         provider = Provider(
             self,
             "Provider",
             on_event_handler=on_event_lambda_fn,
             is_complete_handler=is_complete_lambda_fn,
-            total_timeout=cdk.Duration.minutes(10),
+            total_timeout=total_timeout,
             log_retention=logs.RetentionDays.ONE_DAY,
         )
 
@@ -0,0 +1,398 @@
+from aws_cdk import (
+    aws_iam as iam,
+    aws_lambda as lambda_,
+    aws_stepfunctions as sfn,
+)
+import aws_cdk as cdk
+from constructs import Construct
+import os
+from typing import Dict, List, Optional
+from stacks.sagemaker.constructs.custom_resources import CustomResource
+from stacks.sagemaker.constructs.shared import StudioCommonLayer
+
+LAMBDA_DIR = "teardown_orchestrator"
+# deletions running at the same time, per resource type
+DEFAULT_MAX_CONCURRENCY = {
+    "apps": 10,
+    "spaces": 10,
+    "user_profiles": 5,
+    "mount_targets": 5,
+    "security_groups": 2,
+}
+# seconds between the describe calls of a resource being deleted
+DEFAULT_WAIT_SECONDS = 10
+# CloudFormation waits up to an hour for a custom resource
+EXECUTION_TIMEOUT = cdk.Duration.hours(1)
+
+# errors of the aws-sdk service integrations are named after the service and
+# the exception class of the AWS SDK for Java, e.g. ResourceNotFound raises
+# SageMaker.ResourceNotFoundException
+RETRY_THROTTLING = {
+    "ErrorEquals": [
+        "SageMaker.ThrottlingException",
+        "Efs.ThrottlingException",
+        "Lambda.TooManyRequestsException",
+        "Lambda.ServiceException",
+    ],
+    "IntervalSeconds": 2,
+    "MaxAttempts": 6,
+    "BackoffRate": 2,
+}
+
+
+def sdk(service: str, action: str) -> str:
+    return f"arn:aws:states:::aws-sdk:{service}:{action}"
+
+
+def status_choice(statuses: List[str], next_state: str) -> Dict:
+    return {
+        "Or": [
+            {"Variable": "$.described.Status", "StringEquals": status}
+            for status in statuses
+        ],
+        "Next": next_state,
+    }
+
+
+def deletion_states(
+    name: str,
+    service: str,
+    delete_action: str,
+    describe_action: str,
+    status_path: str,
+    not_found_error: str,
+    gone_statuses: List[str],
+    wait_seconds: int,
+    retry_statuses: Optional[List[str]] = None,
+    failed_statuses: Optional[List[str]] = None,
+    in_use_error: Optional[str] = None,
+) -> Dict:
+    """Map iterator deleting one resource and describing it until it is gone
+
+    The item is {"resource": <delete and describe parameters>}. A resource
+    that is gone already ends the iteration, one still in use is described
+    until it can be deleted. Statuses in retry_statuses delete it again,
+    those in failed_statuses fail the execution.
+    """
+    gone, wait, failed = f"{name}Gone", f"WaitFor{name}", f"{name}DeleteFailed"
+    delete, describe, check = f"Delete{name}", f"Describe{name}", f"Is{name}Gone"
+    catches = [{"ErrorEquals": [not_found_error], "ResultPath": None, "Next": gone}]
+    if in_use_error:
+        catches.append(
+            {"ErrorEquals": [in_use_error], "ResultPath": None, "Next": wait}
+        )
+    choices = [status_choice(gone_statuses, gone)]
+    if retry_statuses:
+        choices.append(status_choice(retry_statuses, delete))
+    if failed_statuses:
+        choices.append(status_choice(failed_statuses, failed))
+    states = {
+        delete: {
+            "Type": "Task",
+            "Resource": sdk(service, delete_action),
+            "InputPath": "$.resource",
+            "ResultPath": None,
+            "Retry": [RETRY_THROTTLING],
+            "Catch": catches,
+            "Next": wait,
+        },
+        wait: {"Type": "Wait", "Seconds": wait_seconds, "Next": describe},
+        describe: {
+            "Type": "Task",
+            "Resource": sdk(service, describe_action),
+            "InputPath": "$.resource",
+            "ResultSelector": {"Status.$": status_path},
+            "ResultPath": "$.described",
+            "Retry": [RETRY_THROTTLING],
+            "Catch": [
+                {"ErrorEquals": [not_found_error], "ResultPath": None, "Next": gone}
+            ],
+            "Next": check,
+        },
+        check: {"Type": "Choice", "Choices": choices, "Default": wait},
+        gone: {"Type": "Succeed"},
+    }
+    # unreachable states fail the validation of the definition
+    if failed_statuses:
+        states[failed] = {
+            "Type": "Fail",
+            "Error": "DeleteFailed",
+            "Cause": f"{name} deletion failed",
+        }
+    return {"ProcessorConfig": {"Mode": "INLINE"}, "StartAt": delete, "States": states}
+
+
+def map_state(
+    items: str, iterator: Dict, max_concurrency: int, next_state: str
+) -> Dict:
+    return {
+        "Type": "Map",
+        "ItemsPath": f"$.{items}",
+        "ItemSelector": {"resource.$": "$$.Map.Item.Value"},
+        "MaxConcurrency": max_concurrency,
+        "ItemProcessor": iterator,
+        "ResultPath": None,
+        "Next": next_state,
+    }
+
+
+def teardown_definition(
+    inventory_function: str,
+    security_group_function: str,
+    max_concurrency: Optional[Dict[str, int]] = None,
+    wait_seconds: int = DEFAULT_WAIT_SECONDS,
+) -> Dict:
+    """States of the domain teardown, in the order of the dependencies
+    between the resource types
+
+    Args:
+        inventory_function (str): name or arn of the inventory lambda
+        security_group_function (str): name or arn of the lambda deleting
+            one security group
+        max_concurrency (dict): deletions at the same time by resource type,
+            see DEFAULT_MAX_CONCURRENCY
+        wait_seconds (int): seconds between describe calls
+
+    Returns:
+        definition (dict): Amazon States Language definition
+    """
+    concurrency = {**DEFAULT_MAX_CONCURRENCY, **(max_concurrency or {})}
+    sagemaker_deletion = dict(
+        service="sagemaker",
+        status_path="$.Status",
+        not_found_error="SageMaker.ResourceNotFoundException",
+        in_use_error="SageMaker.ResourceInUseException",
+        retry_statuses=["InService"],
+        failed_statuses=["Delete_Failed"],
+        wait_seconds=wait_seconds,
+    )
+    return {
+        "Comment": "Deletes the apps, spaces, user profiles, home file system "
+        "mount targets and NFS security groups of a studio domain",
+        "TimeoutSeconds": int(EXECUTION_TIMEOUT.to_seconds()),
+        "StartAt": "Inventory",
+        "States": {
+            "Inventory": {
+                "Type": "Task",
+                "Resource": "arn:aws:states:::lambda:invoke",
+                "Parameters": {
+                    "FunctionName": inventory_function,
+                    "Payload": {"domain_id.$": "$.domain_id"},
+                },
+                "OutputPath": "$.Payload",
+                "Retry": [RETRY_THROTTLING],
+                "Next": "DeleteApps",
+            },
+            "DeleteApps": map_state(
+                "apps",
+                deletion_states(
+                    "App",
+                    delete_action="deleteApp",
+                    describe_action="describeApp",
+                    gone_statuses=["Deleted", "Failed"],
+                    **sagemaker_deletion,
+                ),
+                concurrency["apps"],
+                "DeleteSpaces",
+            ),
+            "DeleteSpaces": map_state(
+                "spaces",
+                deletion_states(
+                    "Space",
+                    delete_action="deleteSpace",
+                    describe_action="describeSpace",
+                    gone_statuses=["Deleted"],
+                    **sagemaker_deletion,
+                ),
+                concurrency["spaces"],
+                "DeleteUserProfiles",
+            ),
+            "DeleteUserProfiles": map_state(
+                "user_profiles",
+                deletion_states(
+                    "UserProfile",
+                    delete_action="deleteUserProfile",
+                    describe_action="describeUserProfile",
+                    gone_statuses=["Deleted"],
+                    **sagemaker_deletion,
+                ),
+                concurrency["user_profiles"],
+                "DeleteMountTargets",
+            ),
+            "DeleteMountTargets": map_state(
+                "mount_targets",
+                deletion_states(
+                    "MountTarget",
+                    service="efs",
+                    delete_action="deleteMountTarget",
+                    describe_action="describeMountTargets",
+                    status_path="$.MountTargets[0].LifeCycleState",
+                    not_found_error="Efs.MountTargetNotFoundException",
+                    gone_statuses=["deleted"],
+                    wait_seconds=wait_seconds,
+                ),
+                concurrency["mount_targets"],
+                "DeleteSecurityGroups",
+            ),
+            # revoking the rules that reference the other group needs a lambda
+            "DeleteSecurityGroups": map_state(
+                "security_groups",
+                {
+                    "ProcessorConfig": {"Mode": "INLINE"},
+                    "StartAt": "DeleteSecurityGroup",
+                    "States": {
+                        "DeleteSecurityGroup": {
+                            "Type": "Task",
+                            "Resource": "arn:aws:states:::lambda:invoke",
+                            "Parameters": {
+                                "FunctionName": security_group_function,
+                                "Payload.$": "$.resource",
+                            },
+                            "ResultPath": None,
+                            "Retry": [
+                                RETRY_THROTTLING,
+                                # mount target network interfaces are
+                                # released a while after their deletion
+                                {
+                                    "ErrorEquals": ["DependencyViolation"],
+                                    "IntervalSeconds": wait_seconds,
+                                    "MaxAttempts": 10,
+                                    "BackoffRate": 1.5,
+                                },
+                            ],
+                            "End": True,
+                        }
+                    },
+                },
+                concurrency["security_groups"],
+                "TeardownComplete",
+            ),
+            "TeardownComplete": {"Type": "Succeed"},
+        },
+    }
+
+
+class DomainTeardownOrchestrator(CustomResource):
+    """Tears down the studio resources of a domain with a Step Functions
+    state machine when the stack is deleted
+
+    The state machine deletes apps, spaces, user profiles, mount targets of
+    the home file system and its NFS security groups, one Map state per
+    resource type with its own MaxConcurrency. The custom resource starts an
+    execution on delete and waits for it, see teardown_definition.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        domain_id: str,
+        max_concurrency: Optional[Dict[str, int]] = None,
+        wait_seconds: int = DEFAULT_WAIT_SECONDS,
+    ) -> None:
+        for resource_type in max_concurrency or {}:
+            if resource_type not in DEFAULT_MAX_CONCURRENCY:
+                raise ValueError(f"Invalid resource type: {resource_type}")
+        max_concurrency = {**DEFAULT_MAX_CONCURRENCY, **(max_concurrency or {})}
+        state_machine_scope = Construct(scope, f"{construct_id}-state-machine")
+
+        inventory_lambda_fn = self.task_function(
+            state_machine_scope,
+            "InventoryLambda",
+            "index.inventory_handler",
+            [
+                "sagemaker:DescribeDomain",
+                "sagemaker:ListApps",
+                "sagemaker:ListSpaces",
+                "sagemaker:ListUserProfiles",
+                "elasticfilesystem:DescribeMountTargets",
+                "ec2:DescribeSecurityGroups",
+            ],
+        )
+        security_group_lambda_fn = self.task_function(
+            state_machine_scope,
+            "SecurityGroupLambda",
+            "index.security_group_handler",
+            [
+                "ec2:DescribeSecurityGroups",
+                "ec2:RevokeSecurityGroupIngress",
+                "ec2:RevokeSecurityGroupEgress",
+                "ec2:DeleteSecurityGroup",
+            ],
+        )
+
+        state_machine = sfn.StateMachine(
+            state_machine_scope,
+            "StateMachine",
+            definition_body=sfn.DefinitionBody.from_string(
+                cdk.Stack.of(scope).to_json_string(
+                    teardown_definition(
+                        inventory_lambda_fn.function_arn,
+                        security_group_lambda_fn.function_arn,
+                        max_concurrency,
+                        wait_seconds,
+                    )
+                )
+            ),
+            timeout=EXECUTION_TIMEOUT,
+        )
+        state_machine.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "sagemaker:DeleteApp",
+                    "sagemaker:DescribeApp",
+                    "sagemaker:DeleteSpace",
+                    "sagemaker:DescribeSpace",
+                    "sagemaker:DeleteUserProfile",
+                    "sagemaker:DescribeUserProfile",
+                    "elasticfilesystem:DeleteMountTarget",
+                    "elasticfilesystem:DescribeMountTargets",
+                ],
+                resources=["*"],
+            )
+        )
+        inventory_lambda_fn.grant_invoke(state_machine)
+        security_group_lambda_fn.grant_invoke(state_machine)
+        self.state_machine = state_machine
+
+        super().__init__(
+            scope,
+            construct_id,
+            properties={
+                "domain_id": domain_id,
+                "state_machine_arn": state_machine.state_machine_arn,
+                # read by the Plan request type
+                "max_concurrency": max_concurrency,
+                "wait_seconds": wait_seconds,
+            },
+            lambda_file_name=LAMBDA_DIR,
+            iam_policy=iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["states:StartExecution", "states:DescribeExecution"],
+                resources=["*"],
+            ),
+            total_timeout=EXECUTION_TIMEOUT,
+        )
+
+    @staticmethod
+    def task_function(
+        scope: Construct, construct_id: str, handler: str, actions: List[str]
+    ) -> lambda_.Function:
+        function = lambda_.Function(
+            scope,
+            construct_id,
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler=handler,
+            code=lambda_.Code.from_asset(
+                os.path.join(os.getcwd(), "src", "lambda", LAMBDA_DIR)
+            ),
+            initial_policy=[
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW, actions=actions, resources=["*"]
+                )
+            ],
+            timeout=cdk.Duration.minutes(3),
+        )
+        StudioCommonLayer.attach(function)
+        return function
@@ -3,20 +3,43 @@ from aws_cdk import (
 )
 from constructs import Construct
 from stacks.sagemaker.constructs.custom_resources import CustomResource
+from typing import Optional
+
+THROUGHPUT_MODES = ["bursting", "elastic", "provisioned"]
 
 
 class EfsCustomResource(CustomResource):
+    """Tunes the throughput and lifecycle policies of the domain's home file
+    system, provisioned throughput scales with user_count, and deletes the
+    file system with the stack"""
+
     def __init__(
         self,
         scope: Construct,
         construct_id: str,
         fs_id: str,
+        throughput_mode: Optional[str] = None,
+        user_count: Optional[int] = None,
+        provisioned_mibps_per_user: Optional[float] = None,
+        transition_to_ia: Optional[str] = None,
+        transition_to_primary_storage_class: Optional[str] = None,
     ) -> None:
+        if throughput_mode and throughput_mode not in THROUGHPUT_MODES:
+            raise ValueError(f"Invalid throughput_mode: {throughput_mode}")
+
+        properties = {
+            "fs_id": fs_id,
+            "throughput_mode": throughput_mode,
+            "user_count": user_count,
+            "provisioned_mibps_per_user": provisioned_mibps_per_user,
+            "transition_to_ia": transition_to_ia,
+            "transition_to_primary_storage_class": transition_to_primary_storage_class,
+        }
         super().__init__(
             scope,
             construct_id,
             properties={
-                "fs_id": fs_id,
+                key: value for key, value in properties.items() if value is not None
             },
             lambda_file_name="efs_custom_resource",
             iam_policy=iam.PolicyStatement(
@@ -26,7 +49,11 @@ class EfsCustomResource(CustomResource):
                     "elasticfilesystem:DeleteFileSystem",
                     "elasticfilesystem:DescribeMountTargets",
                     "elasticfilesystem:DeleteMountTarget",
+                    "elasticfilesystem:UpdateFileSystem",
+                    "elasticfilesystem:DescribeLifecycleConfiguration",
+                    "elasticfilesystem:PutLifecycleConfiguration",
                 ],
                 resources=["*"],
             ),
+            checkpoints=True,
         )
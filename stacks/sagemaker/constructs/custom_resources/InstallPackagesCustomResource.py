@@ -2,19 +2,70 @@ from aws_cdk import (
     aws_iam as iam,
 )
 from constructs import Construct
-from stacks.sagemaker.constructs.custom_resources import CustomResource
+from typing import Dict, List, Optional
+from stacks.sagemaker.constructs.custom_resources import LifecycleConfigCustomResource
+from stacks.sagemaker.lifecycle import LifecycleScript, LifecycleStep, PERSISTENT
 
+LCC_NAME = "install-packages"
+STEPS_DIR = "src/lcc/install_packages"
+DEFAULT_PACKAGES = ["darts", "pip-install-test"]
+# the script uses the preferred installer if the image has it, pip otherwise
+INSTALLERS = ["uv", "pip"]
+
+
+def install_packages_script(
+    packages: List[str], background: bool = False, installer: str = "uv"
+) -> LifecycleScript:
+    if installer not in INSTALLERS:
+        raise ValueError(f"Invalid installer: {installer}")
+    return LifecycleScript(
+        name=LCC_NAME,
+        variables={
+            "PACKAGES": " ".join(packages),
+            "INSTALLER": installer,
+            "LCC_SITE_PACKAGES": f"/home/sagemaker-user/.lcc-state/{LCC_NAME}/site-packages",
+            "LCC_CACHE_DIR": "/home/sagemaker-user/.lcc-state/cache",
+        },
+        steps=[
+            LifecycleStep.from_file(
+                "pip-install",
+                f"{STEPS_DIR}/pip-install.sh",
+                scope=PERSISTENT,
+                background=background,
+            ),
+            LifecycleStep.from_file(
+                "activate-packages", f"{STEPS_DIR}/activate-packages.sh"
+            ),
+        ],
+    )
+
+
+class InstallPackagesCustomResource(LifecycleConfigCustomResource):
+    """Lifecycle config installing packages into the space's home volume
+
+    With background set, apps open right away and the install runs detached,
+    logging to the app container log, see BACKGROUND_STEP_RUNNER. installer
+    is the preferred installer, one of INSTALLERS.
+    """
 
-class InstallPackagesCustomResource(CustomResource):
     def __init__(
         self,
         scope: Construct,
         construct_id: str,
         domain_id: str,
+        packages: Optional[List[str]] = None,
+        staging_role: Optional[iam.IRole] = None,
+        canary: Optional[Dict] = None,
+        user_resource_profiles: Optional[Dict[str, Dict]] = None,
+        background: bool = False,
+        installer: str = "uv",
     ) -> None:
         super().__init__(
             scope,
             construct_id,
+            script=install_packages_script(
+                packages or DEFAULT_PACKAGES, background, installer
+            ),
             properties={
                 "domain_id": domain_id,
                 "package_lifecycle_config": f"{domain_id}-package-lifecycle-config",
@@ -28,7 +79,11 @@ class InstallPackagesCustomResource(CustomResource):
                     "sagemaker:Describe*",
                     "sagemaker:List*",
                     "sagemaker:UpdateDomain",
+                    "sagemaker:UpdateUserProfile",
                 ],
                 resources=["*"],
             ),
+            staging_role=staging_role,
+            canary=canary,
+            user_resource_profiles=user_resource_profiles,
         )
@@ -0,0 +1,100 @@
+from aws_cdk import (
+    aws_iam as iam,
+    aws_s3_assets as s3_assets,
+)
+from constructs import Construct
+import os
+import tempfile
+from typing import Dict, Optional
+from stacks.sagemaker.constructs.custom_resources import CustomResource
+from stacks.sagemaker.lifecycle import (
+    MAX_CONTENT_LENGTH,
+    LifecycleScript,
+    content_length,
+)
+
+BOOTSTRAP_SCRIPT = """#!/bin/bash
+set -eux
+LCC_SCRIPT=$(mktemp)
+aws s3 cp "{s3_object_url}" "$LCC_SCRIPT"
+bash "$LCC_SCRIPT"
+"""
+
+
+def stage_script(
+    scope: Construct,
+    construct_id: str,
+    name: str,
+    lcc_script: str,
+    staging_role: iam.IRole,
+) -> str:
+    """Stages the script as an S3 asset and returns a bootstrap script that
+    downloads and runs it at app start"""
+    script_path = os.path.join(tempfile.mkdtemp(), f"{name}.sh")
+    with open(script_path, "w") as f:
+        f.write(lcc_script)
+
+    asset = s3_assets.Asset(scope, f"{construct_id}-staged-script", path=script_path)
+    asset.grant_read(staging_role)
+    return BOOTSTRAP_SCRIPT.format(s3_object_url=asset.s3_object_url)
+
+
+class LifecycleConfigCustomResource(CustomResource):
+    """Custom resource creating a studio lifecycle config from a script
+
+    The script is packed into the lcc_script property and its size is checked
+    at synth time. Scripts above the StudioLifecycleConfigContent limit are
+    staged as an S3 asset readable by staging_role and replaced by a small
+    bootstrap script, or rejected if no staging_role is given.
+
+    With canary set, see LccCanaryEvaluator, updates create the new version
+    next to the old one and attach it to the canary users only.
+    user_resource_profiles maps user profile names to ResourceProfile
+    settings, the lcc is added to or removed from their JupyterLab settings.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        script: LifecycleScript,
+        properties: Dict,
+        lambda_file_name: str,
+        iam_policy: iam.PolicyStatement,
+        staging_role: Optional[iam.IRole] = None,
+        canary: Optional[Dict] = None,
+        user_resource_profiles: Optional[Dict[str, Dict]] = None,
+    ) -> None:
+        lcc_script = script.pack()
+
+        if content_length(lcc_script) > MAX_CONTENT_LENGTH:
+            if not staging_role:
+                raise ValueError(
+                    f"lifecycle config {script.name} is {content_length(lcc_script)} "
+                    f"characters encoded, the limit is {MAX_CONTENT_LENGTH}, "
+                    "remove steps or pass a staging_role to stage it on S3"
+                )
+            lcc_script = stage_script(
+                scope, construct_id, script.name, lcc_script, staging_role
+            )
+
+        super().__init__(
+            scope,
+            construct_id,
+            properties={
+                **properties,
+                "lcc_script": lcc_script,
+                "script_name": script.name,
+                "script_version": script.version,
+                **({"canary": canary} if canary else {}),
+                **(
+                    {"user_resource_profiles": user_resource_profiles}
+                    if user_resource_profiles
+                    else {}
+                ),
+            },
+            lambda_file_name=lambda_file_name,
+            iam_policy=iam_policy,
+            checkpoints=True,
+        )
+        self.script = script
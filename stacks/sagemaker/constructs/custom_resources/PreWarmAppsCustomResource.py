@@ -0,0 +1,86 @@
+from aws_cdk import (
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_iam as iam,
+    aws_lambda as lambda_,
+)
+import aws_cdk as cdk
+from constructs import Construct
+import os
+from typing import Dict, List, Optional
+from stacks.sagemaker.constructs.custom_resources import CustomResource
+from stacks.sagemaker.constructs.shared import StudioCommonLayer
+
+
+class PreWarmAppsCustomResource(CustomResource):
+    """Starts the JupyterLab apps of the given spaces after deployment and,
+    if a schedule expression is given, again on that schedule. At most
+    max_concurrency apps are starting at the same time. Each app gets the
+    instance type of its space in instance_types, instance_type otherwise."""
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        domain_id: str,
+        space_names: List[str],
+        instance_type: str = "ml.t3.medium",
+        max_concurrency: int = 5,
+        schedule: Optional[str] = None,
+        instance_types: Optional[Dict[str, str]] = None,
+    ) -> None:
+        properties = {
+            "domain_id": domain_id,
+            "space_names": space_names,
+            "instance_type": instance_type,
+            "instance_types": {
+                space_name: (instance_types or {}).get(space_name, instance_type)
+                for space_name in space_names
+            },
+            "max_concurrency": max_concurrency,
+        }
+        iam_policy = iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=[
+                "sagemaker:CreateApp",
+                "sagemaker:DescribeApp",
+                "sagemaker:ListApps",
+            ],
+            resources=["*"],
+        )
+
+        super().__init__(
+            scope,
+            construct_id,
+            properties=properties,
+            lambda_file_name="studio_prewarm_custom_resource",
+            iam_policy=iam_policy,
+            total_timeout=cdk.Duration.hours(1),
+        )
+
+        if schedule:
+            schedule_lambda_fn = lambda_.Function(
+                self,
+                "ScheduleLambda",
+                runtime=lambda_.Runtime.PYTHON_3_12,
+                handler="index.schedule_handler",
+                code=lambda_.Code.from_asset(
+                    os.path.join(
+                        os.getcwd(), "src", "lambda", "studio_prewarm_custom_resource"
+                    )
+                ),
+                initial_policy=[iam_policy],
+                timeout=cdk.Duration.minutes(15),
+            )
+            StudioCommonLayer.attach(schedule_lambda_fn)
+            events.Rule(
+                self,
+                "ScheduleRule",
+                schedule=events.Schedule.expression(schedule),
+                targets=[
+                    targets.LambdaFunction(
+                        schedule_lambda_fn,
+                        event=events.RuleTargetInput.from_object(properties),
+                    )
+                ],
+            )
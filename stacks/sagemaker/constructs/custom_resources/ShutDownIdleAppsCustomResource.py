@@ -2,22 +2,124 @@ from aws_cdk import (
     aws_iam as iam,
 )
 from constructs import Construct
-from stacks.sagemaker.constructs.custom_resources import CustomResource
+from typing import Dict, Optional
+from stacks.sagemaker.constructs.custom_resources import LifecycleConfigCustomResource
+from stacks.sagemaker.lifecycle import (
+    LifecycleScript,
+    LifecycleStep,
+    VendoredPackage,
+)
+
+LCC_NAME = "shutdown-idle-apps"
+STEPS_DIR = "src/lcc/shutdown_idle_apps"
+ASI_VERSION = "0.3.1"
+SOLUTION_DIR = "/var/tmp/auto-stop-idle"  # Do not use /home/sagemaker-user
+PYTHON_PACKAGE = f"sagemaker_studio_jlab_auto_stop_idle-{ASI_VERSION}.tar.gz"
+
+ASI_URL = f"https://github.com/aws-samples/sagemaker-studio-apps-lifecycle-config-examples/releases/download/v{ASI_VERSION}/{PYTHON_PACKAGE}"
+# sha256 of the release archive committed under src/lcc/vendor/, the default
+# of auto_stop_idle_sha256. Unset, apps download the archive at their first
+# start and keep it on the home volume.
+ASI_SHA256: Optional[str] = None
+
+
+def auto_stop_idle_package(sha256: str) -> VendoredPackage:
+    """The release archive, embedded only if it matches sha256"""
+    return VendoredPackage(
+        package_dir="sagemaker_studio_jlab_auto_stop_idle",
+        archive_name=PYTHON_PACKAGE,
+        url=ASI_URL,
+        sha256=sha256,
+    )
+
+
+HEADER = """
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
 
+# OVERVIEW
+# This script stops a SageMaker Studio JupyterLab app, once it's idle for more than X seconds, based on IDLE_TIME_IN_SECONDS configuration.
+# Note that this script will fail if either condition is not met:
+#   1. The JupyterLab app has internet connectivity at its first start to fetch the autostop idle Python package, unless it is vendored
+#   2. The Studio Domain or User Profile execution role has permissions to SageMaker:DeleteApp to delete the JupyterLab app
+"""
 
-class ShutDownIdleAppsCustomResource(CustomResource):
+
+def shutdown_idle_apps_script(
+    idle_time_in_seconds: int,
+    ignore_connections: bool,
+    skip_terminals: bool,
+    auto_stop_idle_sha256: Optional[str] = None,
+) -> LifecycleScript:
+    auto_stop_idle_sha256 = auto_stop_idle_sha256 or ASI_SHA256
+    if auto_stop_idle_sha256:
+        install_auto_stop_idle = auto_stop_idle_package(
+            auto_stop_idle_sha256
+        ).install_step("install-auto-stop-idle", "$SOLUTION_DIR")
+    else:
+        install_auto_stop_idle = LifecycleStep.from_file(
+            "install-auto-stop-idle", f"{STEPS_DIR}/install-auto-stop-idle.sh"
+        )
+
+    return LifecycleScript(
+        name=LCC_NAME,
+        header=HEADER,
+        variables={
+            "ASI_URL": ASI_URL,
+            # User variables
+            "IDLE_TIME_IN_SECONDS": idle_time_in_seconds,
+            "IGNORE_CONNECTIONS": ignore_connections,
+            "SKIP_TERMINALS": skip_terminals,
+            # System variables
+            "JL_HOSTNAME": "0.0.0.0",
+            "JL_PORT": 8888,
+            "JL_BASE_URL": "/jupyterlab/default/",
+            "CONDA_HOME": "/opt/conda/bin",
+            # Writing to app_container.log delivers logs to CW logs.
+            "LOG_FILE": "/var/log/apps/app_container.log",
+            "SOLUTION_DIR": SOLUTION_DIR,
+            "STATE_FILE": f"{SOLUTION_DIR}/auto_stop_idle.st",
+            "PYTHON_PACKAGE": PYTHON_PACKAGE,
+            "PYTHON_SCRIPT_PATH": f"{SOLUTION_DIR}/sagemaker_studio_jlab_auto_stop_idle/auto_stop_idle.py",
+        },
+        steps=[
+            LifecycleStep.from_file("install-cron", f"{STEPS_DIR}/install-cron.sh"),
+            install_auto_stop_idle,
+            LifecycleStep.from_file(
+                "install-crontab", f"{STEPS_DIR}/install-crontab.sh"
+            ),
+        ],
+    )
+
+
+class ShutDownIdleAppsCustomResource(LifecycleConfigCustomResource):
     def __init__(
         self,
         scope: Construct,
         construct_id: str,
         domain_id: str,
+        idle_time_in_seconds: int = 3600,
+        ignore_connections: bool = True,
+        skip_terminals: bool = False,
+        auto_stop_idle_sha256: Optional[str] = None,
+        staging_role: Optional[iam.IRole] = None,
+        canary: Optional[Dict] = None,
+        user_resource_profiles: Optional[Dict[str, Dict]] = None,
+        instance_type: str = "ml.t3.medium",
     ) -> None:
         super().__init__(
             scope,
             construct_id,
+            script=shutdown_idle_apps_script(
+                idle_time_in_seconds,
+                ignore_connections,
+                skip_terminals,
+                auto_stop_idle_sha256,
+            ),
             properties={
                 "domain_id": domain_id,
                 "app_shutdown_lifecycle_config": f"{domain_id}-apps-shutdown-lifecycle-config",
+                "instance_type": instance_type,
             },
             lambda_file_name="lcc_shutdown_idle_apps_lambda",
             iam_policy=iam.PolicyStatement(
@@ -28,7 +130,11 @@ class ShutDownIdleAppsCustomResource(CustomResource):
                     "sagemaker:Describe*",
                     "sagemaker:List*",
                     "sagemaker:UpdateDomain",
+                    "sagemaker:UpdateUserProfile",
                 ],
                 resources=["*"],
             ),
+            staging_role=staging_role,
+            canary=canary,
+            user_resource_profiles=user_resource_profiles,
         )
@@ -1,8 +1,10 @@
 from aws_cdk import (
     aws_iam as iam,
+    aws_lambda as lambda_,
 )
 from constructs import Construct
 from stacks.sagemaker.constructs.custom_resources import CustomResource
+from typing import Optional
 
 
 class StudioAppCustomResource(CustomResource):
@@ -13,25 +15,37 @@ class StudioAppCustomResource(CustomResource):
         user_profile_name: str,
         domain_id: str,
         space_name: str,
+        home_cleanup_function: Optional[lambda_.IFunction] = None,
     ) -> None:
+        properties = {
+            "user_profile_name": user_profile_name,
+            "domain_id": domain_id,
+            "space_name": space_name,
+        }
+        if home_cleanup_function:
+            properties["home_cleanup_function"] = home_cleanup_function.function_name
+
         super().__init__(
             scope,
             construct_id,
-            properties={
-                "user_profile_name": user_profile_name,
-                "domain_id": domain_id,
-                "space_name": space_name,
-            },
+            properties=properties,
             lambda_file_name="studio_app_custom_resource",
             iam_policy=iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
                 actions=[
                     "sagemaker:ListApps",
                     "sagemaker:ListSpaces",
+                    "sagemaker:DescribeApp",
+                    "sagemaker:DescribeSpace",
+                    "sagemaker:DescribeUserProfile",
                     "sagemaker:DeleteApp",
                     "sagemaker:DeleteSpace",
                     "sagemaker:DeleteUserProfile",
                 ],
                 resources=["*"],
             ),
+            checkpoints=True,
         )
+
+        if home_cleanup_function:
+            home_cleanup_function.grant_invoke(self.is_complete_lambda_fn)
@@ -35,8 +35,10 @@ class VpcCustomResource(CustomResource):
                     "ec2:DeleteVpc",
                     "ec2:DescribeSecurityGroups",
                     "ec2:DescribeVpcs",
+                    "ec2:DescribeNetworkInterfaces",
                     "elasticfilesystem:DescribeFileSystems",
                 ],
                 resources=["*"],
             ),
+            checkpoints=True,
         )
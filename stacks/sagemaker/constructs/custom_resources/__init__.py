@@ -1,6 +1,9 @@
 from stacks.sagemaker.constructs.custom_resources.CustomResource import (
     CustomResource,
 )
+from stacks.sagemaker.constructs.custom_resources.LifecycleConfigCustomResource import (
+    LifecycleConfigCustomResource,
+)
 from stacks.sagemaker.constructs.custom_resources.EfsCustomResource import (
     EfsCustomResource,
 )
@@ -16,3 +19,9 @@ from stacks.sagemaker.constructs.custom_resources.InstallPackagesCustomResource
 from stacks.sagemaker.constructs.custom_resources.VpcCustomResource import (
     VpcCustomResource,
 )
+from stacks.sagemaker.constructs.custom_resources.PreWarmAppsCustomResource import (
+    PreWarmAppsCustomResource,
+)
+from stacks.sagemaker.constructs.custom_resources.DomainTeardownOrchestrator import (
+    DomainTeardownOrchestrator,
+)
@@ -0,0 +1,83 @@
+from aws_cdk import (
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_iam as iam,
+    aws_lambda as lambda_,
+)
+import aws_cdk as cdk
+from constructs import Construct
+import os
+from typing import List
+from stacks.sagemaker.constructs.shared import StudioCommonLayer
+
+
+class LccCanaryEvaluator(Construct):
+    """Scheduled Lambda promoting or rolling back the running lcc canaries of
+    the domain
+
+    It compares the p50 and p95 boot time logged by the new version of a
+    lifecycle script with the old version and promotes the new version to
+    every user once both versions have min_boots boots, or rolls it back if
+    it is slower by more than max_regression_percent.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        domain_id: str,
+        script_names: List[str],
+        schedule: str = "rate(15 minutes)",
+    ) -> None:
+        super().__init__(scope, construct_id)
+
+        evaluator_lambda_fn = lambda_.Function(
+            self,
+            "EvaluatorLambda",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="index.handler",
+            code=lambda_.Code.from_asset(
+                os.path.join(os.getcwd(), "src", "lambda", "lcc_canary")
+            ),
+            initial_policy=[
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=[
+                        "sagemaker:DeleteStudioLifecycleConfig",
+                        "sagemaker:Describe*",
+                        "sagemaker:List*",
+                        "sagemaker:UpdateDomain",
+                        "sagemaker:UpdateUserProfile",
+                    ],
+                    resources=["*"],
+                ),
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["logs:FilterLogEvents"],
+                    resources=[
+                        cdk.Stack.of(self).format_arn(
+                            service="logs",
+                            resource="log-group",
+                            resource_name="/aws/sagemaker/studio:*",
+                            arn_format=cdk.ArnFormat.COLON_RESOURCE_NAME,
+                        )
+                    ],
+                ),
+            ],
+            timeout=cdk.Duration.minutes(10),
+        )
+        StudioCommonLayer.attach(evaluator_lambda_fn, checkpoints=True)
+
+        events.Rule(
+            self,
+            "ScheduleRule",
+            schedule=events.Schedule.expression(schedule),
+            targets=[
+                targets.LambdaFunction(
+                    evaluator_lambda_fn,
+                    event=events.RuleTargetInput.from_object(
+                        {"domain_id": domain_id, "script_names": script_names}
+                    ),
+                )
+            ],
+        )
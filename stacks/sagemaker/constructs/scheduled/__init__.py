@@ -0,0 +1,3 @@
+from stacks.sagemaker.constructs.scheduled.LccCanaryEvaluator import (
+    LccCanaryEvaluator,
+)
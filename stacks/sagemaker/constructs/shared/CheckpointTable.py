@@ -0,0 +1,39 @@
+from aws_cdk import (
+    aws_dynamodb as dynamodb,
+)
+import aws_cdk as cdk
+from cdk_nag import NagPackSuppression, NagSuppressions
+from constructs import Construct
+
+TABLE_ID = "checkpoint-table"
+
+
+class CheckpointTable(dynamodb.Table):
+    """DynamoDB table keeping teardown progress between is_complete polls and
+    the call counters of the lambda rate limiters, created once per stack"""
+
+    def __init__(self, scope: Construct, construct_id: str) -> None:
+        super().__init__(
+            scope,
+            construct_id,
+            partition_key=dynamodb.Attribute(
+                name="request_id", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+        )
+        NagSuppressions.add_resource_suppressions(
+            self,
+            [
+                NagPackSuppression(
+                    id="AwsSolutions-DDB3",
+                    reason="checkpoints and counters expire after a day, no backups needed",
+                )
+            ],
+        )
+
+    @classmethod
+    def of(cls, scope: Construct) -> "CheckpointTable":
+        stack = cdk.Stack.of(scope)
+        return stack.node.try_find_child(TABLE_ID) or cls(stack, TABLE_ID)
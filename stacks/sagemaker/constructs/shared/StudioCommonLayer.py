@@ -0,0 +1,44 @@
+from aws_cdk import (
+    aws_lambda as lambda_,
+)
+import aws_cdk as cdk
+from constructs import Construct
+import os
+from stacks.sagemaker.constructs.shared.CheckpointTable import CheckpointTable
+
+LAYER_ID = "studio-common-layer"
+
+
+class StudioCommonLayer(lambda_.LayerVersion):
+    """Lambda layer with the studio_common package shared by the handlers in
+    src/lambda, created once per stack
+
+    Use attach() to add the layer together with the tables the package
+    expects to a function.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str) -> None:
+        super().__init__(
+            scope,
+            construct_id,
+            code=lambda_.Code.from_asset(
+                os.path.join(os.getcwd(), "src", "lambda_layers", "studio_common")
+            ),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_12],
+        )
+
+    @classmethod
+    def of(cls, scope: Construct) -> "StudioCommonLayer":
+        stack = cdk.Stack.of(scope)
+        return stack.node.try_find_child(LAYER_ID) or cls(stack, LAYER_ID)
+
+    @classmethod
+    def attach(cls, function: lambda_.Function, checkpoints: bool = False) -> None:
+        """Adds the layer to the function and grants it the rate limiter
+        counters and, if checkpoints is set, the teardown checkpoints"""
+        function.add_layers(cls.of(function))
+        table = CheckpointTable.of(function)
+        table.grant_read_write_data(function)
+        function.add_environment("RATE_LIMIT_TABLE_NAME", table.table_name)
+        if checkpoints:
+            function.add_environment("CHECKPOINT_TABLE_NAME", table.table_name)
@@ -0,0 +1,2 @@
+from stacks.sagemaker.constructs.shared.StudioCommonLayer import StudioCommonLayer
+from stacks.sagemaker.constructs.shared.CheckpointTable import CheckpointTable
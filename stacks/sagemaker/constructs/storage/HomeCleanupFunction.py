@@ -0,0 +1,143 @@
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_efs as efs,
+    aws_iam as iam,
+    aws_lambda as lambda_,
+    custom_resources as cr,
+)
+import aws_cdk as cdk
+from constructs import Construct
+import os
+from typing import List
+
+MOUNT_PATH = "/mnt/home"
+NFS_PORT = 2049
+
+
+class HomeCleanupFunction(Construct):
+    """Lambda mounting the domain's home file system to delete the home
+    directories of deleted user profiles
+
+    The function runs in the domain's subnets with its own security group,
+    which is let into the NFS security group SageMaker created for the domain.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        domain_id: str,
+        fs_id: str,
+        vpc_id: str,
+        subnet_ids: List[str],
+    ) -> None:
+        super().__init__(scope, construct_id)
+
+        nfs_security_group_id = cr.AwsCustomResource(
+            self,
+            "NfsSecurityGroupLookup",
+            on_create=cr.AwsSdkCall(
+                service="EC2",
+                action="describeSecurityGroups",
+                parameters={
+                    "Filters": [
+                        {
+                            "Name": "group-name",
+                            "Values": [f"security-group-for-inbound-nfs-{domain_id}"],
+                        },
+                        {"Name": "vpc-id", "Values": [vpc_id]},
+                    ]
+                },
+                physical_resource_id=cr.PhysicalResourceId.of(domain_id),
+                output_paths=["SecurityGroups.0.GroupId"],
+            ),
+            policy=cr.AwsCustomResourcePolicy.from_sdk_calls(
+                resources=cr.AwsCustomResourcePolicy.ANY_RESOURCE
+            ),
+            install_latest_aws_sdk=False,
+        ).get_response_field("SecurityGroups.0.GroupId")
+
+        security_group = ec2.CfnSecurityGroup(
+            self,
+            "SecurityGroup",
+            group_description="Home directory cleanup lambda",
+            vpc_id=vpc_id,
+            security_group_egress=[
+                ec2.CfnSecurityGroup.EgressProperty(
+                    ip_protocol="tcp",
+                    from_port=NFS_PORT,
+                    to_port=NFS_PORT,
+                    destination_security_group_id=nfs_security_group_id,
+                    description="NFS to the domain file system",
+                )
+            ],
+        )
+        nfs_ingress = ec2.CfnSecurityGroupIngress(
+            self,
+            "NfsIngress",
+            group_id=nfs_security_group_id,
+            ip_protocol="tcp",
+            from_port=NFS_PORT,
+            to_port=NFS_PORT,
+            source_security_group_id=security_group.attr_group_id,
+            description="NFS from the home directory cleanup lambda",
+        )
+
+        # the root access point sees the home directories of all users
+        access_point = efs.CfnAccessPoint(
+            self,
+            "AccessPoint",
+            file_system_id=fs_id,
+            posix_user=efs.CfnAccessPoint.PosixUserProperty(uid="0", gid="0"),
+            root_directory=efs.CfnAccessPoint.RootDirectoryProperty(path="/"),
+        )
+
+        self.function = lambda_.Function(
+            self,
+            "CleanupLambda",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="index.handler",
+            code=lambda_.Code.from_asset(
+                os.path.join(os.getcwd(), "src", "lambda", "efs_home_cleanup")
+            ),
+            initial_policy=[
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=[
+                        "elasticfilesystem:ClientMount",
+                        "elasticfilesystem:ClientWrite",
+                        "elasticfilesystem:ClientRootAccess",
+                    ],
+                    resources=[
+                        cdk.Stack.of(self).format_arn(
+                            service="elasticfilesystem",
+                            resource="file-system",
+                            resource_name=fs_id,
+                        )
+                    ],
+                )
+            ],
+            environment={"HOME_ROOT": MOUNT_PATH},
+            memory_size=1024,
+            timeout=cdk.Duration.minutes(5),
+        )
+        self.function.role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name(
+                "service-role/AWSLambdaVPCAccessExecutionRole"
+            )
+        )
+
+        # vpc_id and subnet_ids are tokens of the networking stack, so the vpc
+        # and file system are configured on the underlying CfnFunction
+        cfn_function: lambda_.CfnFunction = self.function.node.default_child
+        cfn_function.vpc_config = lambda_.CfnFunction.VpcConfigProperty(
+            security_group_ids=[security_group.attr_group_id],
+            subnet_ids=subnet_ids,
+        )
+        cfn_function.file_system_configs = [
+            lambda_.CfnFunction.FileSystemConfigProperty(
+                arn=access_point.attr_arn,
+                local_mount_path=MOUNT_PATH,
+            )
+        ]
+        cfn_function.node.add_dependency(nfs_ingress)
@@ -0,0 +1,3 @@
+from stacks.sagemaker.constructs.storage.HomeCleanupFunction import (
+    HomeCleanupFunction,
+)
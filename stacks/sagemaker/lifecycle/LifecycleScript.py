@@ -0,0 +1,213 @@
+import base64
+import gzip
+import hashlib
+import shlex
+from typing import Dict, List, Optional
+from stacks.sagemaker.lifecycle.LifecycleStep import LifecycleStep
+
+# markers of persistent steps live on the space's home volume, which survives
+# app restarts, the marker name holds the step content hash and the image key
+#
+# every step is a boot phase, its start and end go to the app container log
+# as JSON lines, e.g. {"lcc_phase":"pip-install","lcc":"install-packages",
+# "version":"...","event":"end","status":"succeeded","start_ms":...,
+# "end_ms":...,"duration_ms":...}, read by studio_common.boot_report. A step
+# that fails ends the script, the EXIT trap logs its end as failed.
+#
+# LCC_COLD is 1 once a persistent step ran in the foreground, e.g. the first
+# boot after its content changed, TIMING_LINE reports it so that the lcc
+# canary compares warm boots with warm boots.
+STEP_RUNNER = """
+LCC_STATE_DIR=/home/sagemaker-user/.lcc-state/$LCC_NAME
+LCC_IMAGE_KEY=$({ echo "${SAGEMAKER_INTERNAL_IMAGE_URI:-}"; ls /opt/conda/conda-meta 2>/dev/null || true; } | md5sum | cut -c1-16)
+LCC_PHASE_LOG=/var/log/apps/app_container.log
+{ touch "$LCC_PHASE_LOG"; } 2>/dev/null || LCC_PHASE_LOG=/dev/stdout
+LCC_CURRENT_PHASE=
+LCC_CURRENT_PHASE_START=
+LCC_COLD=0
+
+lcc_now_ms() {
+	echo $(($(date +%s%N) / 1000000))
+}
+
+lcc_phase_event() {
+	local -
+	set +x
+	local phase="$1" event="$2" status="$3" start_ms="$4" end_ms="${5:-}"
+	local line="{\\"lcc_phase\\":\\"$phase\\",\\"lcc\\":\\"$LCC_NAME\\",\\"version\\":\\"$LCC_VERSION\\",\\"event\\":\\"$event\\",\\"status\\":\\"$status\\",\\"start_ms\\":$start_ms"
+	if [ -n "$end_ms" ]; then
+		line="$line,\\"end_ms\\":$end_ms,\\"duration_ms\\":$((end_ms - start_ms))"
+	fi
+	echo "$line}" >> "$LCC_PHASE_LOG"
+}
+
+lcc_phase_failed() {
+	if [ -n "$LCC_CURRENT_PHASE" ]; then
+		lcc_phase_event "$LCC_CURRENT_PHASE" end failed "$LCC_CURRENT_PHASE_START" "$(lcc_now_ms)"
+	fi
+}
+trap lcc_phase_failed EXIT
+LCC_START_MS=$(lcc_now_ms)
+
+lcc_run_step() {
+	local name="$1" content_hash="$2" scope="$3"
+	local marker="$LCC_STATE_DIR/$name.$content_hash.$LCC_IMAGE_KEY"
+	local start_ms=$(lcc_now_ms)
+	if [ "$scope" = persistent ] && [ -f "$marker" ]; then
+		echo "Skipping step $name, already done for this image and version."
+		lcc_phase_event "$name" end skipped "$start_ms" "$(lcc_now_ms)"
+		return 0
+	fi
+	lcc_phase_event "$name" start running "$start_ms"
+	LCC_CURRENT_PHASE="$name" LCC_CURRENT_PHASE_START="$start_ms"
+	"lcc_step_${name//-/_}"
+	LCC_CURRENT_PHASE=
+	if [ "$scope" = persistent ]; then
+		mkdir -p "$LCC_STATE_DIR"
+		# only markers have two dots, the lock, status and log files of a
+		# background step are kept
+		rm -f "$LCC_STATE_DIR/$name".*.*
+		touch "$marker"
+		LCC_COLD=1
+	fi
+	lcc_phase_event "$name" end succeeded "$start_ms" "$(lcc_now_ms)"
+}
+""".strip(
+    "\n"
+)
+
+# background steps hold a lock so that a restarted app does not start a second
+# run, their result and duration go to a status file next to the markers and
+# their output to the app container log
+BACKGROUND_STEP_RUNNER = """
+LCC_BACKGROUND_LOG=/var/log/apps/app_container.log
+
+lcc_run_step_background() {
+	local name="$1"
+	local status_file="$LCC_STATE_DIR/$name.status"
+	local log_file="$LCC_BACKGROUND_LOG"
+	mkdir -p "$LCC_STATE_DIR"
+	touch "$log_file" 2>/dev/null || log_file="$LCC_STATE_DIR/$name.log"
+	(
+		set +e
+		renice -n 10 -p "$BASHPID" >/dev/null 2>&1
+		ionice -c 3 -p "$BASHPID" >/dev/null 2>&1
+		exec 9>"$LCC_STATE_DIR/$name.lock"
+		if command -v flock >/dev/null && ! flock -n 9; then
+			echo "$LCC_NAME: step $name is already running"
+			exit 0
+		fi
+		local start=$(date +%s)
+		echo "running $(date -u +%FT%TZ)" > "$status_file"
+		echo "$LCC_NAME: step $name started"
+		(set -e; trap lcc_phase_failed EXIT; lcc_run_step "$@")
+		local rc=$?
+		local result=succeeded
+		[ $rc -eq 0 ] || result=failed
+		local seconds=$(($(date +%s) - start))
+		echo "$result $(date -u +%FT%TZ) ${seconds}s" > "$status_file"
+		echo "$LCC_NAME: step $name $result in ${seconds}s"
+	) </dev/null >>"$log_file" 2>&1 &
+	disown $!
+	echo "Started step $name in the background, status in $status_file."
+}
+""".strip(
+    "\n"
+)
+
+# StudioLifecycleConfigContent is limited to 16384 characters of base64
+MAX_CONTENT_LENGTH = 16384
+
+# the last lines of a successful run, the first one is read back by the lcc
+# canary to compare the boot time of two versions of a script, cold=1 when a
+# persistent step ran
+TIMING_LINE = """
+echo "LCC_TIMING lcc=$LCC_NAME version=$LCC_VERSION seconds=$SECONDS cold=$LCC_COLD"
+lcc_phase_event total end succeeded "$LCC_START_MS" "$(lcc_now_ms)"
+""".strip(
+    "\n"
+)
+
+SELF_EXTRACTING_STUB = """#!/bin/bash
+set -euo pipefail
+LCC_SCRIPT=$(mktemp)
+echo "{payload}" | base64 -d | gunzip > "$LCC_SCRIPT"
+bash "$LCC_SCRIPT"
+"""
+
+
+def content_length(script: str) -> int:
+    return len(base64.b64encode(script.encode()))
+
+
+class LifecycleScript:
+    """Composes a lifecycle config script from variables and steps
+
+    Steps are rendered as bash functions and run in order through
+    lcc_run_step, which skips persistent steps that have already completed.
+    Background steps are started in order and the next steps do not wait
+    for them. A successful run ends by logging its duration and the script
+    version, see TIMING_LINE.
+
+    Args:
+        name (str): script name, separates the skip markers of different lccs
+        steps (list): steps to run in order
+        variables (dict): shell variables defined before the steps
+        header (str): comment placed at the top of the script
+    """
+
+    def __init__(
+        self,
+        name: str,
+        steps: List[LifecycleStep],
+        variables: Optional[Dict[str, str]] = None,
+        header: str = "",
+    ) -> None:
+        self.name = name
+        self.steps = steps
+        self.variables = {"LCC_NAME": name, **(variables or {})}
+        self.header = header.strip("\n")
+
+    def render_variables(self) -> str:
+        return "\n".join(
+            f"{key}={shlex.quote(str(value))}" for key, value in self.variables.items()
+        )
+
+    def render_body(self) -> List[str]:
+        variables = self.render_variables()
+        parts = [variables, STEP_RUNNER]
+        if any(step.background for step in self.steps):
+            parts.append(BACKGROUND_STEP_RUNNER)
+        for step in self.steps:
+            parts.append(f"{step.function_name}() {{\n{step.body}\n}}")
+        parts.append(
+            "\n".join(
+                f"{'lcc_run_step_background' if step.background else 'lcc_run_step'} "
+                f"{step.name} {step.content_hash(variables)} {step.scope}"
+                for step in self.steps
+            )
+        )
+        return parts
+
+    @property
+    def version(self) -> str:
+        """Hash of the variables and steps, changes with every change of the
+        script that could change what runs at app start"""
+        return hashlib.sha256("\n\n".join(self.render_body()).encode()).hexdigest()[:12]
+
+    def render(self) -> str:
+        parts = ["#!/bin/bash", "set -eux"]
+        if self.header:
+            parts.append(self.header)
+        # LCC_VERSION is not part of the variables, it would change the
+        # content hash of every step and with it their markers
+        parts += [f"LCC_VERSION={self.version}", *self.render_body(), TIMING_LINE]
+        return "\n\n".join(parts) + "\n"
+
+    def pack(self) -> str:
+        """Renders the script, as a gzip self-extracting stub if that is
+        smaller than the plain script"""
+        script = self.render()
+        payload = base64.b64encode(gzip.compress(script.encode(), mtime=0)).decode()
+        packed = SELF_EXTRACTING_STUB.format(payload=payload)
+        return packed if len(packed) < len(script) else script
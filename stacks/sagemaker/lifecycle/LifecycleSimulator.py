@@ -0,0 +1,512 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+from stacks.sagemaker.lifecycle.LifecycleScript import LifecycleScript
+
+# absolute paths the scripts use, moved below the sandbox root. The home
+# volume survives app restarts, everything else is the app container's
+SANDBOX_PATHS = [
+    "/home/sagemaker-user",
+    "/var/log/apps",
+    "/var/tmp",
+    "/usr/sbin",
+    "/etc/environment",
+    "/opt/conda",
+]
+HOME_DIR = "home/sagemaker-user"
+SANDBOX_PATTERN = re.compile(
+    r"(?<![\w/.-])(" + "|".join(re.escape(path) for path in SANDBOX_PATHS) + ")"
+)
+
+# commands replaced by stubs, the stubs log their calls, sleep for their
+# latency and exit with their exit code, both set per command through
+# LCC_SIM_LATENCY_<COMMAND> and LCC_SIM_EXIT_<COMMAND>
+STUBBED_COMMANDS = [
+    "sudo",
+    "apt",
+    "apt-get",
+    "dpkg-query",
+    "service",
+    "curl",
+    "pip",
+    "uv",
+    "crontab",
+]
+
+STUB = r"""#!/bin/bash
+name=$(basename "$0")
+key=$(echo "$name" | tr 'a-z-' 'A-Z_')
+latency_var="LCC_SIM_LATENCY_$key" exit_var="LCC_SIM_EXIT_$key"
+start_ms=$(($(date +%s%N) / 1000000))
+sleep "${!latency_var:-0}"
+args="$*" tab=$'\t' newline=$'\n'
+args="${args//\\/\\\\}" args="${args//\"/\\\"}" args="${args//$tab/\\t}" args="${args//$newline/\\n}"
+echo "{\"command\":\"$name\",\"args\":\"$args\",\"start_ms\":$start_ms,\"end_ms\":$(($(date +%s%N) / 1000000))}" >> "$LCC_SIM_ROOT/calls.log"
+rc="${!exit_var:-0}"
+[ "$rc" = 0 ] || exit "$rc"
+
+# the effects the scripts rely on
+case "$name" in
+sudo)
+	exec "$@"
+	;;
+apt | apt-get)
+	if [ "${1:-}" = install ]; then
+		mkdir -p "$LCC_SIM_ROOT/var/lib/dpkg"
+		for package in "${@:2}"; do
+			[[ "$package" = -* ]] || touch "$LCC_SIM_ROOT/var/lib/dpkg/$package"
+		done
+	fi
+	;;
+dpkg-query)
+	package="${!#}"
+	if [ -f "$LCC_SIM_ROOT/var/lib/dpkg/$package" ]; then
+		echo -n installed
+	else
+		echo "dpkg-query: no packages found matching $package" >&2
+		exit 1
+	fi
+	;;
+curl)
+	output_dir=. output= url=
+	while [ $# -gt 0 ]; do
+		case "$1" in
+		--output-dir) output_dir="$2"; shift ;;
+		-o | --output) output="$2"; shift ;;
+		-*) ;;
+		*) url="$1" ;;
+		esac
+		shift
+	done
+	echo "simulated download of $url" > "${output:-$output_dir/$(basename "$url")}"
+	;;
+pip | uv)
+	if [ "${1:-}" = --version ]; then
+		echo "$name 0.0.0 (simulated)"
+		exit 0
+	fi
+	target= report= packages=()
+	while [ $# -gt 0 ]; do
+		case "$1" in
+		-t | --target) target="$2"; shift ;;
+		--report) report="$2"; shift ;;
+		--python) shift ;;
+		pip | install | -*) ;;
+		*) packages+=("$(basename "$1")") ;;
+		esac
+		shift
+	done
+	# a dry run resolves every package to a distribution the image lacks
+	if [ -n "$report" ]; then
+		items=()
+		for package in "${packages[@]}"; do
+			items+=("{\"metadata\":{\"name\":\"$package\",\"version\":\"0.0.0\"}}")
+		done
+		(IFS=,; echo "{\"install\":[${items[*]}]}") > "$report"
+	fi
+	if [ -n "$target" ]; then
+		mkdir -p "$target"
+		for package in "${packages[@]}"; do
+			echo "$package" > "$target/$package.simulated"
+		done
+	fi
+	;;
+crontab)
+	if [ "${1:-}" = - ]; then
+		mkdir -p "$LCC_SIM_ROOT/var/spool/cron"
+		cat > "$LCC_SIM_ROOT/var/spool/cron/root"
+	fi
+	;;
+esac
+"""
+
+# host commands the scripts may use, the only ones on the PATH next to the
+# stubs, so that a host's own pip or curl is never reached
+HOST_COMMANDS = [
+    "base64",
+    "basename",
+    "bash",
+    "cat",
+    "chmod",
+    "cut",
+    "date",
+    "dirname",
+    "flock",
+    "gunzip",
+    "gzip",
+    "ionice",
+    "ls",
+    "md5sum",
+    "mkdir",
+    "mktemp",
+    "mv",
+    "renice",
+    "rm",
+    "sh",
+    "sleep",
+    "tar",
+    "touch",
+    "tr",
+]
+
+# python is real, only the image's site-packages directory is in the sandbox
+PYTHON_STUB = """#!/bin/bash
+if [ "${{1:-}}" = -c ] && [[ "${{2:-}}" == *sysconfig* ]]; then
+	echo "$LCC_SIM_ROOT/opt/conda/lib/site-packages"
+	exit 0
+fi
+exec {python} "$@"
+"""
+
+# files that differ between runs of the same script without meaning a change,
+# and the stubs and host commands
+IGNORED_FILES = re.compile(r"^(bin|tools|boots)/|^calls\.log$|\.(status|lock|log)$")
+
+
+class LifecycleSimulator:
+    """Runs a lifecycle config script offline, in a sandbox directory
+
+    The script's absolute paths are moved below the sandbox root and the
+    system commands it calls are stubs, see STUBBED_COMMANDS, so that it runs
+    without root, network or a Studio app. Every boot starts from a fresh app
+    container directory tree and keeps the home volume, like an app restart.
+
+    Args:
+        script (LifecycleScript): script to run, rendered as the lifecycle
+            config content
+        root (str): sandbox directory, a new temporary directory by default
+        latencies (dict): seconds each call of a stubbed command takes
+        failures (dict): exit codes of stubbed commands that fail
+        image_packages (list): apt packages the image comes with
+        image_commands (list): stubbed commands the image has, all by default
+    """
+
+    def __init__(
+        self,
+        script: LifecycleScript,
+        root: Optional[str] = None,
+        latencies: Optional[Dict[str, float]] = None,
+        failures: Optional[Dict[str, int]] = None,
+        image_packages: Optional[List[str]] = None,
+        image_commands: Optional[List[str]] = None,
+    ) -> None:
+        for command in [*(latencies or {}), *(failures or {})]:
+            if command not in STUBBED_COMMANDS:
+                raise ValueError(f"Invalid stubbed command: {command}")
+        self.script = script
+        self.root = os.path.abspath(root or tempfile.mkdtemp(prefix="lcc-sim-"))
+        os.makedirs(self.root, exist_ok=True)
+        self.latencies = latencies or {}
+        self.failures = failures or {}
+        self.image_packages = image_packages or []
+        self.image_commands = (
+            STUBBED_COMMANDS if image_commands is None else image_commands
+        )
+        self.boots: List[Dict] = []
+
+    def path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def sandboxed(self, content: str) -> str:
+        return SANDBOX_PATTERN.sub(lambda match: self.root + match.group(1), content)
+
+    def reset_container(self) -> None:
+        """Replaces everything but the home volume with a fresh image"""
+        for entry in os.listdir(self.root):
+            if entry in ("home", "boots"):
+                continue
+            if os.path.isdir(self.path(entry)):
+                shutil.rmtree(self.path(entry))
+            else:
+                os.remove(self.path(entry))
+        for directory in [
+            "bin",
+            "tools",
+            "var/log/apps",
+            "var/tmp",
+            "usr/sbin",
+            "opt/conda/bin",
+            "opt/conda/lib/site-packages",
+            "etc",
+        ]:
+            os.makedirs(self.path(directory), exist_ok=True)
+        os.makedirs(self.path(HOME_DIR), exist_ok=True)
+        open(self.path("etc/environment"), "a").close()
+
+        for command in HOST_COMMANDS:
+            if shutil.which(command):
+                os.symlink(shutil.which(command), self.path(f"tools/{command}"))
+        for command in self.image_commands:
+            self.write_executable(f"bin/{command}", STUB)
+        # the shutdown script calls pip through $CONDA_HOME
+        self.write_executable("opt/conda/bin/pip", STUB)
+        self.write_executable("bin/python", PYTHON_STUB.format(python=sys.executable))
+        for package in self.image_packages:
+            os.makedirs(self.path("var/lib/dpkg"), exist_ok=True)
+            open(self.path(f"var/lib/dpkg/{package}"), "w").close()
+
+    def write_executable(self, path: str, content: str) -> None:
+        with open(self.path(path), "w") as f:
+            f.write(content)
+        os.chmod(self.path(path), 0o755)
+
+    def environment(self, failures: Dict[str, int]) -> Dict[str, str]:
+        env = {
+            **os.environ,
+            "PATH": f"{self.path('bin')}:{self.path('tools')}",
+            "LCC_SIM_ROOT": self.root,
+            "AWS_CONTAINER_CREDENTIALS_RELATIVE_URI": "/simulated",
+        }
+        for command, latency in self.latencies.items():
+            env[f"LCC_SIM_LATENCY_{self.key(command)}"] = str(latency)
+        for command, exit_code in {**self.failures, **failures}.items():
+            env[f"LCC_SIM_EXIT_{self.key(command)}"] = str(exit_code)
+        return env
+
+    @staticmethod
+    def key(command: str) -> str:
+        return command.upper().replace("-", "_")
+
+    def wait_for_background_steps(self, since: float, timeout: float) -> None:
+        """Waits until every background step wrote its result after the boot
+        started at since, the status of an earlier boot is still on the home
+        volume until the step's subshell first writes to it"""
+        state_dir = self.path(f"{HOME_DIR}/.lcc-state/{self.script.name}")
+        names = [step.name for step in self.script.steps if step.background]
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            pending = []
+            for name in names:
+                status_file = os.path.join(state_dir, f"{name}.status")
+                if (
+                    not os.path.exists(status_file)
+                    or os.path.getmtime(status_file) < since
+                ):
+                    pending.append(name)
+                    continue
+                with open(status_file) as f:
+                    if f.read().startswith("running"):
+                        pending.append(name)
+            if not pending:
+                return
+            time.sleep(0.1)
+        raise TimeoutError(f"Background steps of {self.script.name} did not finish")
+
+    def read_json_lines(self, path: str, key: str) -> List[Dict]:
+        if not os.path.exists(self.path(path)):
+            return []
+        with open(self.path(path)) as f:
+            lines = [line[line.find("{") :] for line in f if f'{{"{key}"' in line]
+        return [json.loads(line) for line in lines]
+
+    def snapshot(self) -> Dict[str, str]:
+        """Content hash of every file of the sandbox but logs and status files"""
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.relpath(os.path.join(directory, name), self.root)
+                if IGNORED_FILES.search(path):
+                    continue
+                with open(os.path.join(directory, name), "rb") as f:
+                    files[path] = hashlib.sha256(f.read()).hexdigest()
+        return files
+
+    def boot(
+        self, failures: Optional[Dict[str, int]] = None, timeout: float = 300
+    ) -> Dict:
+        """Starts the app once, runs the script and waits for its background
+        steps
+
+        Args:
+            failures (dict): exit codes of stubbed commands that fail at this
+                boot only
+
+        Returns:
+            boot (dict): exit code, seconds, seconds spent in stubs, overhead
+                seconds, phases and calls of stubbed commands
+        """
+        number = len(self.boots) + 1
+        self.reset_container()
+        os.makedirs(self.path("boots"), exist_ok=True)
+        script_path = self.path(f"boots/{number}.sh")
+        with open(script_path, "w") as f:
+            f.write(self.sandboxed(self.script.render()))
+
+        start = time.time()
+        with open(self.path(f"boots/{number}.out"), "w") as output:
+            exit_code = subprocess.run(
+                ["bash", script_path],
+                env=self.environment(failures or {}),
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                timeout=timeout,
+            ).returncode
+        end = time.time()
+        self.wait_for_background_steps(start, timeout)
+
+        # app container logs and call logs do not survive the next boot
+        calls = self.read_json_lines("calls.log", "command")
+        phases = self.read_json_lines("var/log/apps/app_container.log", "lcc_phase")
+        phases += self.read_json_lines(f"boots/{number}.out", "lcc_phase")
+        # a stub logs its latency before it runs the command of a sudo call,
+        # calls of background steps count until the script ended
+        stub_seconds = sum(
+            max(min(call["end_ms"], end * 1000) - call["start_ms"], 0) / 1000
+            for call in calls
+        )
+        boot = {
+            "boot": number,
+            "exit_code": exit_code,
+            "seconds": round(end - start, 3),
+            "stub_seconds": round(stub_seconds, 3),
+            "overhead_seconds": round(max(end - start - stub_seconds, 0), 3),
+            "phases": {
+                event["lcc_phase"]: {
+                    "status": event["status"],
+                    "duration_ms": event["duration_ms"],
+                }
+                for event in phases
+                if event["event"] == "end"
+            },
+            "calls": [f"{call['command']} {call['args']}".strip() for call in calls],
+            "snapshot": self.snapshot(),
+        }
+        self.boots.append(boot)
+        return boot
+
+    def run(self, boots: int = 3) -> Dict:
+        """Boots the app several times and checks that later boots end in the
+        same files as the first one
+
+        Returns:
+            report (dict): the boots, whether all succeeded, whether the
+                script is idempotent and the files that changed
+        """
+        for _ in range(boots):
+            self.boot()
+        first = self.boots[0]["snapshot"]
+        changed = sorted(
+            {
+                path
+                for boot in self.boots[1:]
+                for path in set(first) | set(boot["snapshot"])
+                if first.get(path) != boot["snapshot"].get(path)
+            }
+        )
+        succeeded = all(boot["exit_code"] == 0 for boot in self.boots)
+        return {
+            "lcc": self.script.name,
+            "version": self.script.version,
+            "root": self.root,
+            "succeeded": succeeded,
+            "idempotent": not changed,
+            "changed_files": changed,
+            "boots": [
+                {key: value for key, value in boot.items() if key != "snapshot"}
+                for boot in self.boots
+            ],
+        }
+
+
+def parse_settings(values: List[str], cast) -> Dict:
+    """Turns command=value arguments into a dict"""
+    settings = {}
+    for value in values:
+        command, setting = value.split("=", 1)
+        settings[command] = cast(setting)
+    return settings
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # the custom resources import this package, import them once it is loaded
+    from stacks.sagemaker.constructs.custom_resources.InstallPackagesCustomResource import (
+        DEFAULT_PACKAGES,
+        install_packages_script,
+    )
+    from stacks.sagemaker.constructs.custom_resources.ShutDownIdleAppsCustomResource import (
+        shutdown_idle_apps_script,
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Runs an lcc script offline in a sandbox and reports its boots"
+    )
+    parser.add_argument(
+        "--lcc", choices=["install-packages", "shutdown-idle-apps"], required=True
+    )
+    parser.add_argument("--boots", type=int, default=3, help="number of app starts")
+    parser.add_argument("--root", help="sandbox directory, kept after the run")
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        help="command=seconds of a stubbed command, can be repeated",
+    )
+    parser.add_argument(
+        "--fail",
+        action="append",
+        default=[],
+        help="command=exit code of a stubbed command, can be repeated",
+    )
+    parser.add_argument(
+        "--image-package",
+        action="append",
+        default=[],
+        help="apt package the image comes with, e.g. cron",
+    )
+    parser.add_argument(
+        "--without-uv", action="store_true", help="the image does not have uv"
+    )
+    parser.add_argument(
+        "--background", action="store_true", help="install packages in the background"
+    )
+    parser.add_argument(
+        "--auto-stop-idle-sha256",
+        help="vendor the auto-stop-idle package, sha256 of its release archive",
+    )
+    parser.add_argument(
+        "--max-overhead-seconds",
+        type=float,
+        help="fail if a boot spends more time outside the stubs",
+    )
+    args = parser.parse_args(argv)
+
+    if args.lcc == "install-packages":
+        script = install_packages_script(DEFAULT_PACKAGES, args.background)
+    else:
+        script = shutdown_idle_apps_script(
+            3600, True, False, args.auto_stop_idle_sha256
+        )
+    simulator = LifecycleSimulator(
+        script,
+        root=args.root,
+        latencies=parse_settings(args.latency, float),
+        failures=parse_settings(args.fail, int),
+        image_packages=args.image_package,
+        image_commands=[
+            command
+            for command in STUBBED_COMMANDS
+            if command != "uv" or not args.without_uv
+        ],
+    )
+    report = simulator.run(args.boots)
+    if not args.root:
+        shutil.rmtree(report.pop("root"))
+    report["within_overhead"] = args.max_overhead_seconds is None or all(
+        boot["overhead_seconds"] <= args.max_overhead_seconds
+        for boot in report["boots"]
+    )
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    passed = report["succeeded"] and report["idempotent"] and report["within_overhead"]
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
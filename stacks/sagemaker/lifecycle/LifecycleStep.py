@@ -0,0 +1,43 @@
+import hashlib
+import os
+
+ALWAYS = "always"
+PERSISTENT = "persistent"
+
+
+class LifecycleStep:
+    """A named part of a lifecycle config script
+
+    Args:
+        name (str): step name, used for its skip marker
+        body (str): bash commands of the step
+        scope (str): "always" runs the step at every app start, "persistent"
+            skips it once it has completed for the same content and image,
+            only use it for steps whose effects live on the space's home volume
+        background (bool): run the step detached and niced, the app starts
+            without waiting for it
+    """
+
+    def __init__(
+        self, name: str, body: str, scope: str = ALWAYS, background: bool = False
+    ) -> None:
+        if scope not in (ALWAYS, PERSISTENT):
+            raise ValueError(f"Invalid step scope: {scope}")
+        self.name = name
+        self.body = body.strip("\n")
+        self.scope = scope
+        self.background = background
+
+    @classmethod
+    def from_file(
+        cls, name: str, path: str, scope: str = ALWAYS, background: bool = False
+    ) -> "LifecycleStep":
+        with open(os.path.join(os.getcwd(), path)) as f:
+            return cls(name, f.read(), scope, background)
+
+    @property
+    def function_name(self) -> str:
+        return "lcc_step_" + self.name.replace("-", "_")
+
+    def content_hash(self, variables: str) -> str:
+        return hashlib.sha256(f"{variables}\n{self.body}".encode()).hexdigest()[:16]
@@ -0,0 +1,112 @@
+import base64
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+import urllib.request
+from stacks.sagemaker.lifecycle.LifecycleStep import ALWAYS, LifecycleStep
+
+VENDOR_DIR = "src/lcc/vendor"
+
+
+class VendoredPackage:
+    """A python package embedded into a lifecycle config script at synth time
+
+    The source archive is read from VENDOR_DIR, or downloaded there once if it
+    is missing. Commit the archive to synthesize without network access. The
+    archive must match sha256, a missing or different hash fails the synth,
+    a downloaded archive is only kept once it matches. Only
+    the package's own modules are embedded, installing them at app start needs
+    neither network access nor a pip resolver run, so dependencies must already
+    be present in the image.
+
+    Args:
+        package_dir (str): name of the package directory inside the archive
+        archive_name (str): file name of the source archive
+        url (str): download url of the source archive
+        sha256 (str): expected sha256 of the source archive
+    """
+
+    def __init__(
+        self,
+        package_dir: str,
+        archive_name: str,
+        url: str,
+        sha256: str,
+    ) -> None:
+        if not sha256:
+            raise ValueError(f"sha256 of {archive_name} is required")
+        self.package_dir = package_dir
+        self.archive_name = archive_name
+        self.url = url
+        self.sha256 = sha256
+
+    @property
+    def archive_path(self) -> str:
+        return os.path.join(os.getcwd(), VENDOR_DIR, self.archive_name)
+
+    def verify(self, content: bytes, source: str) -> bytes:
+        digest = hashlib.sha256(content).hexdigest()
+        if digest != self.sha256:
+            raise ValueError(
+                f"sha256 mismatch for {source}: expected {self.sha256}, got {digest}"
+            )
+        return content
+
+    def source_archive(self) -> bytes:
+        if os.path.exists(self.archive_path):
+            with open(self.archive_path, "rb") as f:
+                return self.verify(f.read(), self.archive_path)
+
+        try:
+            with urllib.request.urlopen(self.url, timeout=30) as response:
+                content = self.verify(response.read(), self.url)
+        except OSError as e:
+            raise RuntimeError(
+                f"failed to download {self.url}, place the archive at "
+                f"{self.archive_path} to synthesize offline"
+            ) from e
+        os.makedirs(os.path.dirname(self.archive_path), exist_ok=True)
+        with open(self.archive_path, "wb") as f:
+            f.write(content)
+        return content
+
+    def module_archive(self) -> bytes:
+        """Returns a reproducible tar.gz of the package's python modules, laid
+        out as pip install -t would install them"""
+        output = io.BytesIO()
+        with tarfile.open(
+            fileobj=io.BytesIO(self.source_archive()), mode="r:gz"
+        ) as source, tarfile.open(fileobj=output, mode="w") as target:
+            members = sorted(
+                (member for member in source.getmembers() if member.isfile()),
+                key=lambda member: member.name,
+            )
+            module_count = 0
+            for member in members:
+                parts = member.name.split("/")
+                if self.package_dir not in parts[:-1] or not member.name.endswith(
+                    ".py"
+                ):
+                    continue
+                info = tarfile.TarInfo("/".join(parts[parts.index(self.package_dir) :]))
+                info.size = member.size
+                info.mode = 0o644
+                target.addfile(info, source.extractfile(member))
+                module_count += 1
+        if not module_count:
+            raise ValueError(f"{self.package_dir} not found in {self.archive_path}")
+        return gzip.compress(output.getvalue(), mtime=0)
+
+    def install_step(self, name: str, target_dir: str) -> LifecycleStep:
+        encoded_archive = base64.b64encode(self.module_archive()).decode()
+        return LifecycleStep(
+            name,
+            f"""
+# Installing the vendored {self.package_dir} package.
+sudo mkdir -p {target_dir}
+echo "{encoded_archive}" | base64 -d | sudo tar -xz -C {target_dir}
+""",
+            scope=ALWAYS,
+        )
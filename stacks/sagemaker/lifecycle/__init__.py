@@ -0,0 +1,11 @@
+from stacks.sagemaker.lifecycle.LifecycleStep import (
+    ALWAYS,
+    PERSISTENT,
+    LifecycleStep,
+)
+from stacks.sagemaker.lifecycle.LifecycleScript import (
+    MAX_CONTENT_LENGTH,
+    LifecycleScript,
+    content_length,
+)
+from stacks.sagemaker.lifecycle.VendoredPackage import VendoredPackage
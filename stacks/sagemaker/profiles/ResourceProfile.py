@@ -0,0 +1,69 @@
+from typing import Dict, List, Optional
+from stacks.sagemaker.constructs.custom_resources.InstallPackagesCustomResource import (
+    LCC_NAME as INSTALL_PACKAGES,
+)
+from stacks.sagemaker.constructs.custom_resources.ShutDownIdleAppsCustomResource import (
+    LCC_NAME as SHUTDOWN_IDLE_APPS,
+)
+
+LIFECYCLE_CONFIGS = [INSTALL_PACKAGES, SHUTDOWN_IDLE_APPS]
+
+
+class ResourceProfile:
+    """Instance type, space volume size and lifecycle configs of a group of
+    users
+
+    Args:
+        instance_type (str): default instance type of the users' JupyterLab
+            apps and of their space
+        ebs_size_gb (int): size of the space's EBS volume, SageMaker's
+            default if None
+        lifecycle_configs (list): names of the lifecycle scripts the users
+            can run, one of LIFECYCLE_CONFIGS each, all of them if None
+        default_lifecycle_config (str): the one that runs when the user does
+            not pick one, shutdown-idle-apps if None and included
+    """
+
+    def __init__(
+        self,
+        instance_type: str,
+        ebs_size_gb: Optional[int] = None,
+        lifecycle_configs: Optional[List[str]] = None,
+        default_lifecycle_config: Optional[str] = None,
+    ) -> None:
+        lifecycle_configs = (
+            list(LIFECYCLE_CONFIGS) if lifecycle_configs is None else lifecycle_configs
+        )
+        for name in lifecycle_configs:
+            if name not in LIFECYCLE_CONFIGS:
+                raise ValueError(f"Invalid lifecycle config: {name}")
+        if default_lifecycle_config is None and SHUTDOWN_IDLE_APPS in lifecycle_configs:
+            default_lifecycle_config = SHUTDOWN_IDLE_APPS
+        if (
+            default_lifecycle_config
+            and default_lifecycle_config not in lifecycle_configs
+        ):
+            raise ValueError(
+                f"Default lifecycle config {default_lifecycle_config} "
+                "is not one of the profile's lifecycle configs"
+            )
+        self.instance_type = instance_type
+        self.ebs_size_gb = ebs_size_gb
+        self.lifecycle_configs = lifecycle_configs
+        self.default_lifecycle_config = default_lifecycle_config or ""
+
+    def settings(self) -> Dict:
+        """What the lifecycle config custom resources apply to the users"""
+        return {
+            "instance_type": self.instance_type,
+            "lifecycle_configs": self.lifecycle_configs,
+            "default_lifecycle_config": self.default_lifecycle_config,
+        }
+
+
+RESOURCE_PROFILES = {
+    # notebooks and small queries, no package installs
+    "light": ResourceProfile("ml.t3.medium", lifecycle_configs=[SHUTDOWN_IDLE_APPS]),
+    "data-prep": ResourceProfile("ml.m5.2xlarge", ebs_size_gb=50),
+    "training": ResourceProfile("ml.g5.2xlarge", ebs_size_gb=100),
+}
@@ -0,0 +1,5 @@
+from stacks.sagemaker.profiles.ResourceProfile import (
+    LIFECYCLE_CONFIGS,
+    RESOURCE_PROFILES,
+    ResourceProfile,
+)
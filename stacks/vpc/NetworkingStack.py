@@ -1,6 +1,7 @@
 import aws_cdk as cdk
 from aws_cdk import (
     aws_ec2 as ec2,
+    aws_s3 as s3,
 )
 from constructs import Construct
 from stacks.sagemaker.constructs import (
@@ -11,16 +12,108 @@ from cdk_nag import (
     NagPackSuppression,
 )
 
+MAX_AZS = 3
+
+# services called from the studio apps in the private subnets
+INTERFACE_ENDPOINTS = {
+    "SageMakerApi": ec2.InterfaceVpcEndpointAwsService.SAGEMAKER_API,
+    "SageMakerRuntime": ec2.InterfaceVpcEndpointAwsService.SAGEMAKER_RUNTIME,
+    "SageMakerStudio": ec2.InterfaceVpcEndpointAwsService.SAGEMAKER_STUDIO,
+    "SageMakerNotebook": ec2.InterfaceVpcEndpointAwsService.SAGEMAKER_NOTEBOOK,
+    "Sts": ec2.InterfaceVpcEndpointAwsService.STS,
+    "CloudWatchLogs": ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS,
+}
+GATEWAY_ENDPOINTS = {
+    "S3": ec2.GatewayVpcEndpointAwsService.S3,
+}
+
+FLOW_LOG_DESTINATIONS = ["cloudwatch", "s3"]
+# key prefix read by tools/flow_logs.py
+FLOW_LOG_PREFIX = "flow-logs"
+
 
 class NetworkingStack(cdk.Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    """VPC of the studio domain
+
+    Args:
+        vpc_endpoints (bool): create interface and gateway endpoints, so that
+            AWS API calls from the private subnets do not pass the NAT gateway
+        nat_gateway_per_az (bool): one NAT gateway in each availability zone
+            instead of a single one shared by all zones
+        flow_logs_destination (str): "cloudwatch", or "s3" for Parquet files
+            in hourly, hive compatible partitions
+        flow_logs_traffic_type (str): "ALL", "ACCEPT" or "REJECT"
+        flow_logs_retention_days (int): expiration of the s3 flow logs
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        vpc_endpoints: bool = False,
+        nat_gateway_per_az: bool = False,
+        flow_logs_destination: str = "cloudwatch",
+        flow_logs_traffic_type: str = "ALL",
+        flow_logs_retention_days: int = 30,
+        **kwargs,
+    ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        if flow_logs_destination not in FLOW_LOG_DESTINATIONS:
+            raise ValueError(f"Invalid flow_logs_destination: {flow_logs_destination}")
+        traffic_type = ec2.FlowLogTrafficType[flow_logs_traffic_type]
+
+        if flow_logs_destination == "s3":
+            flow_log_bucket = s3.Bucket(
+                self,
+                "FlowLogBucket",
+                encryption=s3.BucketEncryption.S3_MANAGED,
+                block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                enforce_ssl=True,
+                lifecycle_rules=[
+                    s3.LifecycleRule(
+                        expiration=cdk.Duration.days(flow_logs_retention_days)
+                    )
+                ],
+                removal_policy=cdk.RemovalPolicy.DESTROY,
+                auto_delete_objects=True,
+            )
+            NagSuppressions.add_resource_suppressions(
+                flow_log_bucket,
+                [
+                    NagPackSuppression(
+                        id="AwsSolutions-S1",
+                        reason="flow log bucket, written by the log delivery service",
+                    )
+                ],
+            )
+            self.flow_log_bucket_name = flow_log_bucket.bucket_name
+            cdk.CfnOutput(self, "FlowLogBucketName", value=flow_log_bucket.bucket_name)
+            flow_logs = {
+                "FlowLogsS3": ec2.FlowLogOptions(
+                    destination=ec2.FlowLogDestination.to_s3(
+                        flow_log_bucket,
+                        f"{FLOW_LOG_PREFIX}/",
+                        file_format=ec2.FlowLogFileFormat.PARQUET,
+                        hive_compatible_partitions=True,
+                        per_hour_partition=True,
+                    ),
+                    traffic_type=traffic_type,
+                )
+            }
+        else:
+            flow_logs = {
+                "FlowLogsCW": ec2.FlowLogOptions(
+                    destination=ec2.FlowLogDestination.to_cloud_watch_logs(),
+                    traffic_type=traffic_type,
+                )
+            }
+
         vpc = ec2.Vpc(
             self,
             "PrimaryVPC",
             ip_addresses=ec2.IpAddresses.cidr("10.0.0.0/16"),
-            max_azs=3,
+            max_azs=MAX_AZS,
             subnet_configuration=[
                 ec2.SubnetConfiguration(
                     name="Private",
@@ -33,12 +126,8 @@ class NetworkingStack(cdk.Stack):
             ],
             enable_dns_hostnames=True,
             enable_dns_support=True,
-            nat_gateways=1,
-            flow_logs={
-                "FlowLogsCW": ec2.FlowLogOptions(
-                    destination=ec2.FlowLogDestination.to_cloud_watch_logs()
-                )
-            },
+            nat_gateways=MAX_AZS if nat_gateway_per_az else 1,
+            flow_logs=flow_logs,
         )
 
         # setup security group to be used for sagemaker studio domain
@@ -65,12 +154,32 @@ class NetworkingStack(cdk.Stack):
         self.vpc_id = vpc.vpc_id
         self.subnet_ids = [subnet.subnet_id for subnet in vpc.private_subnets]
 
-        CustomResources.VpcCustomResource(
+        cr_vpc = CustomResources.VpcCustomResource(
             self,
             "vpc-custom-resource-construct",
             vpc_id=vpc.vpc_id,
         )
 
+        if vpc_endpoints:
+            private_subnets = ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
+            )
+            for name, service in INTERFACE_ENDPOINTS.items():
+                endpoint = vpc.add_interface_endpoint(
+                    f"{name}Endpoint",
+                    service=service,
+                    subnets=private_subnets,
+                    security_groups=[security_group],
+                    private_dns_enabled=True,
+                )
+                # the endpoints use the security group, which the vpc custom
+                # resource deletes, so they are removed before it
+                endpoint.node.add_dependency(cr_vpc)
+            for name, service in GATEWAY_ENDPOINTS.items():
+                vpc.add_gateway_endpoint(
+                    f"{name}Endpoint", service=service, subnets=[private_subnets]
+                )
+
         # add cdk nag stack suppression here
         NagSuppressions.add_stack_suppressions(
             stack=self,
@@ -0,0 +1,41 @@
+import importlib.util
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# the lambdas import the layer as a top level package
+sys.path.insert(
+    0, os.path.join(ROOT, "src", "lambda_layers", "studio_common", "python")
+)
+
+from studio_common import checkpoints, rate_limiter  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_store(monkeypatch):
+    """A fresh in memory checkpoint store for every test"""
+    monkeypatch.delenv("CHECKPOINT_TABLE_NAME", raising=False)
+    monkeypatch.setattr(checkpoints, "_store", None)
+    return checkpoints.checkpoint_store()
+
+
+@pytest.fixture
+def load_lambda(monkeypatch):
+    """Loads the index module of a lambda of src/lambda, its rate limited
+    clients are the fakes of clients by service name"""
+
+    def load(name, clients):
+        monkeypatch.setattr(
+            rate_limiter,
+            "rate_limited_client",
+            lambda service, *args, **kwargs: clients[service],
+        )
+        spec = importlib.util.spec_from_file_location(
+            f"{name}_index", os.path.join(ROOT, "src", "lambda", name, "index.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return load
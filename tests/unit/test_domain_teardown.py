@@ -0,0 +1,273 @@
+import time
+import pytest
+from botocore.exceptions import ClientError
+from stacks.sagemaker.constructs.custom_resources.DomainTeardownOrchestrator import (
+    teardown_definition,
+)
+from studio_common.local_states import LocalStateMachine, StatesError
+
+DOMAIN_ID = "d-test"
+WAIT_SECONDS = 10
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "operation")
+
+
+class NotFound(Exception):
+    pass
+
+
+class Paginator:
+    def __init__(self, key, items):
+        self.key, self.items = key, items
+
+    def paginate(self, **kwargs):
+        return [{self.key: self.items}]
+
+
+class FakeSageMaker:
+    """Apps, spaces and user profiles of a domain, deleted resources are
+    Deleting for two describe calls"""
+
+    class exceptions:
+        ResourceNotFound = NotFound
+
+    def __init__(self):
+        self.apps = {"space-a": "InService", "space-b": "InService"}
+        self.spaces = {"space-a": "InService", "space-b": "InService"}
+        self.user_profiles = {"user-a": "InService", "user-b": "InService"}
+        # deleted by someone else right before the teardown deletes them
+        self.in_use = set()
+        self.space_deletes = []
+        self.countdown = {}
+
+    def describe_domain(self, DomainId):
+        return {"HomeEfsFileSystemId": "fs-test", "VpcId": "vpc-test"}
+
+    def get_paginator(self, operation):
+        if operation == "list_apps":
+            return Paginator(
+                "Apps",
+                [
+                    {
+                        "DomainId": DOMAIN_ID,
+                        "SpaceName": space_name,
+                        "AppType": "JupyterLab",
+                        "AppName": "default",
+                        "Status": status,
+                    }
+                    for space_name, status in self.apps.items()
+                ],
+            )
+        if operation == "list_spaces":
+            return Paginator(
+                "Spaces",
+                [
+                    {"SpaceName": name, "Status": status}
+                    for name, status in self.spaces.items()
+                ],
+            )
+        return Paginator(
+            "UserProfiles",
+            [
+                {"UserProfileName": name, "Status": status}
+                for name, status in self.user_profiles.items()
+            ],
+        )
+
+    def delete(self, table, key):
+        if key not in table:
+            raise client_error("ResourceNotFound")
+        if key in self.in_use:
+            self.in_use.remove(key)
+            table[key] = "Deleting"
+            self.countdown[key] = 2
+        if table[key] == "Deleting":
+            raise client_error("ResourceInUse")
+        table[key] = "Deleting"
+        self.countdown[key] = 2
+
+    def describe(self, table, key):
+        if key not in table:
+            raise client_error("ResourceNotFound")
+        if table[key] == "Deleting":
+            self.countdown[key] -= 1
+            if not self.countdown[key]:
+                del table[key]
+                raise client_error("ResourceNotFound")
+        return {"Status": table[key]}
+
+    def delete_app(self, DomainId, SpaceName, AppType, AppName):
+        self.delete(self.apps, SpaceName)
+
+    def describe_app(self, DomainId, SpaceName, AppType, AppName):
+        return self.describe(self.apps, SpaceName)
+
+    def delete_space(self, DomainId, SpaceName):
+        assert not self.apps, "apps are deleted before spaces"
+        self.space_deletes.append(SpaceName)
+        self.delete(self.spaces, SpaceName)
+
+    def describe_space(self, DomainId, SpaceName):
+        return self.describe(self.spaces, SpaceName)
+
+    def delete_user_profile(self, DomainId, UserProfileName):
+        assert not self.spaces, "spaces are deleted before user profiles"
+        self.delete(self.user_profiles, UserProfileName)
+
+    def describe_user_profile(self, DomainId, UserProfileName):
+        return self.describe(self.user_profiles, UserProfileName)
+
+
+class FakeEfs:
+    """Mount targets of the home file system, gone at the first describe
+    after their deletion"""
+
+    class exceptions:
+        FileSystemNotFound = NotFound
+
+    def __init__(self):
+        self.mount_targets = {"fsmt-a": "available", "fsmt-b": "available"}
+
+    def describe_mount_targets(self, FileSystemId=None, MountTargetId=None):
+        if MountTargetId is None:
+            return {
+                "MountTargets": [
+                    {"MountTargetId": mount_target_id, "LifeCycleState": state}
+                    for mount_target_id, state in self.mount_targets.items()
+                ]
+            }
+        self.mount_targets.pop(MountTargetId, None)
+        raise client_error("MountTargetNotFound")
+
+    def delete_mount_target(self, MountTargetId):
+        if MountTargetId not in self.mount_targets:
+            raise client_error("MountTargetNotFound")
+        self.mount_targets[MountTargetId] = "deleting"
+
+
+class FakeEc2:
+    """NFS security groups referencing each other, deleting one fails with
+    DependencyViolation while violations are left, like the network
+    interfaces of deleted mount targets, or while the rules of the other
+    group still reference it"""
+
+    def __init__(self, efs):
+        self.efs = efs
+        self.violations = 0
+        self.delete_calls = 0
+        self.security_groups = {
+            "sg-inbound": {
+                "GroupId": "sg-inbound",
+                "GroupName": f"security-group-for-inbound-nfs-{DOMAIN_ID}",
+                "IpPermissions": [{"UserIdGroupPairs": [{"GroupId": "sg-outbound"}]}],
+                "IpPermissionsEgress": [],
+            },
+            "sg-outbound": {
+                "GroupId": "sg-outbound",
+                "GroupName": f"security-group-for-outbound-nfs-{DOMAIN_ID}",
+                "IpPermissions": [],
+                "IpPermissionsEgress": [
+                    {"UserIdGroupPairs": [{"GroupId": "sg-inbound"}]}
+                ],
+            },
+        }
+
+    def describe_security_groups(self, Filters):
+        filters = {f["Name"]: f["Values"] for f in Filters}
+        return {
+            "SecurityGroups": [
+                sg
+                for sg in self.security_groups.values()
+                if sg["GroupId"] in filters.get("group-id", [sg["GroupId"]])
+                and sg["GroupName"] in filters.get("group-name", [sg["GroupName"]])
+            ]
+        }
+
+    def revoke_security_group_ingress(self, GroupId, IpPermissions):
+        self.security_groups[GroupId]["IpPermissions"] = []
+
+    def revoke_security_group_egress(self, GroupId, IpPermissions):
+        self.security_groups[GroupId]["IpPermissionsEgress"] = []
+
+    def delete_security_group(self, GroupId):
+        assert not self.efs.mount_targets, "mount targets are deleted first"
+        self.delete_calls += 1
+        referenced = any(
+            pair["GroupId"] == GroupId
+            for sg in self.security_groups.values()
+            for rule in sg["IpPermissions"] + sg["IpPermissionsEgress"]
+            for pair in rule["UserIdGroupPairs"]
+        )
+        if self.violations or referenced:
+            self.violations = max(self.violations - 1, 0)
+            raise client_error("DependencyViolation")
+        del self.security_groups[GroupId]
+
+
+@pytest.fixture
+def sagemaker():
+    return FakeSageMaker()
+
+
+@pytest.fixture
+def efs():
+    return FakeEfs()
+
+
+@pytest.fixture
+def ec2(efs):
+    return FakeEc2(efs)
+
+
+@pytest.fixture
+def machine(load_lambda, sagemaker, efs, ec2):
+    orchestrator = load_lambda(
+        "teardown_orchestrator",
+        {"sagemaker": sagemaker, "efs": efs, "ec2": ec2, "stepfunctions": None},
+    )
+    return LocalStateMachine(
+        teardown_definition("inventory", "security-group", wait_seconds=WAIT_SECONDS),
+        functions={
+            "inventory": orchestrator.inventory_handler,
+            "security-group": orchestrator.security_group_handler,
+        },
+        clients={"sagemaker": sagemaker, "efs": efs},
+        # waits and retries take a ten thousandth of their time, so that the
+        # iterations of a Map state still interleave
+        sleep=lambda seconds: time.sleep(seconds / 10000),
+    )
+
+
+def test_teardown_deletes_every_resource_type(machine, sagemaker, efs, ec2):
+    machine.execute({"domain_id": DOMAIN_ID})
+    assert not sagemaker.apps and not sagemaker.spaces
+    assert not sagemaker.user_profiles
+    assert not efs.mount_targets and not ec2.security_groups
+    assert machine.history[-1] == "TeardownComplete"
+
+
+def test_teardown_waits_for_a_resource_in_use(machine, sagemaker):
+    sagemaker.in_use.add("space-b")
+    machine.execute({"domain_id": DOMAIN_ID})
+    assert not sagemaker.spaces
+    # ResourceInUse is caught, the space is described until it is gone and
+    # not deleted a second time
+    assert not sagemaker.in_use
+    assert sagemaker.space_deletes.count("space-b") == 1
+
+
+def test_teardown_retries_security_groups_in_use(machine, ec2):
+    ec2.violations = 3
+    machine.execute({"domain_id": DOMAIN_ID})
+    assert not ec2.security_groups
+    assert not ec2.violations
+    assert ec2.delete_calls >= 2 + 3
+
+
+def test_teardown_fails_once_security_group_retries_run_out(machine, ec2):
+    ec2.violations = 100
+    with pytest.raises(StatesError) as raised:
+        machine.execute({"domain_id": DOMAIN_ID})
+    assert raised.value.error == "DependencyViolation"
@@ -0,0 +1,205 @@
+import pytest
+from studio_common import canary, lcc_settings
+from studio_common.checkpoints import now
+
+DOMAIN_ID = "d-test"
+SCRIPT_NAME = "install-packages"
+LCC_ARN_PREFIX = "arn:aws:sagemaker:us-east-1:123456789012:studio-lifecycle-config/"
+OLD_ARN = f"{LCC_ARN_PREFIX}install-packages"
+NEW_ARN = f"{LCC_ARN_PREFIX}install-packages-v2"
+CONFIG = {
+    "user_profile_names": ["canary-user"],
+    "min_boots": 3,
+    "max_regression_percent": 20,
+    "max_hours": 72,
+}
+
+
+class ResourceNotFound(Exception):
+    pass
+
+
+class FakeSageMaker:
+    """Lifecycle configs and JupyterLab settings of a domain"""
+
+    class exceptions:
+        ResourceNotFound = ResourceNotFound
+
+    def __init__(self):
+        self.lccs = {lcc_settings.lcc_name(arn) for arn in [OLD_ARN, NEW_ARN]}
+        self.domain = {"LifecycleConfigArns": [OLD_ARN]}
+        self.profiles = {"canary-user": None, "other-user": None}
+
+    def delete_studio_lifecycle_config(self, StudioLifecycleConfigName):
+        if StudioLifecycleConfigName not in self.lccs:
+            raise ResourceNotFound(StudioLifecycleConfigName)
+        self.lccs.remove(StudioLifecycleConfigName)
+
+    def describe_studio_lifecycle_config(self, StudioLifecycleConfigName):
+        if StudioLifecycleConfigName not in self.lccs:
+            raise ResourceNotFound(StudioLifecycleConfigName)
+        return {"StudioLifecycleConfigName": StudioLifecycleConfigName}
+
+    def describe_domain(self, DomainId):
+        return {"DefaultUserSettings": {"JupyterLabAppSettings": self.domain}}
+
+    def update_domain(self, DomainId, DefaultUserSettings):
+        self.domain = DefaultUserSettings["JupyterLabAppSettings"]
+
+    def describe_user_profile(self, DomainId, UserProfileName):
+        settings = self.profiles[UserProfileName]
+        return {"UserSettings": {"JupyterLabAppSettings": settings} if settings else {}}
+
+    def update_user_profile(self, DomainId, UserProfileName, UserSettings):
+        self.profiles[UserProfileName] = UserSettings["JupyterLabAppSettings"]
+
+    def get_paginator(self, operation):
+        profiles = [{"UserProfileName": name} for name in self.profiles]
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                return [{"UserProfiles": profiles}]
+
+        return Paginator()
+
+
+class FakeLogs:
+    """Filtered events of the studio log group, one page"""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def get_paginator(self, operation):
+        events = [{"message": message} for message in self.messages]
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                return [{"events": events}]
+
+        return Paginator()
+
+
+@pytest.fixture
+def sagemaker(monkeypatch):
+    fake = FakeSageMaker()
+    monkeypatch.setattr(lcc_settings, "_sm_client", fake)
+    return fake
+
+
+@pytest.fixture
+def lcc_canary(load_lambda):
+    return load_lambda("lcc_canary", {"logs": None})
+
+
+@pytest.fixture
+def state(sagemaker):
+    return canary.start(DOMAIN_ID, SCRIPT_NAME, OLD_ARN, NEW_ARN, "v1", "v2", CONFIG)
+
+
+def test_evaluate_waits_for_boots_of_the_new_version(lcc_canary, state):
+    promote, report = lcc_canary.evaluate(state, {"v1": [40, 41, 42], "v2": [40]})
+    assert promote is None
+    assert report["new"]["boots"] == 1
+
+
+def test_evaluate_waits_for_a_baseline(lcc_canary, state):
+    promote, _ = lcc_canary.evaluate(state, {"v2": [40, 41, 42]})
+    assert promote is None
+
+
+def test_evaluate_promotes_without_a_baseline_once_expired(lcc_canary, state):
+    state["started_at"] = now() - (CONFIG["max_hours"] + 1) * 60 * 60
+    promote, report = lcc_canary.evaluate(state, {"v2": [40, 41, 42]})
+    assert promote is True
+    assert report["expired"]
+    assert report["warning"] == "promoted without boots to compare"
+
+
+def test_evaluate_compares_the_boots_available_once_expired(lcc_canary, state):
+    state["started_at"] = now() - (CONFIG["max_hours"] + 1) * 60 * 60
+    promote, report = lcc_canary.evaluate(state, {"v1": [40], "v2": [90]})
+    assert promote is False
+    assert report["regressions"] == ["p50", "p95"]
+
+
+def test_evaluate_rolls_back_a_regression(lcc_canary, state):
+    promote, report = lcc_canary.evaluate(
+        state, {"v1": [40, 40, 40, 40], "v2": [40, 40, 40, 90]}
+    )
+    assert promote is False
+    assert report["regressions"] == ["p95"]
+
+
+def test_evaluate_promotes_within_the_regression_limit(lcc_canary, state):
+    promote, report = lcc_canary.evaluate(
+        state, {"v1": [40, 40, 40, 40], "v2": [44, 44, 44, 48]}
+    )
+    assert promote is True
+    assert report["regressions"] == []
+
+
+def test_evaluate_promotes_despite_the_cold_first_boots(load_lambda, state):
+    # the only difference of the new version is the pip install at the first
+    # boot of every canary user after the package list changed
+    messages = [
+        f"LCC_TIMING lcc={SCRIPT_NAME} version=v1 seconds={seconds} cold=0"
+        for seconds in [40, 41, 42, 40]
+    ] + [
+        f"LCC_TIMING lcc={SCRIPT_NAME} version=v2 seconds=300 cold=1",
+        f"+ echo 'LCC_TIMING lcc={SCRIPT_NAME} version=v2 seconds=300 cold=1'",
+        *(
+            f"LCC_TIMING lcc={SCRIPT_NAME} version=v2 seconds={seconds} cold=0"
+            for seconds in [41, 40, 42]
+        ),
+    ]
+    lcc_canary = load_lambda("lcc_canary", {"logs": FakeLogs(messages)})
+    timings = lcc_canary.boot_timings(DOMAIN_ID, SCRIPT_NAME, state["started_at"])
+    assert timings == {"v1": [40, 41, 42, 40], "v2": [41, 40, 42]}
+    promote, report = lcc_canary.evaluate(state, timings)
+    assert promote is True
+    assert report["regressions"] == []
+
+
+def test_boot_timings_count_runs_without_the_cold_flag_as_warm(load_lambda):
+    messages = [f"LCC_TIMING lcc={SCRIPT_NAME} version=v1 seconds=40"]
+    lcc_canary = load_lambda("lcc_canary", {"logs": FakeLogs(messages)})
+    assert lcc_canary.boot_timings(DOMAIN_ID, SCRIPT_NAME, 0) == {"v1": [40]}
+
+
+def test_start_attaches_the_new_version_to_the_canary_users(sagemaker, state):
+    assert sagemaker.profiles["canary-user"]["LifecycleConfigArns"] == [NEW_ARN]
+    assert sagemaker.profiles["other-user"] is None
+    assert canary.running(DOMAIN_ID, SCRIPT_NAME) == state
+
+
+def test_finish_promotes_the_new_version_everywhere(sagemaker, state):
+    canary.finish(state, promote=True)
+    assert sagemaker.domain["LifecycleConfigArns"] == [NEW_ARN]
+    assert sagemaker.profiles["canary-user"]["LifecycleConfigArns"] == [NEW_ARN]
+    assert sagemaker.lccs == {lcc_settings.lcc_name(NEW_ARN)}
+    assert canary.get(DOMAIN_ID, SCRIPT_NAME)["status"] == canary.PROMOTED
+    assert canary.current(DOMAIN_ID, SCRIPT_NAME, NEW_ARN, "v2") == (NEW_ARN, "v2")
+
+
+def test_finish_rolls_back_the_canary_users(sagemaker, state):
+    canary.finish(state, promote=False)
+    assert sagemaker.domain["LifecycleConfigArns"] == [OLD_ARN]
+    assert sagemaker.profiles["canary-user"]["LifecycleConfigArns"] == [OLD_ARN]
+    assert sagemaker.lccs == {lcc_settings.lcc_name(OLD_ARN)}
+    assert canary.running(DOMAIN_ID, SCRIPT_NAME) is None
+    # the physical resource id still names the rolled back version
+    assert canary.current(DOMAIN_ID, SCRIPT_NAME, NEW_ARN, "v2") == (OLD_ARN, "v1")
+
+
+def test_delete_after_a_rollback_deletes_the_version_users_run(
+    load_lambda, sagemaker, state
+):
+    canary.finish(state, promote=False)
+    install_packages = load_lambda(
+        "lcc_install_packages_lambda", {"sagemaker": sagemaker}
+    )
+    result = install_packages.on_delete(
+        DOMAIN_ID, "install-packages", NEW_ARN, SCRIPT_NAME
+    )
+    assert result["Status"] == "SUCCESS"
+    assert sagemaker.lccs == set()
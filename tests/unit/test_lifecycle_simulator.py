@@ -0,0 +1,46 @@
+import pytest
+from stacks.sagemaker.constructs.custom_resources.InstallPackagesCustomResource import (
+    DEFAULT_PACKAGES,
+    install_packages_script,
+)
+from stacks.sagemaker.constructs.custom_resources.ShutDownIdleAppsCustomResource import (
+    shutdown_idle_apps_script,
+)
+from stacks.sagemaker.lifecycle.LifecycleSimulator import LifecycleSimulator
+
+SCRIPTS = {
+    "install-packages": lambda: install_packages_script(DEFAULT_PACKAGES),
+    "install-packages-background": lambda: install_packages_script(
+        DEFAULT_PACKAGES, background=True
+    ),
+    "shutdown-idle-apps": lambda: shutdown_idle_apps_script(3600, True, False),
+}
+
+
+@pytest.mark.parametrize("name", SCRIPTS)
+def test_restarts_are_idempotent(name, tmp_path):
+    report = LifecycleSimulator(SCRIPTS[name](), root=str(tmp_path)).run(boots=2)
+    assert [boot["exit_code"] for boot in report["boots"]] == [0, 0]
+    assert report["succeeded"]
+    assert report["idempotent"], report["changed_files"]
+
+
+def test_failed_install_is_retried_at_the_next_boot(tmp_path):
+    simulator = LifecycleSimulator(
+        install_packages_script(DEFAULT_PACKAGES), root=str(tmp_path)
+    )
+    assert simulator.boot(failures={"uv": 1})["exit_code"] != 0
+    boot = simulator.boot()
+    assert boot["exit_code"] == 0
+    assert any(call.startswith("uv ") for call in boot["calls"])
+
+
+def test_auto_stop_idle_is_downloaded_once_per_space(tmp_path):
+    report = LifecycleSimulator(
+        shutdown_idle_apps_script(3600, True, False), root=str(tmp_path)
+    ).run(boots=2)
+    downloads = [
+        [call for call in boot["calls"] if call.startswith("curl ")]
+        for boot in report["boots"]
+    ]
+    assert [len(calls) for calls in downloads] == [1, 0]
@@ -0,0 +1,131 @@
+import pytest
+from stacks.sagemaker.profiles.ResourceProfile import RESOURCE_PROFILES
+from studio_common import lcc_settings
+
+DOMAIN_ID = "d-test"
+LCC_NAME = f"{DOMAIN_ID}-app-shutdown-lifecycle-config"
+LCC_ARN = f"arn:aws:sagemaker:us-east-1:123456789012:studio-lifecycle-config/{LCC_NAME}"
+
+
+class ResourceNotFound(Exception):
+    pass
+
+
+class FakeSageMaker:
+    """Lifecycle configs and JupyterLab settings of a domain"""
+
+    class exceptions:
+        ResourceNotFound = ResourceNotFound
+
+    def __init__(self):
+        self.lccs = {LCC_NAME}
+        self.domain = {
+            "LifecycleConfigArns": [LCC_ARN],
+            "DefaultResourceSpec": {
+                "LifecycleConfigArn": LCC_ARN,
+                "InstanceType": "ml.t3.medium",
+            },
+        }
+        self.profiles = {"user-a": None, "user-b": None}
+
+    def create_studio_lifecycle_config(self, StudioLifecycleConfigName, **kwargs):
+        self.lccs.add(StudioLifecycleConfigName)
+        return {"StudioLifecycleConfigArn": LCC_ARN}
+
+    def delete_studio_lifecycle_config(self, StudioLifecycleConfigName):
+        if StudioLifecycleConfigName not in self.lccs:
+            raise ResourceNotFound(StudioLifecycleConfigName)
+        self.lccs.remove(StudioLifecycleConfigName)
+
+    def describe_domain(self, DomainId):
+        return {"DefaultUserSettings": {"JupyterLabAppSettings": self.domain}}
+
+    def update_domain(self, DomainId, DefaultUserSettings):
+        self.domain = DefaultUserSettings["JupyterLabAppSettings"]
+
+    def describe_user_profile(self, DomainId, UserProfileName):
+        if UserProfileName not in self.profiles:
+            raise ResourceNotFound(UserProfileName)
+        settings = self.profiles[UserProfileName]
+        return {"UserSettings": {"JupyterLabAppSettings": settings} if settings else {}}
+
+    def update_user_profile(self, DomainId, UserProfileName, UserSettings):
+        self.profiles[UserProfileName] = UserSettings["JupyterLabAppSettings"]
+
+
+@pytest.fixture
+def sagemaker(monkeypatch):
+    fake = FakeSageMaker()
+    monkeypatch.setattr(lcc_settings, "_sm_client", fake)
+    return fake
+
+
+@pytest.fixture
+def shutdown_idle_apps(load_lambda, sagemaker):
+    return load_lambda("lcc_shutdown_idle_apps_lambda", {"sagemaker": sagemaker})
+
+
+def update_event(old_profiles, new_profiles):
+    properties = {
+        "domain_id": DOMAIN_ID,
+        "app_shutdown_lifecycle_config": LCC_NAME,
+        "lcc_script": "#!/bin/bash",
+        "script_name": "shutdown-idle-apps",
+        "script_version": "v1",
+    }
+    return {
+        "RequestType": "Update",
+        "PhysicalResourceId": LCC_ARN,
+        "ResourceProperties": {
+            **properties,
+            "user_resource_profiles": {
+                name: RESOURCE_PROFILES[profile].settings()
+                for name, profile in new_profiles.items()
+            },
+        },
+        "OldResourceProperties": {
+            **properties,
+            "user_resource_profiles": {
+                name: RESOURCE_PROFILES[profile].settings()
+                for name, profile in old_profiles.items()
+            },
+        },
+    }
+
+
+def test_update_applies_the_resource_profiles(shutdown_idle_apps, sagemaker):
+    event = update_event({}, {"user-a": "training"})
+    assert shutdown_idle_apps.on_event_handler(event, None)["Status"] == "SUCCESS"
+    assert sagemaker.profiles["user-a"] == {
+        "LifecycleConfigArns": [LCC_ARN],
+        "DefaultResourceSpec": {
+            "LifecycleConfigArn": LCC_ARN,
+            "InstanceType": "ml.g5.2xlarge",
+        },
+    }
+    assert sagemaker.profiles["user-b"] is None
+
+
+def test_update_resets_users_taken_out_of_the_resource_profiles(
+    shutdown_idle_apps, sagemaker
+):
+    shutdown_idle_apps.on_event_handler(
+        update_event({}, {"user-a": "training", "user-b": "light"}), None
+    )
+    sagemaker.profiles["user-a"]["CustomImages"] = [{"ImageName": "kept"}]
+
+    event = update_event({"user-a": "training", "user-b": "light"}, {"user-b": "light"})
+    assert shutdown_idle_apps.on_event_handler(event, None)["Status"] == "SUCCESS"
+    # back on the domain's instance type and lccs, other settings are kept
+    assert sagemaker.profiles["user-a"] == {
+        **sagemaker.domain,
+        "CustomImages": [{"ImageName": "kept"}],
+    }
+    assert sagemaker.profiles["user-b"]["DefaultResourceSpec"]["InstanceType"] == (
+        "ml.t3.medium"
+    )
+
+
+def test_reset_skips_deleted_user_profiles(sagemaker):
+    lcc_settings.reset_resource_profiles(DOMAIN_ID, ["deleted-user", "user-a"])
+    assert sagemaker.profiles["user-a"] == sagemaker.domain
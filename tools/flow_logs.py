@@ -0,0 +1,190 @@
+"""Local query helper for VPC flow logs delivered to S3 as Parquet
+
+Only the hourly partitions of the requested time range are listed and read,
+and only the columns the query needs:
+
+    python tools/flow_logs.py --bucket <FlowLogBucket> \
+        --start 2024-01-01T08 --end 2024-01-01T10 \
+        --where action=REJECT --group-by dstaddr,dstport
+
+Reading Parquet needs pyarrow: pip install pyarrow.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+import boto3
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# flow log fields summed by the queries, all other fields can be grouped by
+METRICS = ["packets", "bytes"]
+DEFAULT_PREFIX = "flow-logs"
+
+_s3_client = None
+
+
+def s3_client():
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client("s3")
+    return _s3_client
+
+
+def parse_hour(value: str) -> datetime.datetime:
+    """The hour of an iso time as a naive UTC time, the time zone of the
+    partitions. A time without an offset is taken as UTC"""
+    hour = datetime.datetime.fromisoformat(value)
+    if hour.tzinfo:
+        hour = hour.astimezone(datetime.timezone.utc)
+    return hour.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def hours(
+    start: datetime.datetime, end: datetime.datetime
+) -> Iterator[datetime.datetime]:
+    hour = start
+    while hour <= end:
+        yield hour
+        hour += datetime.timedelta(hours=1)
+
+
+def partition_prefix(
+    prefix: str, account_id: str, region: str, hour: datetime.datetime
+) -> str:
+    """Key prefix of one hour of hive compatible, per hour partitions"""
+    return (
+        f"{prefix.strip('/')}/AWSLogs/aws-account-id={account_id}/"
+        f"aws-service=vpcflowlogs/aws-region={region}/"
+        f"year={hour:%Y}/month={hour:%m}/day={hour:%d}/hour={hour:%H}/"
+    )
+
+
+def list_partition_keys(bucket: str, partition: str) -> List[str]:
+    keys = []
+    paginator = s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=partition):
+        keys += [
+            item["Key"]
+            for item in page.get("Contents", [])
+            if item["Key"].endswith(".parquet")
+        ]
+    return keys
+
+
+def parse_where(conditions: List[str]) -> List[Tuple[str, str, str]]:
+    """Turns field=value and field!=value into (field, operator, value)"""
+    filters = []
+    for condition in conditions:
+        operator = "!=" if "!=" in condition else "="
+        field, value = condition.split(operator, 1)
+        filters.append((field, operator, value))
+    return filters
+
+
+def read_records(
+    bucket: str, key: str, columns: List[str], filters: List[Tuple[str, str, str]]
+) -> List[Dict]:
+    import pyarrow.parquet as pq
+
+    body = s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+    table = pq.read_table(io.BytesIO(body), columns=columns)
+    records = table.to_pylist()
+    # values are compared as strings, ports and protocols are integers
+    return [
+        record
+        for record in records
+        if all(
+            (str(record[field]) == value) == (operator == "=")
+            for field, operator, value in filters
+        )
+    ]
+
+
+def query(
+    bucket: str,
+    account_id: str,
+    region: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    group_by: List[str],
+    where: Optional[List[str]] = None,
+    prefix: str = DEFAULT_PREFIX,
+) -> List[Dict]:
+    """Sums packets and bytes of the flow log records between start and end
+    by the group_by fields
+
+    Returns:
+        rows (list): one dict per group, largest byte count first
+    """
+    filters = parse_where(where or [])
+    columns = sorted(set(group_by + METRICS + [field for field, _, _ in filters]))
+    groups: Dict[Tuple, Dict] = {}
+    files = 0
+    for hour in hours(start, end):
+        partition = partition_prefix(prefix, account_id, region, hour)
+        for key in list_partition_keys(bucket, partition):
+            files += 1
+            for record in read_records(bucket, key, columns, filters):
+                group = tuple(record[field] for field in group_by)
+                row = groups.setdefault(
+                    group,
+                    {
+                        **dict(zip(group_by, group)),
+                        "records": 0,
+                        **{metric: 0 for metric in METRICS},
+                    },
+                )
+                row["records"] += 1
+                for metric in METRICS:
+                    row[metric] += record[metric] or 0
+    logger.info({"status": "queried flow logs", "files": files, "groups": len(groups)})
+    return sorted(groups.values(), key=lambda row: row["bytes"], reverse=True)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", required=True, help="flow log bucket")
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX, help="flow log key prefix")
+    parser.add_argument("--account-id", help="defaults to the caller's account")
+    parser.add_argument("--region", help="defaults to the session's region")
+    parser.add_argument("--start", required=True, help="first hour, e.g. 2024-01-01T08")
+    parser.add_argument("--end", help="last hour, defaults to --start")
+    parser.add_argument(
+        "--group-by",
+        default="srcaddr,dstaddr,dstport,action",
+        help="comma separated flow log fields",
+    )
+    parser.add_argument(
+        "--where",
+        action="append",
+        default=[],
+        help="field=value or field!=value, can be repeated",
+    )
+    parser.add_argument("--limit", type=int, default=20, help="number of rows")
+    args = parser.parse_args(argv)
+
+    account_id = args.account_id or boto3.client("sts").get_caller_identity()["Account"]
+    region = args.region or s3_client().meta.region_name
+    start = parse_hour(args.start)
+    rows = query(
+        args.bucket,
+        account_id,
+        region,
+        start,
+        parse_hour(args.end) if args.end else start,
+        args.group_by.split(","),
+        args.where,
+        args.prefix,
+    )
+    for row in rows[: args.limit]:
+        sys.stdout.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()